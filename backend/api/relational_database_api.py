@@ -13,10 +13,11 @@ from models import (
     UserRelationalDatabase,
 )
 from api.utils import get_user_object_general
-from utilities.config import config
+from utilities.config import cache, config
 from utilities.database import (
     UserDatabaseControl,
     get_schema_from_sql,
+    close_connection_pool,
     get_schema_from_table,
     create_relational_database_table,
 )
@@ -88,8 +89,11 @@ class RelationalDatabaseAPI:
         if not database.database_path:
             return {"status": 404, "msg": "database file not found", "data": {}}
         database_path = Path(database.database_path)
-        if database_path.exists():
-            database_path.unlink()
+        close_connection_pool(database_path)
+        # WAL 模式下还有 -wal 和 -shm 文件 / WAL mode also keeps -wal and -shm files
+        for path in (database_path, Path(f"{database_path}-wal"), Path(f"{database_path}-shm")):
+            if path.exists():
+                path.unlink()
 
         database.delete_instance(recursive=True)
         return {"status": 200, "msg": "success", "data": {}}
@@ -202,6 +206,10 @@ class RelationalDatabaseTableAPI:
         user_tables = user_tables.order_by(sort_field_obj).offset(offset).limit(limit)
         user_tables_list = model_serializer(user_tables, many=True)
 
+        for user_table in user_tables_list:
+            if user_table["status"] == Status.PROCESSING:
+                user_table["progress"] = cache.get(f"relational-table-import-progress:{user_table['tid']}")
+
         response = {
             "status": 200,
             "msg": "success",
@@ -7,7 +7,7 @@ from pathlib import Path
 
 from utilities.general import mprint_with_name
 from utilities.config import Settings, cache
-from utilities.network import new_httpx_client
+from utilities.network import get_httpx_client
 from .utils import JResponse
 
 
@@ -18,7 +18,7 @@ headers = {"user-agent": "vector-vein client"}
 
 def request(method: str, path: str, payload=None):
     settings = Settings()
-    client = new_httpx_client(is_async=False)
+    client = get_httpx_client(is_async=False)
     url = f"https://{settings.website_domain}{path}"
     try_times = 0
     while try_times < 3:
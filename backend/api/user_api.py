@@ -17,6 +17,7 @@ from models import Setting, Conversation, Agent, model_serializer
 from utilities.general import LogServer
 from tts_server.server import tts_server
 from utilities.media_processing import Microphone
+from utilities.network import reset_httpx_clients
 from utilities.shortcuts import shortcuts_listener
 from utilities.media_processing import get_screenshot
 from utilities.file_processing.files import read_file_content
@@ -235,6 +236,8 @@ class SettingAPI:
         normalize_embedding_backends(setting_data)
         setting.data = setting_data
         setting.save()
+        # 代理和 SSL 设置可能变化 / Proxy and SSL settings may have changed
+        reset_httpx_clients()
         config.save("data_path", setting.data.get("data_path", "./data"))
         
         # Save API settings
@@ -134,7 +134,8 @@ def run_workflow_common(
     workflow_version: str | int | None = None,
 ) -> str:
     from celery_tasks import run_workflow
-    
+    from utilities.workflow.cancel import register_celery_tasks
+
     workflow_data["wid"] = workflow.wid.hex
 
     source_message = message.mid.hex if message is not None else None
@@ -161,6 +162,7 @@ def run_workflow_common(
     try:
         async_res = run_workflow.delay(workflow_data)
         mprint(f"Queued workflow.run rid={record.rid.hex} task_id={getattr(async_res, 'id', 'unknown')}")
+        register_celery_tasks(record.rid.hex, [async_res.id])
     except Exception as e:
         mprint.error(f"Failed to enqueue workflow task: {e}")
         raise
@@ -168,6 +170,49 @@ def run_workflow_common(
     return record.rid.hex
 
 
+def stop_workflow_common(record_id: str) -> bool:
+    """
+    停止一次工作流运行：设置取消标记，撤销还在排队的 Celery 任务，停止子工作流，
+    并把运行记录标记为失败。正在运行的节点会在下一个检查点退出。
+
+    Stop a workflow run: set the cancel flag, revoke queued Celery tasks, stop sub-workflow
+    runs and mark the run record as failed. Running nodes exit at their next check point.
+
+    Returns:
+        bool: 运行已经被停止过时返回 False / False if the run was already stopped.
+    """
+    from celery_worker import app
+    from utilities.workflow.cancel import CANCELLED_ERROR_TASK, forget_cancelled_run, request_cancel, get_child_runs, get_celery_tasks
+    from utilities.workflow.run_events import workflow_run_events
+
+    if not request_cancel(record_id):
+        return False
+
+    task_ids = get_celery_tasks(record_id)
+    if task_ids:
+        try:
+            app.control.revoke(task_ids)
+        except Exception as e:
+            # SQLite broker 不一定支持广播，节点开始前的取消检查仍然会跳过这些任务
+            # The SQLite broker may not support broadcast, the check before each node still skips them
+            mprint.error(f"Failed to revoke tasks of workflow run {record_id}: {e}")
+
+    for child_record_id in get_child_runs(record_id):
+        stop_workflow_common(child_record_id)
+
+    record = WorkflowRunRecord.get_or_none(WorkflowRunRecord.rid == record_id)
+    if record is not None and record.status in ("RUNNING", "QUEUED"):
+        record.status = "FAILED"
+        record.error_task = CANCELLED_ERROR_TASK
+        record.end_time = datetime.now()
+        record.save()
+    cache.set(f"workflow:record:{record_id}", 500, 60 * 60)
+    workflow_run_events.publish(record_id, 500)
+    forget_cancelled_run(record_id)
+    mprint(f"Stopped workflow run {record_id}")
+    return True
+
+
 class JResponse(dict):
     def __init__(self, status=200, data=None, msg="", **kwargs):
         if data is None:
@@ -17,10 +17,11 @@ from api.utils import get_user_object_general, JResponse
 from utilities.config import cache, Settings
 from utilities.text_processing import split_text
 from utilities.network import crawl_text_from_url
-from utilities.file_processing import get_files_contents
-from background_task.qdrant_tasks import search_points_sync
+from background_task.qdrant_tasks import chunk_hash, segment_chunk_hashes, hybrid_search_batch_sync
+from background_task.keyword_index import keyword_indexes
 from celery_tasks import (
     embedding_and_upload,
+    ingest_files,
     delete_point,
     create_collection,
     delete_collection,
@@ -168,9 +169,20 @@ class DatabaseAPI:
         vid = payload.get("vid")
         query = payload.get("query", "")
         limit = int(payload.get("limit", 10))
+        search_mode = payload.get("search_mode", "vector")
+        rerank_provider = payload.get("rerank_provider", "")
+        rerank_model = payload.get("rerank_model", "")
 
         if not vid or not query:
             return JResponse(status=400, msg="vid and query are required")
+        # query 可以是单个字符串或字符串列表，与工作流搜索节点一致
+        # query may be a string or a list of strings, like the workflow search node
+        if isinstance(query, str):
+            queries = [query]
+        elif isinstance(query, list) and all(isinstance(item, str) for item in query):
+            queries = query
+        else:
+            return JResponse(status=400, msg="query must be a string or a list of strings")
 
         status, msg, database = get_user_object_general(
             UserVectorDatabase,
@@ -180,22 +192,35 @@ class DatabaseAPI:
             return JResponse(status=status, msg=msg)
 
         try:
-            from utilities.ai_utils import EmbeddingClient
+            from utilities.ai_utils import EmbeddingClient, RerankClient
 
-            embedding_client = EmbeddingClient(
-                provider=database.embedding_provider,
-                model_id=database.embedding_model,
-            )
-            text_embedding = embedding_client.get(query)
-            results = search_points_sync(
+            text_embeddings = None
+            if search_mode != "keyword":
+                embedding_client = EmbeddingClient(
+                    provider=database.embedding_provider,
+                    model_id=database.embedding_model,
+                )
+                text_embeddings = embedding_client.get(queries)
+            reranker = RerankClient(provider=rerank_provider, model_id=rerank_model) if rerank_provider else None
+            results = hybrid_search_batch_sync(
                 vid=_hex_attr(database, "vid"),
-                text_embedding=text_embedding,
+                queries=queries,
+                text_embeddings=text_embeddings,
                 limit=limit,
+                search_mode=search_mode,
+                reranker=reranker,
             )
-            return JResponse(data={"results": results or []})
+            return JResponse(data={"results": results if isinstance(query, list) else results[0]})
         except Exception as e:
             return JResponse(status=500, msg=str(e))
 
+    def embedding_cache_stats(self, payload):
+        from utilities.ai_utils import embedding_cache
+
+        if payload.get("reset"):
+            embedding_cache.clear()
+        return JResponse(data=embedding_cache.stats())
+
 
 class DatabaseObjectAPI:
     name = "database_object"
@@ -208,7 +233,9 @@ class DatabaseObjectAPI:
         if status != 200 or user_object is None:
             return JResponse(status=status, msg=msg)
 
-        return JResponse(data=model_serializer(user_object))
+        data = model_serializer(user_object)
+        data["raw_data"] = user_object.load_raw_data()
+        return JResponse(data=data)
 
     def create(self, payload):
         title = payload.get("title", "")
@@ -220,6 +247,15 @@ class DatabaseObjectAPI:
 
         vector_database: UserVectorDatabase = UserVectorDatabase.get(vid=payload.get("vid"))
         object_oids = []
+        # 同一来源再次添加时更新原有对象，只重新嵌入有变化的分块
+        # Adding the same source again updates the existing object and only re-embeds the chunks that changed
+        previous_segments: dict[str, list] = {}
+        # 上一次索引结束时的状态，只有完成索引（VA）的对象才能按分块增量更新
+        # Status the previous indexing ended with, only fully indexed (VA) objects can be updated chunk by chunk
+        previous_statuses: dict[str, str] = {}
+        # 完整的 raw_data，处理完后连同分段一起写入内容表
+        # Full raw_data, written to the content table together with the segments at the end
+        raw_datas: dict[str, dict] = {}
         if add_method == "files":
             for file in files:
                 file_name = Path(file).name
@@ -229,20 +265,35 @@ class DatabaseObjectAPI:
                     data_type=payload.get("data_type", "TEXT"),
                     vector_database=vector_database,
                     source_url="",
-                    raw_data={"text": "", "file": file},
+                    raw_data={"file": file},
                     status="PR",
                 )
                 object_oids.append(user_object.oid)
         else:
-            user_object = UserObject.create(
-                title=title,
-                info=payload.get("info", {}),
-                data_type=payload.get("data_type", "TEXT"),
-                vector_database=vector_database,
-                source_url=source_url,
-                raw_data={"text": content},
-                status="PR",
-            )
+            user_object = None
+            if source_url:
+                user_object = UserObject.get_or_none(UserObject.vector_database == vector_database, UserObject.source_url == source_url)
+            if user_object is None:
+                user_object = UserObject.create(
+                    title=title,
+                    info=payload.get("info", {}),
+                    data_type=payload.get("data_type", "TEXT"),
+                    vector_database=vector_database,
+                    source_url=source_url,
+                    raw_data={},
+                    status="PR",
+                )
+            else:
+                previous_segments[_hex_attr(user_object, "oid")] = user_object.load_raw_data().get("segments") or []
+                previous_statuses[_hex_attr(user_object, "oid")] = user_object.status
+                user_object.title = title
+                user_object.info = payload.get("info", {})
+                user_object.data_type = payload.get("data_type", "TEXT")
+                user_object.raw_data = {}
+                user_object.status = "PR"
+                user_object.update_time = datetime.now()
+                user_object.save()
+            raw_datas[_hex_attr(user_object, "oid")] = {"text": content}
             object_oids.append(user_object.oid)
 
         user_objects = []
@@ -250,24 +301,46 @@ class DatabaseObjectAPI:
             user_object = UserObject.get(oid=object_oids[0])
             result = crawl_text_from_url(user_object.source_url)
             user_object.title = result["title"]
-            user_object.raw_data = result
-            user_object.save()
+            raw_datas[_hex_attr(user_object, "oid")] = result
             user_objects.append(user_object)
         elif add_method == "text":
             user_object = UserObject.get(oid=object_oids[0])
             user_objects.append(user_object)
         elif add_method == "files":
-            for user_object_oid in object_oids:
-                user_object = UserObject.get(oid=user_object_oid)
-                result = get_files_contents([user_object.raw_data["file"]])[0]
-                user_object.raw_data["text"] = result
-                user_object.save()
-                user_objects.append(user_object)
+            # 文件在后台进程池中解析、分段，请求立即返回，进度按对象写入缓存
+            # Files are parsed and split in a background process pool, the request returns
+            # immediately and progress is cached per object
+            ingest_files.delay(
+                vid=_hex_attr(vector_database, "vid"),
+                object_ids=[oid.hex for oid in object_oids],
+                process_rules=process_rules,
+            )
+            user_objects = [UserObject.get(oid=user_object_oid) for user_object_oid in object_oids]
+            return JResponse(data=model_serializer(user_objects, many=True))
 
         for user_object in user_objects:
-            raw_data = user_object.raw_data if isinstance(user_object.raw_data, dict) else {}
+            raw_data = raw_datas[_hex_attr(user_object, "oid")]
             paragraphs = split_text(str(raw_data.get("text", "")), process_rules)
             segment_dicts = [paragraph for paragraph in paragraphs if isinstance(paragraph, dict)]
+            for segment in segment_dicts:
+                segment["hash"] = chunk_hash(str(segment.get("text", "")))
+            object_previous_status = previous_statuses.get(_hex_attr(user_object, "oid"))
+            # 上一次索引失败或被中断时，之前的分块不一定写入了 Qdrant，整体重建
+            # When the previous indexing failed or was interrupted its chunks may be missing from Qdrant, rebuild them all
+            previous_chunk_hashes = None
+            if object_previous_status == "VA":
+                previous_chunk_hashes = segment_chunk_hashes(previous_segments.get(_hex_attr(user_object, "oid"), []))
+
+            object_info = user_object.info if isinstance(user_object.info, dict) else {}
+            object_info["word_counts"] = sum(int(paragraph.get("word_counts", 0)) for paragraph in segment_dicts)
+            object_info["paragraph_counts"] = len(segment_dicts)
+            object_info["process_rules"] = process_rules
+            user_object.info = object_info
+            raw_data["segments"] = segment_dicts
+            user_object.save_raw_data(raw_data)
+
+            # 先保存对象再派发任务，任务标记的 VA 状态不会被这里的保存覆盖
+            # Save the object before queueing the task so this save cannot overwrite the VA status the task sets
             embedding_and_upload.delay(
                 vid=_hex_attr(vector_database, "vid"),
                 object_id=_hex_attr(user_object, "oid"),
@@ -276,21 +349,12 @@ class DatabaseObjectAPI:
                 embedding_model=vector_database.embedding_model,
                 embedding_dimensions=vector_database.embedding_size,
                 embedding_type=user_object.data_type.lower(),
+                previous_chunk_hashes=previous_chunk_hashes,
+                replace_existing=object_previous_status is not None and previous_chunk_hashes is None,
             )
 
-            object_info = user_object.info if isinstance(user_object.info, dict) else {}
-            object_info["word_counts"] = sum(int(paragraph.get("word_counts", 0)) for paragraph in segment_dicts)
-            object_info["paragraph_counts"] = len(segment_dicts)
-            object_info["process_rules"] = process_rules
-            user_object.info = object_info
-            raw_data["segments"] = segment_dicts
-            user_object.raw_data = raw_data
-            user_object.save()
-
-        if add_method == "files":
-            return JResponse(data=model_serializer(user_objects, many=True))
-        else:
-            return JResponse(data=model_serializer(user_objects[0]))
+        keyword_indexes.invalidate(_hex_attr(vector_database, "vid"))
+        return JResponse(data=model_serializer(user_objects[0]))
 
     def list(self, payload):
         page_num = int(payload.get("page", 1))
@@ -349,9 +413,11 @@ class DatabaseObjectAPI:
         )
         if status != 200 or user_object is None:
             return JResponse(status=status, msg=msg)
+        vid = _hex_attr(user_object.vector_database, "vid")
         delete_point.delay(
-            vid=_hex_attr(user_object.vector_database, "vid"),
+            vid=vid,
             object_id=_hex_attr(user_object, "oid"),
         )
         user_object.delete_instance(recursive=True)
+        keyword_indexes.invalidate(vid)
         return JResponse()
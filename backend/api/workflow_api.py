@@ -19,6 +19,7 @@ from models import (
 from api.utils import (
     JResponse,
     run_workflow_common,
+    stop_workflow_common,
     get_user_object_general,
 )
 from utilities.config import cache
@@ -302,6 +303,7 @@ class WorkflowAPI:
         else:
             workflow_serializer_data = model_serializer(record.workflow, manytomany=True)
             workflow_serializer_data["data"] = record.data
+            workflow_serializer_data["error_task"] = record.error_task
             response = {"status": 500, "msg": record.status, "data": workflow_serializer_data}
             cache.set(f"workflow:record:{rid}", 500, 60 * 60)
         return JResponse(**response)
@@ -414,8 +416,21 @@ class WorkflowRunRecordAPI:
             return JResponse(status=status, msg=msg)
 
         record = model_serializer(record, manytomany=True)
+        # 追踪数据可能很大，通过 trace 接口单独获取
+        # The trace can be large, it is fetched separately through the trace action
+        record.pop("trace", None)
         return JResponse(data=record)
 
+    def trace(self, payload):
+        status, msg, record = get_user_object_general(
+            WorkflowRunRecord,
+            rid=payload.get("rid", None),
+        )
+        if status != 200 or not isinstance(record, WorkflowRunRecord):
+            return JResponse(status=status, msg=msg)
+
+        return JResponse(data=record.trace or {})
+
     def list(self, payload):
         page_num = payload.get("page", 1)
         page_size = min(payload.get("page_size", 10), 100)
@@ -443,6 +458,8 @@ class WorkflowRunRecordAPI:
         limit = page_size
         records = records.offset(offset).limit(limit)
         records_list = model_serializer(records, many=True, manytomany=True)
+        for record in records_list:
+            record.pop("trace", None)
 
         if need_workflow:
             for record in records_list:
@@ -469,6 +486,19 @@ class WorkflowRunRecordAPI:
         record.delete_instance()
         return JResponse()
 
+    def stop(self, payload):
+        status, msg, record = get_user_object_general(
+            WorkflowRunRecord,
+            rid=payload.get("rid", None),
+        )
+        if status != 200 or not isinstance(record, WorkflowRunRecord):
+            return JResponse(status=status, msg=msg)
+        if record.status not in ("RUNNING", "QUEUED"):
+            return JResponse(status=400, msg="workflow run is not running")
+
+        stop_workflow_common(record.rid.hex)
+        return JResponse(data={"rid": record.rid.hex})
+
     def rerun(self, payload):
         status, msg, record = get_user_object_general(
             WorkflowRunRecord,
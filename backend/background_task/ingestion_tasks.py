@@ -0,0 +1,146 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+文件导入流水线：解析 → 分段 → 嵌入 → 写入。
+
+解析 PDF、Office 文件和分段是 CPU 密集的工作，在进程池中并行执行；同时在途的文档数量
+限制在一个窗口内，内存占用不随文件数量增长。每个文档解析完成后立即保存并交给
+embedding_and_upload 按批嵌入写入，进度按对象写入缓存。
+
+File ingestion pipeline: parse → split → embed → upsert.
+
+Parsing PDF and Office files and splitting them is CPU heavy and runs in parallel in a
+process pool. The number of documents in flight is bounded by a window so memory does not
+grow with the number of files. Each document is saved as soon as it is parsed and handed to
+embedding_and_upload, which embeds and upserts it in batches. Progress is cached per object.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from celery_worker import app, timer
+from models import UserObject, UserVectorDatabase
+from utilities.config import Settings
+from utilities.general import mprint_with_name
+from utilities.text_processing import read_and_split_file
+from background_task.qdrant_tasks import embedding_and_upload, set_object_progress
+from background_task.keyword_index import keyword_indexes
+
+
+mprint = mprint_with_name(name="Ingestion Tasks")
+
+# 每个解析进程最多同时排队的文档数
+# Documents in flight per parsing process
+DOCUMENTS_PER_PROCESS = 2
+
+_INGESTION_POOL: ProcessPoolExecutor | None = None
+_INGESTION_POOL_SIZE = 0
+_INGESTION_POOL_LOCK = threading.Lock()
+
+
+def get_ingestion_pool() -> tuple[ProcessPoolExecutor, int]:
+    """Return the shared file parsing process pool and its size."""
+    global _INGESTION_POOL, _INGESTION_POOL_SIZE
+
+    with _INGESTION_POOL_LOCK:
+        if _INGESTION_POOL is None:
+            processes = Settings().get("vector_database.ingestion_processes", 0) or min(4, os.cpu_count() or 1)
+            # 用 spawn 启动子进程，不从多线程的 worker 进程 fork 出持有锁的副本
+            # Spawn the children so they are not forked from a multithreaded worker holding locks
+            _INGESTION_POOL = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+            _INGESTION_POOL_SIZE = processes
+        return _INGESTION_POOL, _INGESTION_POOL_SIZE
+
+
+def discard_ingestion_pool(pool: ProcessPoolExecutor):
+    """
+    丢弃已损坏的进程池，下次调用 get_ingestion_pool 时重新创建。
+    Drop a broken pool so the next get_ingestion_pool call creates a new one.
+    """
+    global _INGESTION_POOL
+
+    with _INGESTION_POOL_LOCK:
+        if _INGESTION_POOL is pool:
+            _INGESTION_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def close_ingestion_pool():
+    global _INGESTION_POOL
+
+    with _INGESTION_POOL_LOCK:
+        if _INGESTION_POOL is not None:
+            _INGESTION_POOL.shutdown(wait=False, cancel_futures=True)
+            _INGESTION_POOL = None
+
+
+def _save_parsed_object(vector_database: UserVectorDatabase, user_object: UserObject, text: str, segments: list, process_rules: dict):
+    vid = vector_database.vid.hex
+    object_id = user_object.oid.hex
+    object_info = user_object.info if isinstance(user_object.info, dict) else {}
+    object_info["word_counts"] = sum(int(segment.get("word_counts", 0)) for segment in segments)
+    object_info["paragraph_counts"] = len(segments)
+    object_info["process_rules"] = process_rules
+    user_object.info = object_info
+    user_object.save_raw_data({**user_object.raw_data, "text": text, "segments": segments})
+
+    set_object_progress(vid, object_id, chunk_count=len(segments))
+    embedding_and_upload.delay(
+        vid=vid,
+        object_id=object_id,
+        input=[str(segment.get("text", "")) for segment in segments],
+        embedding_provider=vector_database.embedding_provider,
+        embedding_model=vector_database.embedding_model,
+        embedding_dimensions=vector_database.embedding_size,
+        embedding_type=user_object.data_type.lower(),
+    )
+
+
+@app.task(bind=True)
+@timer
+def ingest_files(self, vid: str, object_ids: list[str], process_rules: dict):
+    """Parse and split the files of the given objects in the process pool, then queue their embedding"""
+    vector_database: UserVectorDatabase = UserVectorDatabase.get(vid=vid)
+    pool, processes = get_ingestion_pool()
+    window = processes * DOCUMENTS_PER_PROCESS
+
+    queued = list(object_ids)
+    pending: dict[Future, UserObject] = {}
+    while queued or pending:
+        while queued and len(pending) < window:
+            object_id = queued.pop(0)
+            user_object: UserObject | None = UserObject.get_or_none(UserObject.oid == object_id)
+            if user_object is None:
+                # 对象在排队期间被删除时跳过，不中断其余文件
+                # Skip objects deleted while queued instead of failing the remaining files
+                mprint.warning(f"Object {object_id} no longer exists, skipped")
+                continue
+            set_object_progress(vid, user_object.oid.hex, stage="parsing")
+            try:
+                future = pool.submit(read_and_split_file, user_object.raw_data["file"], process_rules)
+            except BrokenProcessPool:
+                # 解析进程崩溃（内存不足或异常文件）后进程池不可用，换新的进程池继续处理其余文件
+                # A crashed parser (out of memory or a malformed file) breaks the pool, continue on a new one
+                mprint.warning("Ingestion process pool is broken, recreating it")
+                discard_ingestion_pool(pool)
+                pool, _ = get_ingestion_pool()
+                future = pool.submit(read_and_split_file, user_object.raw_data["file"], process_rules)
+            pending[future] = user_object
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            user_object = pending.pop(future)
+            try:
+                text, segments = future.result()
+                _save_parsed_object(vector_database, user_object, text, segments, process_rules)
+            except Exception as e:
+                mprint.error(f"Failed to ingest file {user_object.raw_data.get('file')}: {e}")
+                user_object.status = "IN"
+                user_object.save()
+
+    keyword_indexes.invalidate(vid)
+    mprint(f"Parsed {len(object_ids)} files for collection {vid}")
+    return True
@@ -0,0 +1,86 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+每个向量数据库集合对应的 BM25 关键词索引。
+
+索引由集合中对象的分段（UserObjectContent）在进程内构建，第一次检索时建立；对象写入、
+删除或集合重建时标记失效，下次检索时重新构建。
+
+BM25 keyword index alongside each vector database collection.
+
+The index is built in process from the segments (UserObjectContent) of the collection's
+objects on the first search. Writing or deleting objects and recreating the collection
+invalidates it and the next search rebuilds it.
+"""
+
+import uuid
+import threading
+
+from models import UserObject, UserObjectContent, UserVectorDatabase
+from utilities.general import mprint_with_name
+from utilities.text_processing.bm25 import BM25Index
+
+
+mprint = mprint_with_name(name="Keyword Index")
+
+
+def _segment_text(segment) -> str:
+    return str(segment.get("text", "")) if isinstance(segment, dict) else str(segment)
+
+
+def _index_key(vid: str) -> str:
+    try:
+        return uuid.UUID(str(vid)).hex
+    except ValueError:
+        return str(vid)
+
+
+def build_keyword_index(vid: str) -> BM25Index:
+    index = BM25Index()
+    contents = (
+        UserObjectContent.select(UserObjectContent.data, UserObject.oid)
+        .join(UserObject)
+        .join(UserVectorDatabase)
+        .where(UserVectorDatabase.vid == vid, UserObject.status != "IN")
+    )
+    for content in contents:
+        data = content.data if isinstance(content.data, dict) else {}
+        object_id = content.user_object.oid.hex
+        for chunk_index, segment in enumerate(data.get("segments") or []):
+            text = _segment_text(segment)
+            if text:
+                index.add(text, {"object_id": object_id, "text": text, "chunk_index": chunk_index})
+    return index
+
+
+class KeywordIndexRegistry:
+    def __init__(self):
+        self._indexes: dict[str, BM25Index] = {}
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, vid: str) -> BM25Index:
+        key = _index_key(vid)
+        with self._lock:
+            index = self._indexes.get(key)
+            version = self._versions.get(key, 0)
+        if index is not None:
+            return index
+
+        index = build_keyword_index(vid)
+        mprint.debug(f"Built keyword index for collection {vid} with {len(index)} segments")
+        with self._lock:
+            # 构建期间索引被标记失效时不保存，下次检索重新构建
+            # Do not keep the index when it was invalidated while building, the next search rebuilds it
+            if self._versions.get(key, 0) == version:
+                self._indexes[key] = index
+        return index
+
+    def invalidate(self, vid: str):
+        key = _index_key(vid)
+        with self._lock:
+            self._indexes.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+
+keyword_indexes = KeywordIndexRegistry()
@@ -4,37 +4,68 @@
 # Qdrant-specific Celery tasks
 
 import uuid
+from collections import Counter
 from pathlib import Path
-from threading import Lock, RLock
+from threading import Lock
+from contextlib import contextmanager
+from typing import Iterator
 
+from celery.exceptions import MaxRetriesExceededError
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import (
     Filter,
     Distance,
     MatchValue,
     PointStruct,
+    SetPayload,
+    PointIdsList,
+    SetPayloadOperation,
     VectorParams,
     FilterSelector,
+    QueryRequest,
     FieldCondition,
 )
 
 from celery_worker import app, timer
 from models import UserObject
 from utilities.general import mprint_with_name
-from utilities.config import config, cache
-from utilities.ai_utils import EmbeddingClient
+from utilities.general.rwlock import KeyedReadWriteLocks, ReadWriteLock
+from utilities.config import Settings, config, cache
+from utilities.ai_utils import EmbeddingClient, RerankClient
+from utilities.ai_utils.embeddings import split_embedding_batches
+from utilities.text_processing import chunk_hash
+from utilities.text_processing.bm25 import reciprocal_rank_fusion
+from background_task.keyword_index import keyword_indexes
 
 mprint = mprint_with_name(name="Qdrant Tasks")
 
 _QDRANT_CLIENT: QdrantClient | None = None
 _QDRANT_CLIENT_INIT_LOCK = Lock()
-_QDRANT_OPERATION_LOCK = RLock()
+# 创建和删除集合会修改客户端的集合表，独占整个客户端；其余操作只锁自己的集合，
+# 同一集合内查询可以并发，写入独占，不同集合之间互不阻塞。
+# Creating and deleting collections changes the client's collection table and holds the whole
+# client exclusively. Other operations only lock their own collection: searches in a collection
+# run concurrently, writes are exclusive, and different collections never block each other.
+_QDRANT_COLLECTIONS_LOCK = ReadWriteLock()
+_QDRANT_COLLECTION_LOCKS = KeyedReadWriteLocks()
 
 
 def _collection_name(vid: str) -> str:
     return f"{vid}_text_collection"
 
 
+@contextmanager
+def _collection_read(vid: str) -> Iterator[None]:
+    with _QDRANT_COLLECTIONS_LOCK.read(), _QDRANT_COLLECTION_LOCKS.read(_collection_name(vid)):
+        yield
+
+
+@contextmanager
+def _collection_write(vid: str) -> Iterator[None]:
+    with _QDRANT_COLLECTIONS_LOCK.read(), _QDRANT_COLLECTION_LOCKS.write(_collection_name(vid)):
+        yield
+
+
 def get_qdrant_client():
     """Return a shared local Qdrant client for the desktop process."""
     global _QDRANT_CLIENT
@@ -68,7 +99,7 @@ def close_qdrant_client():
 
 def search_points_sync(vid: str, text_embedding: list, limit: int = 5) -> list[dict]:
     """Search Qdrant synchronously for callers that already run on a worker thread."""
-    with _QDRANT_OPERATION_LOCK:
+    with _collection_read(vid):
         client = get_qdrant_client()
         response = client.query_points(
             collection_name=_collection_name(vid),
@@ -81,13 +112,196 @@ def search_points_sync(vid: str, text_embedding: list, limit: int = 5) -> list[d
     return [point.payload for point in response.points]
 
 
+def search_points_batch_sync(vid: str, text_embeddings: list[list[float]], limit: int = 5) -> list[list[dict]]:
+    """
+    一次 Qdrant 调用完成多个查询，按查询顺序返回每个查询的结果。
+    Run several queries with one Qdrant call and return the results of each query in order.
+    """
+    if not text_embeddings:
+        return []
+
+    with _collection_read(vid):
+        client = get_qdrant_client()
+        responses = client.query_batch_points(
+            collection_name=_collection_name(vid),
+            requests=[
+                QueryRequest(query=text_embedding, limit=limit, with_payload=True, with_vector=False)
+                for text_embedding in text_embeddings
+            ],
+        )
+
+    return [[point.payload for point in response.points] for response in responses]
+
+
+SEARCH_MODES = ("vector", "keyword", "hybrid")
+
+# 融合或重排时每种检索取回 limit 的这个倍数作为候选
+# Each retriever fetches this multiple of limit as candidates for fusion or reranking
+CANDIDATE_FACTOR = 4
+
+
+def _result_key(payload: dict) -> tuple:
+    return payload.get("object_id"), payload.get("text")
+
+
+def hybrid_search_batch_sync(
+    vid: str,
+    queries: list[str],
+    text_embeddings: list[list[float]] | None,
+    limit: int = 5,
+    search_mode: str = "vector",
+    reranker: RerankClient | None = None,
+) -> list[list[dict]]:
+    """
+    向量检索和 BM25 关键词检索按倒数排名融合，可选再用重排模型排序，按查询顺序返回结果。
+    keyword 模式不需要 text_embeddings。
+    Fuse vector search and BM25 keyword search by reciprocal rank, optionally reorder with a
+    rerank model, and return the results of each query in order. text_embeddings is not
+    needed in keyword mode.
+    """
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"Unsupported search_mode: {search_mode}")
+
+    fetch_limit = limit * CANDIDATE_FACTOR if search_mode == "hybrid" or reranker is not None else limit
+    if search_mode == "keyword":
+        vector_results: list[list[dict]] = [[] for _ in queries]
+    else:
+        vector_results = search_points_batch_sync(vid, text_embeddings or [], limit=fetch_limit)
+    keyword_index = keyword_indexes.get(vid) if search_mode != "vector" else None
+
+    results = []
+    for query, vector_payloads in zip(queries, vector_results):
+        rankings = [[(_result_key(payload), payload) for payload in vector_payloads]]
+        if keyword_index is not None:
+            rankings.append([(_result_key(payload), payload) for payload, _score in keyword_index.search(query, fetch_limit)])
+        candidates = reciprocal_rank_fusion(rankings, fetch_limit)
+
+        if reranker is not None and len(candidates) > 1:
+            order = reranker.rank(query, [str(candidate.get("text") or "") for candidate in candidates], top_n=limit)
+            candidates = [candidates[index] for index in order]
+        results.append(candidates[:limit])
+    return results
+
+
+def segment_chunk_hashes(segments: list) -> list[str] | None:
+    """
+    返回已保存分段的内容哈希，旧数据中没有哈希时返回 None。
+    Return the content hashes of stored segments, None for old data saved without hashes.
+    """
+    if not all(isinstance(segment, dict) and segment.get("hash") for segment in segments):
+        return None
+    return [segment["hash"] for segment in segments]
+
+
+def chunk_point_ids(object_id: str, chunk_hashes: list[str]) -> list[str]:
+    """
+    点 ID 由对象和分块内容决定，内容不变的分块在重新索引时保持同一个点；同一对象中重复的
+    分块按出现次序区分。任务重试时重复写入也是幂等的。
+    Point ids are derived from the object and the chunk content, so an unchanged chunk keeps
+    its point when the object is reindexed. Repeated chunks in one object are told apart by
+    their occurrence. Upserts repeated by task retries are idempotent as well.
+    """
+    occurrences: Counter[str] = Counter()
+    point_ids = []
+    for content_hash in chunk_hashes:
+        point_ids.append(uuid.uuid5(uuid.NAMESPACE_URL, f"{object_id}:{content_hash}:{occurrences[content_hash]}").hex)
+        occurrences[content_hash] += 1
+    return point_ids
+
+
+def _point_struct(point: dict) -> PointStruct:
+    return PointStruct(
+        id=point.get("id") or uuid.uuid4().hex,
+        payload={
+            "object_id": point.get("object_id"),
+            "text": point.get("text"),
+            "chunk_index": point.get("chunk_index"),
+            "chunk_hash": point.get("chunk_hash"),
+            "embedding_type": point.get("embedding_type"),
+            "extra_data": point.get("extra_data"),
+        },
+        vector=point.get("embedding") or [],
+    )
+
+
+def upsert_points_sync(vid: str, points: list[dict]):
+    """Upsert a batch of points with one Qdrant call."""
+    with _collection_write(vid):
+        client = get_qdrant_client()
+        client.upsert(
+            collection_name=_collection_name(vid),
+            points=[_point_struct(point) for point in points],
+        )
+
+
+def delete_object_points_sync(vid: str, object_id: str, point_ids: list[str] | None = None):
+    """
+    删除对象的指定点，point_ids 为 None 时删除对象的所有点。
+    Delete the given points of an object, or all of its points when point_ids is None.
+    """
+    if point_ids is None:
+        points_selector = FilterSelector(filter=Filter(must=[FieldCondition(key="object_id", match=MatchValue(value=object_id))]))
+    elif point_ids:
+        points_selector = PointIdsList(points=point_ids)
+    else:
+        return
+
+    with _collection_write(vid):
+        client = get_qdrant_client()
+        client.delete(collection_name=_collection_name(vid), points_selector=points_selector)
+
+
+def set_chunk_indexes_sync(vid: str, chunk_indexes: dict[str, int]):
+    """Update chunk_index in the payload of points whose chunk moved, with one Qdrant call."""
+    if not chunk_indexes:
+        return
+
+    with _collection_write(vid):
+        client = get_qdrant_client()
+        client.batch_update_points(
+            collection_name=_collection_name(vid),
+            update_operations=[
+                SetPayloadOperation(set_payload=SetPayload(payload={"chunk_index": chunk_index}, points=[point_id]))
+                for point_id, chunk_index in chunk_indexes.items()
+            ],
+        )
+
+
+def set_object_progress(vid: str, object_id: str, chunk_index: int = 0, chunk_count: int = 0, stage: str = "embedding"):
+    """
+    记录对象的处理进度，stage 为 parsing（解析分段）或 embedding（嵌入写入）。
+    Record the processing progress of an object, stage is parsing or embedding.
+    """
+    cache.set(
+        f"qdrant-point-progress:{vid}:{object_id}",
+        {"stage": stage, "chunk_index": chunk_index, "chunk_count": chunk_count},
+        expire=60 * 60,
+    )
+
+
+def _mark_object_valid(vid: str, object_id: str):
+    user_object: UserObject = UserObject.get(UserObject.oid == object_id)
+    user_object.status = "VA"
+    user_object.save()
+    keyword_indexes.invalidate(vid)
+
+
+def _mark_object_invalid(object_id: str):
+    # 重试用尽后标记为 IN，下次添加同一来源时整体重建，等待处理的调用也能结束
+    # Mark the object IN once retries are exhausted so the next add rebuilds it and waiting callers finish
+    user_object: UserObject | None = UserObject.get_or_none(UserObject.oid == object_id)
+    if user_object is not None:
+        user_object.status = "IN"
+        user_object.save()
+
+
 @app.task(bind=True)
 @timer
 def q_create_collection(self, vid: str, size: int = 768):
     """Create Qdrant collection"""
     try:
         collection_name = _collection_name(vid)
-        with _QDRANT_OPERATION_LOCK:
+        with _QDRANT_COLLECTIONS_LOCK.write():
             client = get_qdrant_client()
             if client.collection_exists(collection_name):
                 client.delete_collection(collection_name)
@@ -97,6 +311,7 @@ def q_create_collection(self, vid: str, size: int = 768):
                 on_disk_payload=True,
             )
 
+        keyword_indexes.invalidate(vid)
         mprint(f"Created Qdrant collection: {collection_name}")
         return True
     except Exception as e:
@@ -111,11 +326,12 @@ def q_delete_collection(self, vid: str):
     """Delete Qdrant collection"""
     try:
         collection_name = _collection_name(vid)
-        with _QDRANT_OPERATION_LOCK:
+        with _QDRANT_COLLECTIONS_LOCK.write():
             client = get_qdrant_client()
             if client.collection_exists(collection_name):
                 client.delete_collection(collection_name)
 
+        keyword_indexes.invalidate(vid)
         mprint(f"Deleted Qdrant collection: {collection_name}")
         return True
     except Exception as e:
@@ -129,35 +345,13 @@ def q_delete_collection(self, vid: str):
 def q_add_point(self, vid: str, point: dict):
     """Add point to Qdrant collection"""
     try:
-        with _QDRANT_OPERATION_LOCK:
-            client = get_qdrant_client()
-            client.upsert(
-                collection_name=_collection_name(vid),
-                points=[
-                    PointStruct(
-                        id=uuid.uuid4().hex,
-                        payload={
-                            "object_id": point.get("object_id"),
-                            "text": point.get("text"),
-                            "embedding_type": point.get("embedding_type"),
-                            "extra_data": point.get("extra_data"),
-                        },
-                        vector=point.get("embedding") or [],
-                    ),
-                ],
-            )
+        upsert_points_sync(vid, [point])
 
         chunk_count = point.get("chunk_count") or 0
         if point.get("chunk_index") == chunk_count - 1:
-            user_object: UserObject = UserObject.get(UserObject.oid == point.get("object_id"))
-            user_object.status = "VA"
-            user_object.save()
-
-        cache.set(
-            f"qdrant-point-progress:{vid}:{point.get('object_id')}",
-            {"chunk_index": point.get("chunk_index"), "chunk_count": chunk_count},
-            expire=60 * 60,
-        )
+            _mark_object_valid(vid, point["object_id"])
+
+        set_object_progress(vid, point["object_id"], point.get("chunk_index") or 0, chunk_count)
 
         mprint(f"Added point to collection {vid} for object {point.get('object_id')}")
         return True
@@ -179,35 +373,84 @@ def embedding_and_upload(
     embedding_type: str,
     embedding_dimensions: int | None = None,
     extra_data: dict | None = None,
+    previous_chunk_hashes: list[str] | None = None,
+    replace_existing: bool = False,
 ):
-    """Generate embeddings and upload to Qdrant"""
+    """
+    Generate embeddings and upload to Qdrant.
+
+    previous_chunk_hashes are the chunk hashes the object was indexed with before. Only the
+    chunks that are new are embedded and upserted, chunks that are gone are deleted. Callers
+    only pass them when the previous indexing completed (status VA), otherwise its points may
+    be missing and replace_existing deletes all of the object's points first.
+    """
     try:
         input = input if isinstance(input, list) else [input]
         if extra_data is None:
             extra_data = {}
 
-        embedding_client = EmbeddingClient(provider=embedding_provider, model_id=embedding_model, dimensions=embedding_dimensions)
+        chunk_hashes = [chunk_hash(text) for text in input]
+        point_ids = chunk_point_ids(object_id, chunk_hashes)
+        if replace_existing:
+            delete_object_points_sync(vid, object_id)
+
+        # 对比前后两次的分块，只嵌入新增的分块，删除消失的分块，移动位置的分块只更新序号
+        # Diff against the previous chunks: embed only new chunks, delete removed ones and
+        # only renumber the ones that moved
+        previous_positions = {}
+        if previous_chunk_hashes:
+            previous_positions = {
+                point_id: index for index, point_id in enumerate(chunk_point_ids(object_id, previous_chunk_hashes))
+            }
+        new_positions = [index for index, point_id in enumerate(point_ids) if point_id not in previous_positions]
+        delete_object_points_sync(vid, object_id, list(previous_positions.keys() - set(point_ids)))
+        set_chunk_indexes_sync(
+            vid,
+            {
+                point_id: index
+                for index, point_id in enumerate(point_ids)
+                if point_id in previous_positions and previous_positions[point_id] != index
+            },
+        )
 
-        for index, text in enumerate(input):
-            embedding = embedding_client.get(text)
-            q_add_point.delay(
-                vid=vid,
-                point={
-                    "object_id": object_id,
-                    "text": text,
-                    "embedding": embedding,
-                    "embedding_type": embedding_type,
-                    "extra_data": extra_data,
-                    "chunk_index": index,
-                    "chunk_count": len(input),
-                },
-            )
+        embedding_client = EmbeddingClient(provider=embedding_provider, model_id=embedding_model, dimensions=embedding_dimensions)
+        settings = Settings()
+        batch_size = settings.get("vector_database.embedding_batch_size", 64)
+        batch_tokens = settings.get("vector_database.embedding_batch_tokens", 8000)
+
+        # 每批文本只发一次嵌入请求并批量写入 Qdrant，每批更新一次进度
+        # One embedding request and one bulk Qdrant upsert per batch, progress is updated once per batch
+        chunk_count = len(new_positions)
+        new_texts = [input[index] for index in new_positions]
+        for batch_start, texts in split_embedding_batches(new_texts, batch_size, batch_tokens):
+            embeddings = embedding_client.get(texts)
+            points = []
+            for offset, (text, embedding) in enumerate(zip(texts, embeddings)):
+                index = new_positions[batch_start + offset]
+                points.append(
+                    {
+                        "id": point_ids[index],
+                        "object_id": object_id,
+                        "text": text,
+                        "embedding": embedding,
+                        "embedding_type": embedding_type,
+                        "extra_data": extra_data,
+                        "chunk_index": index,
+                        "chunk_hash": chunk_hashes[index],
+                    }
+                )
+            upsert_points_sync(vid, points)
+            set_object_progress(vid, object_id, batch_start + len(texts) - 1, chunk_count)
 
-        mprint(f"Queued embedding tasks for object {object_id} in collection {vid}")
+        _mark_object_valid(vid, object_id)
+        mprint(f"Uploaded {chunk_count} points for object {object_id} in collection {vid}, kept {len(input) - chunk_count} unchanged")
         return True
     except Exception as e:
         mprint.error(f"Failed to process embeddings for object {object_id}: {e}")
-        self.retry(countdown=60, max_retries=3)
+        try:
+            self.retry(countdown=60, max_retries=3)
+        except MaxRetriesExceededError:
+            _mark_object_invalid(object_id)
         return False
 
 
@@ -216,22 +459,8 @@ def embedding_and_upload(
 def q_delete_point(self, vid: str, object_id: str):
     """Delete point from Qdrant collection"""
     try:
-        with _QDRANT_OPERATION_LOCK:
-            client = get_qdrant_client()
-            client.delete(
-                collection_name=_collection_name(vid),
-                points_selector=FilterSelector(
-                    filter=Filter(
-                        must=[
-                            FieldCondition(
-                                key="object_id",
-                                match=MatchValue(value=object_id),
-                            ),
-                        ],
-                    )
-                ),
-            )
-
+        delete_object_points_sync(vid, object_id)
+        keyword_indexes.invalidate(vid)
         mprint(f"Deleted point from collection {vid} for object {object_id}")
         return True
     except Exception as e:
@@ -6,11 +6,28 @@ import time
 import inspect
 import traceback
 import threading
+from functools import partial
 
 from celery_worker import app, timer
 
-from utilities.workflow import Workflow
-from utilities.general import mprint_with_name
+from utilities.config import Settings
+from utilities.workflow import (
+    Workflow,
+    ReadyQueueExecutor,
+    WorkflowExecutionError,
+    WorkflowStateSession,
+    WorkflowCancelled,
+    workflow_state_store,
+    workflow_run_events,
+    start_workflow_trace,
+    is_workflow_cancelled,
+    raise_if_cancelled,
+    is_streaming_edge,
+    parsed_workflow_scope,
+)
+from utilities.workflow.cancel import CANCELLED_ERROR_TASK, register_celery_tasks
+from utilities.workflow.state import STATE_MODE_FULL, STATE_MODE_DELTA
+from utilities.general import mprint_with_name, get_shared_executor
 from worker.tasks import chain, on_finish, TaskError, TaskRetry, task
 from worker.tasks import (
     llms,
@@ -85,7 +102,7 @@ def merge_results(workflow_data_list: list, node_ids: list):
     if not workflow_data_list:
         return {}
 
-    merged_data = Workflow(workflow_data_list[0]).data
+    merged_data = Workflow.from_data(workflow_data_list[0]).data
 
     # Merge node_run_time from all results
     merged_run_times = {}
@@ -94,8 +111,8 @@ def merge_results(workflow_data_list: list, node_ids: list):
             merged_run_times.update(workflow_data["node_run_time"])
 
     for workflow_data, node_id in zip(workflow_data_list[1:], node_ids[1:]):
-        current_workflow = Workflow(workflow_data)
-        merged_workflow = Workflow(merged_data)
+        current_workflow = Workflow.from_data(workflow_data)
+        merged_workflow = Workflow.from_data(merged_data)
         node = current_workflow.get_node(node_id=node_id)
         if node is None:
             continue
@@ -135,14 +152,16 @@ def batch_tasks(self, workflow_data: dict, tasks: list[Dict[str, Any]]):
     Returns:
         dict: merged workflow data
     """
+    state_session = WorkflowStateSession(workflow_data)
+    workflow_data = state_session.workflow_data
+    record_id = workflow_data.get("rid")
+    raise_if_cancelled(record_id)
+
     results = {}
-    threads = []
-    has_failed_task = False
     error_tasks = []
     result_lock = threading.Lock()
 
     def run_task(task: Dict[str, Any]):
-        nonlocal has_failed_task
         module, function = task["task_name"].split(".")
         node_id = task["node_id"]
         is_skipped = node_id in workflow_data.get("skipped_nodes", [])
@@ -151,6 +170,7 @@ def batch_tasks(self, workflow_data: dict, tasks: list[Dict[str, Any]]):
         start_time = time.time()
 
         try:
+            raise_if_cancelled(record_id)
             task_result = task_functions[module][function](workflow_data, node_id)
 
             # Record end time and calculate elapsed time
@@ -164,7 +184,7 @@ def batch_tasks(self, workflow_data: dict, tasks: list[Dict[str, Any]]):
                 task_result["node_run_time"][node_id] = elapsed_time
 
                 # Also update the node's run_time field in the workflow data
-                workflow_obj = Workflow(task_result)
+                workflow_obj = Workflow.from_data(task_result)
                 node = workflow_obj.get_node(node_id=node_id)
                 if node:
                     node.run_time = elapsed_time
@@ -177,8 +197,9 @@ def batch_tasks(self, workflow_data: dict, tasks: list[Dict[str, Any]]):
 
             with result_lock:
                 results[node_id] = task_result
+        except WorkflowCancelled:
+            raise
         except Exception as e:
-            has_failed_task = True
             with result_lock:
                 error_tasks.append(task)
             mprint.error(f"Error in task {task['task_name']} -> {node_id}: {e}")
@@ -198,29 +219,15 @@ def batch_tasks(self, workflow_data: dict, tasks: list[Dict[str, Any]]):
                 workflow.report_workflow_status(500, task["task_name"])
             except Exception as e:
                 mprint.error(f"Error in report_workflow_status: {e}")
-                pass
-        return None
-
-    # Create a daemon thread for each task
-    for task_item in tasks:
-        thread = threading.Thread(target=run_task, args=(task_item,), daemon=True)
-        threads.append(thread)
-        thread.start()
-
-    # Wait for all threads to complete or any task to fail
-    while True:
-        if has_failed_task:
-            break
-        all_threads_finished = True
-        for thread in threads:
-            if thread.is_alive():
-                all_threads_finished = False
-                break
-        if all_threads_finished:
-            break
-        time.sleep(0.1)
+            raise
 
-    if has_failed_task:
+    # 在进程共享的有上限线程池中运行，任一任务失败时取消还在排队的兄弟任务
+    # Run on the shared bounded pool, a failing task cancels siblings that are still queued
+    executor = get_shared_executor("workflow_nodes")
+    executor.run_all([partial(run_task, task_item) for task_item in tasks])
+
+    raise_if_cancelled(record_id)
+    if error_tasks:
         mprint.error(error_tasks)
         raise Exception("Some tasks failed")
 
@@ -233,29 +240,79 @@ def batch_tasks(self, workflow_data: dict, tasks: list[Dict[str, Any]]):
             sorted_task_results.append(results[node_id])
             sorted_node_ids.append(node_id)
 
-    # Merge results with proper run time tracking
-    if sorted_task_results:
-        merged_result = merge_results(sorted_task_results, sorted_node_ids)
-    else:
-        merged_result = workflow_data
-
-    # Ensure all nodes in this batch have their run times set
-    merged_workflow = Workflow(merged_result)
-    for _task in tasks:
-        node_id = _task["node_id"]
-        node = merged_workflow.get_node(node_id=node_id)
-        if node and node_id in results:
-            if node_id in merged_result.get("skipped_nodes", []):
-                continue
-            # Get run time from the node_run_time dict if available
-            if "node_run_time" in merged_result and node_id in merged_result["node_run_time"]:
-                node.run_time = merged_result["node_run_time"][node_id]
-            elif hasattr(node, "run_time") and node.run_time < 0:
-                # If still -1, try to calculate from task execution
-                node.run_time = 0  # Default to 0 if we couldn't measure it
+    # 合并和补全运行时间时复用 merge_results 已解析的 Workflow
+    # Reuse the Workflow merge_results parsed while merging and filling in run times
+    with parsed_workflow_scope():
+        # Merge results with proper run time tracking
+        if sorted_task_results:
+            merged_result = merge_results(sorted_task_results, sorted_node_ids)
+        else:
+            merged_result = workflow_data
+
+        # Ensure all nodes in this batch have their run times set
+        merged_workflow = Workflow.from_data(merged_result)
+        for _task in tasks:
+            node_id = _task["node_id"]
+            node = merged_workflow.get_node(node_id=node_id)
+            if node and node_id in results:
+                if node_id in merged_result.get("skipped_nodes", []):
+                    continue
+                # Get run time from the node_run_time dict if available
+                if "node_run_time" in merged_result and node_id in merged_result["node_run_time"]:
+                    node.run_time = merged_result["node_run_time"][node_id]
+                elif hasattr(node, "run_time") and node.run_time < 0:
+                    # If still -1, try to calculate from task execution
+                    node.run_time = 0  # Default to 0 if we couldn't measure it
+
+        merged_result = merged_workflow.data
+        return state_session.finish(merged_result)
+
+
+def run_node(workflow_data: dict, node_id: str, task_name: str):
+    module, function = task_name.split(".")
+    return task_functions[module][function](workflow_data, node_id)
+
+
+def execute_ready_queue(workflow: Workflow, settings: Settings):
+    """Run the whole workflow with the dependency-driven ready-queue executor.
+
+    A failing or stopped node is reported on the run record, unexpected errors are
+    raised to the calling Celery task.
 
-    merged_result = merged_workflow.data
-    return merged_result
+    Args:
+        workflow (Workflow): Workflow to run, nodes share its workflow data
+        settings (Settings): User settings with the workflow concurrency options
+    """
+    # 节点共享进程内的同一份数据，增量模式下额外把每个节点的增量记录到权威状态
+    # Nodes share the same in-process data, in delta mode each node's delta is also recorded to the authoritative state
+    state_ref = None
+    if settings.get("workflow.state_mode", STATE_MODE_FULL) == STATE_MODE_DELTA and workflow.record_id:
+        state_ref = workflow_state_store.create(workflow.data)
+    executor = ReadyQueueExecutor(
+        workflow,
+        run_node,
+        max_workers=settings.get("workflow.max_concurrency", 8),
+        task_concurrency=settings.get("workflow.task_concurrency", {}),
+        retry_exceptions=(TaskRetry,),
+        is_cancelled=partial(is_workflow_cancelled, workflow.record_id),
+        wait_for_runs=workflow_run_events.wait_future,
+        state_ref=state_ref,
+    )
+    try:
+        executor.run()
+        on_finish(workflow.data)
+        mprint(f"Workflow {workflow.workflow_id} completed successfully")
+    except WorkflowCancelled:
+        # 保存停止前已经完成的节点输出
+        # Keep the outputs of the nodes that finished before the stop
+        mprint(f"Workflow {workflow.workflow_id} stopped")
+        workflow.report_workflow_status(500, CANCELLED_ERROR_TASK)
+    except WorkflowExecutionError as e:
+        mprint.error(f"Workflow {workflow.workflow_id} failed at {e.task_name} -> {e.node_id}: {e}")
+        workflow.report_workflow_status(500, e.task_name)
+    finally:
+        if state_ref is not None:
+            workflow_state_store.discard(workflow.record_id)
 
 
 @app.task(bind=True, name="workflow.run", max_retries=3)
@@ -272,10 +329,36 @@ def run_workflow(self, workflow_data: dict):
     try:
         mprint(f"Starting workflow execution: {workflow_data.get('wid', 'unknown')}")
         workflow = Workflow(workflow_data)
-
+        if is_workflow_cancelled(workflow.record_id):
+            mprint(f"Workflow run {workflow.record_id} was stopped before it started")
+            return workflow.record_id
+        settings = Settings()
+        if settings.get("workflow.tracing", True) and workflow.record_id:
+            start_workflow_trace(workflow.record_id)
+
+        if settings.get("workflow.scheduler", "layered") == "ready_queue":
+            # 在任务内阻塞等待执行器，Celery 的超时、重试和下面的异常处理覆盖整个运行。
+            # 节点在执行器自己的线程中运行，但运行期间一直占用这个 worker
+            # Block on the executor inside the task so Celery's time limits, retries and the
+            # handlers below cover the whole run. Nodes run on the executor's own threads but
+            # the run holds this worker until it ends
+            execute_ready_queue(workflow, settings)
+            return workflow.record_id
+
+        # 按层调度时下游节点总在上游完成后运行，流式连线按普通连线处理
+        # With layered scheduling targets always run after their sources finish, streaming edges act as normal edges
+        if any(is_streaming_edge(edge) for edge in workflow.edges):
+            mprint(f"Workflow {workflow.workflow_id} has streaming edges, the layered scheduler passes whole values instead")
         tasks = workflow.get_layer_sorted_task_order()
         func_list = []
 
+        # 增量模式下任务之间只传递状态引用，字段增量写回同一份权威状态
+        # In delta mode tasks only pass a state reference and write field deltas back to one authoritative state
+        if settings.get("workflow.state_mode", STATE_MODE_FULL) == STATE_MODE_DELTA and workflow.record_id:
+            initial_payload = workflow_state_store.create(workflow.data)
+        else:
+            initial_payload = workflow.data
+
         for task_item in tasks:
             if isinstance(task_item, list):  # Parallel tasks
                 group_tasks = batch_tasks.s(task_item)
@@ -288,7 +371,16 @@ def run_workflow(self, workflow_data: dict):
 
         # Build and execute the task chain
         task_chain = chain(*func_list, on_finish.s())
-        result = task_chain(workflow.data)
+        result = task_chain(initial_payload)
+
+        # 记录链上各个任务的 ID，停止运行时撤销还在排队的任务
+        # Remember the task ids of the chain so queued ones can be revoked on stop
+        task_ids = []
+        async_result = result
+        while async_result is not None:
+            task_ids.append(async_result.id)
+            async_result = async_result.parent
+        register_celery_tasks(workflow.record_id, task_ids)
 
         mprint(f"Workflow {workflow_data.get('wid', 'unknown')} completed successfully")
         return result
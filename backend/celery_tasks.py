@@ -18,6 +18,8 @@ from background_task.qdrant_tasks import (
     embedding_and_upload,
 )
 
+from background_task.ingestion_tasks import ingest_files
+
 from background_task.workflow_tasks import (
     run_workflow,
     batch_tasks,
@@ -33,6 +35,7 @@ __all__ = [
     'delete_point',
     'search_point',
     'embedding_and_upload',
+    'ingest_files',
     'run_workflow',
     'batch_tasks',
 ]
\ No newline at end of file
@@ -32,6 +32,7 @@ app = Celery(
     include=[
         "background_task.general_tasks", 
         "background_task.qdrant_tasks",
+        "background_task.ingestion_tasks",
         "background_task.workflow_tasks",
         # Include all worker task modules to register them
         "worker.tasks",
@@ -70,6 +71,7 @@ app.conf.update(
     task_routes={
         'background_task.general_tasks.*': {'queue': 'celery'},
         'background_task.qdrant_tasks.*': {'queue': 'celery'},
+        'background_task.ingestion_tasks.*': {'queue': 'celery'},
         'background_task.workflow_tasks.*': {'queue': 'celery'},
         'workflow.*': {'queue': 'celery'},
     }
@@ -22,7 +22,8 @@ from vv_llm.chat_clients.utils import ToolCallContentProcessor, format_messages
 from tts_server.server import tts_server
 from utilities.config import Settings, cache
 from utilities.general import mprint_with_name
-from utilities.network import new_httpx_client
+from utilities.workflow.node_stream import node_streams, is_end_marker
+from utilities.network import get_llm_http_client
 from celery_tasks import summarize_conversation_title
 from .utils import get_tool_call_data, get_tool_related_workflow
 
@@ -95,22 +96,19 @@ class WebSocketServer:
 
     async def handle_workflow_node(self, websocket: ServerConnection, param: str):
         record_id, node_id = param.split("_")
-        queue_key = f"workflow_record{record_id}_node{node_id}:data_queue"
-        data_queue = []
-        assert isinstance(data_queue, list)
-        current_length = len(data_queue)
+        stream = node_streams.get(record_id, node_id)
+        cursor = 0
 
         start_time = time.time()
         while time.time() - start_time < 3 * 60:
-            latest_data_queue = cache.get(queue_key, [])
-            assert isinstance(latest_data_queue, list)
-            while len(latest_data_queue) > current_length:
-                data = latest_data_queue[current_length]
-                current_length += 1
+            # 在线程中阻塞等待游标之后的新数据，只发送新增部分
+            # Block in a thread for the items after the cursor and only send the new ones
+            items = await asyncio.to_thread(stream.read, cursor, 1.0)
+            cursor += len(items)
+            for data in items:
                 await websocket.send(json.dumps(data, ensure_ascii=False))
-                if data == '{"end": true}':
-                    break
-            await asyncio.sleep(0.1)
+            if any(is_end_marker(data) for data in items):
+                break
 
     async def handle_chat(self, websocket: ServerConnection, param: str):
         async for message in websocket:
@@ -226,7 +224,7 @@ class WebSocketServer:
                 title_backend = BackendType(title_backend.lower())
             summarize_conversation_title.delay(ai_message_mid, history_messages, title_backend, title_model)
 
-        client = create_async_chat_client(backend=backend, model=model, http_client=new_httpx_client(is_async=True))
+        client = create_async_chat_client(backend=backend, model=model, http_client=get_llm_http_client(is_async=True))
 
         tool_call_data = request_data["conversation"]["tool_call_data"]
         if tool_call_data.get("workflows") or tool_call_data.get("templates"):
@@ -13,7 +13,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from utilities.general import mprint_with_name
+from utilities.general import mprint_with_name, shared_executor_metrics
 from utilities.config import config
 
 from api.workflow_api import (
@@ -53,7 +53,13 @@ class FastAPIServer:
         # Add basic API endpoints
         @self.fastapi_app.get("/health")
         async def health_check():
-            return {"status": "healthy", "timestamp": time.time(), "type": "desktop_api", "services": {"fastapi": "running", "celery": "running", "pywebview": "integrated"}}
+            return {
+                "status": "healthy",
+                "timestamp": time.time(),
+                "type": "desktop_api",
+                "services": {"fastapi": "running", "celery": "running", "pywebview": "integrated"},
+                "executors": shared_executor_metrics(),
+            }
 
         @self.fastapi_app.get("/api/info")
         async def api_info():
@@ -294,9 +300,8 @@ class FastAPIServer:
         async def stop_workflow(workflow_id: str, record_id: str):
             """Stop a running workflow"""
             try:
-                # Note: The workflow API doesn't have a stop method, need to check this
-                # For now, return a message that this feature is not yet implemented
-                return {"workflow_id": workflow_id, "record_id": record_id, "status": "not_implemented", "message": "Stop workflow feature is not yet implemented"}
+                result = self.workflow_run_record_api.stop({"rid": record_id})
+                return StandardResponse(status=result.get("status", 500), msg=result.get("msg", ""), data=result.get("data", {}))
             except Exception as e:
                 mprint(f"Error stopping workflow {workflow_id}/{record_id}: {e}")
                 raise HTTPException(status_code=500, detail=str(e))
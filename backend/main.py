@@ -4,6 +4,7 @@
 
 import os
 import sys
+import multiprocessing
 from pathlib import Path
 
 import webview
@@ -339,5 +340,7 @@ class MainServer:
 
 
 if __name__ == "__main__":
+    # 打包后的程序启动文件解析子进程时需要 / Needed by the frozen app when it starts file parsing processes
+    multiprocessing.freeze_support()
     main_server = MainServer()
     main_server.start()
@@ -0,0 +1,92 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""Peewee migrations -- 007_user_object_content.py.
+
+Some examples (model - class or model name)::
+
+    > Model = migrator.orm['table_name']            # Return model in current state by name
+    > Model = migrator.ModelClass                   # Return model in current state by name
+
+    > migrator.sql(sql)                             # Run custom SQL
+    > migrator.run(func, *args, **kwargs)           # Run python function with the given args
+    > migrator.create_model(Model)                  # Create a model (could be used as decorator)
+    > migrator.remove_model(model, cascade=True)    # Remove a model
+    > migrator.add_fields(model, **fields)          # Add fields to a model
+    > migrator.change_fields(model, **fields)       # Change fields
+    > migrator.remove_fields(model, *field_names, cascade=True)
+    > migrator.rename_field(model, old_field_name, new_field_name)
+    > migrator.rename_table(model, new_table_name)
+    > migrator.add_index(model, *col_names, unique=False)
+    > migrator.add_not_null(model, *field_names)
+    > migrator.add_default(model, field_name, default)
+    > migrator.add_constraint(model, name, sql)
+    > migrator.drop_index(model, *col_names)
+    > migrator.drop_not_null(model, *field_names)
+    > migrator.drop_constraints(model, *constraints)
+
+"""
+
+import json
+import zlib
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+with suppress(ImportError):
+    pass
+
+
+CONTENT_KEYS = ("text", "segments")
+
+
+def _move_object_content(database: pw.Database):
+    """Move text and segments out of user_object.raw_data into compressed content rows."""
+    rows = database.execute_sql("SELECT id, raw_data FROM user_object").fetchall()
+    for object_id, raw_data in rows:
+        data = json.loads(raw_data) if raw_data else {}
+        if not isinstance(data, dict):
+            continue
+        content = {key: data.pop(key) for key in CONTENT_KEYS if key in data}
+        if not content:
+            continue
+        database.execute_sql(
+            "INSERT OR REPLACE INTO user_object_content (user_object_id, data) VALUES (?, ?)",
+            (object_id, zlib.compress(json.dumps(content, ensure_ascii=False).encode("utf-8"))),
+        )
+        database.execute_sql("UPDATE user_object SET raw_data = ? WHERE id = ?", (json.dumps(data), object_id))
+
+
+def _restore_object_content(database: pw.Database):
+    rows = database.execute_sql(
+        "SELECT o.id, o.raw_data, c.data FROM user_object o JOIN user_object_content c ON c.user_object_id = o.id"
+    ).fetchall()
+    for object_id, raw_data, content in rows:
+        data = json.loads(raw_data) if raw_data else {}
+        data.update(json.loads(zlib.decompress(content)))
+        database.execute_sql("UPDATE user_object SET raw_data = ? WHERE id = ?", (json.dumps(data), object_id))
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your migrations here."""
+
+    @migrator.create_model
+    class UserObjectContent(pw.Model):
+        id = pw.AutoField()
+        user_object = pw.ForeignKeyField(
+            column_name="user_object_id", field="id", model=migrator.orm["user_object"], on_delete="CASCADE", unique=True
+        )
+        data = pw.BlobField()
+
+        class Meta:
+            table_name = "user_object_content"
+
+    migrator.run(_move_object_content, database)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    migrator.run(_restore_object_content, database)
+    migrator.remove_model("user_object_content")
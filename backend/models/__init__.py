@@ -14,6 +14,7 @@ from .database_models import (
     Status,
     UserObject,
     DatabaseStatus,
+    UserObjectContent,
     UserVectorDatabase,
     UserRelationalTable,
     UserRelationalDatabase,
@@ -41,6 +42,7 @@ def create_tables():
             WorkflowTemplate,
             WorkflowTemplate.tags.get_through_model(),
             UserObject,
+            UserObjectContent,
             UserVectorDatabase,
             UserRelationalDatabase,
             UserRelationalTable,
@@ -64,6 +66,7 @@ __all__ = [
     "database",
     "Workflow",
     "UserObject",
+    "UserObjectContent",
     "WorkflowTag",
     "Conversation",
     "create_tables",
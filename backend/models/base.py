@@ -5,6 +5,7 @@
 # @Last Modified time: 2024-06-15 01:45:12
 import json
 import uuid
+import zlib
 from collections.abc import Iterable, Iterator
 from pathlib import Path
 from datetime import date, datetime
@@ -13,6 +14,7 @@ from typing import Any, Protocol, TypeAlias, TypeVar, overload, List, Optional
 from playhouse.shortcuts import model_to_dict
 from peewee import (
     Model,
+    BlobField,
     TextField,
     ModelSelect,
     SqliteDatabase,
@@ -84,6 +86,20 @@ class JSONField(TextField):
         return None
 
 
+class CompressedJSONField(BlobField):
+    """JSON data compressed with zlib, for large values that are only read on demand"""
+
+    def db_value(self, value):
+        if value is not None:
+            return zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        return None
+
+    def python_value(self, value):
+        if value is not None:
+            return json.loads(zlib.decompress(value))
+        return None
+
+
 class BaseModel(Model):
     class Meta:
         database = database
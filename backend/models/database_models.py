@@ -15,7 +15,7 @@ from peewee import (
     ForeignKeyField,
 )
 
-from models.base import BaseModel, JSONField, ModelField
+from models.base import BaseModel, JSONField, ModelField, CompressedJSONField
 from models.user_models import User
 
 
@@ -88,6 +88,29 @@ class UserObject(BaseModel):
     raw_data = cast(ModelField[dict[str, Any]], JSONField(default=dict))
     embeddings = cast(ModelField[list[Any]], JSONField(default=list))
 
+    # 正文和分段压缩存放在 UserObjectContent 中，按需读取；raw_data 只保留来源等少量元数据
+    # Text and segments are stored compressed in UserObjectContent and loaded on demand,
+    # raw_data only keeps small metadata such as the source
+    CONTENT_KEYS = ("text", "segments")
+
+    def load_raw_data(self) -> dict[str, Any]:
+        raw_data = dict(self.raw_data) if isinstance(self.raw_data, dict) else {}
+        content = UserObjectContent.get_or_none(UserObjectContent.user_object == self)
+        if content is not None and isinstance(content.data, dict):
+            raw_data.update(content.data)
+        return raw_data
+
+    def save_raw_data(self, raw_data: dict[str, Any]):
+        """
+        保存对象和完整的 raw_data，正文和分段写入内容表。
+        Save the object with its full raw_data, text and segments go to the content table.
+        """
+        self.raw_data = {key: value for key, value in raw_data.items() if key not in self.CONTENT_KEYS}
+        content = {key: raw_data[key] for key in self.CONTENT_KEYS if key in raw_data}
+        with self._meta.database.atomic():
+            self.save()
+            UserObjectContent.insert(user_object=self, data=content).on_conflict_replace().execute()
+
     def __str__(self):
         return str(self.oid)
 
@@ -95,6 +118,14 @@ class UserObject(BaseModel):
         table_name = "user_object"
 
 
+class UserObjectContent(BaseModel):
+    user_object = cast(ModelField[UserObject], ForeignKeyField(UserObject, unique=True, on_delete="CASCADE", backref="contents"))
+    data = cast(ModelField[dict[str, Any]], CompressedJSONField(default=dict))
+
+    class Meta:
+        table_name = "user_object_content"
+
+
 class UserRelationalDatabase(BaseModel):
     rid = cast(ModelField[uuid.UUID], UUIDField(primary_key=True, default=uuid.uuid4))
     user = cast(ModelField[User | None], ForeignKeyField(User, null=True, on_delete="SET NULL"))
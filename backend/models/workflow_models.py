@@ -104,6 +104,9 @@ class WorkflowRunRecord(BaseModel):
     start_time = cast(ModelField[datetime], DateTimeField(default=datetime.now))
     end_time = cast(ModelField[datetime | None], DateTimeField(null=True))
     used_credits = cast(ModelField[int], IntegerField(default=0))
+    trace = cast(ModelField[dict[str, Any]], JSONField(default=dict))
+    # 运行失败的节点任务名，停止运行时为 workflow.cancelled / Task name of the failed node, workflow.cancelled when stopped
+    error_task = cast(ModelField[str], CharField(max_length=128, default=""))
 
     run_from = cast(
         ModelField[str],
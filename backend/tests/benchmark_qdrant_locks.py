@@ -0,0 +1,111 @@
+"""
+Search throughput while another collection is being ingested.
+
+Compares the per-collection read/write locks with a single process-wide lock (the previous
+behaviour) on an embedded Qdrant client in a temporary directory.
+
+    python tests/benchmark_qdrant_locks.py [--seconds 5] [--searchers 4]
+"""
+
+from __future__ import annotations
+
+import sys
+import random
+import argparse
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from threading import RLock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from qdrant_client import QdrantClient  # noqa: E402
+from qdrant_client.http.models import Distance, VectorParams  # noqa: E402
+
+from background_task import qdrant_tasks  # noqa: E402
+
+
+DIMENSIONS = 256
+
+
+def random_vector() -> list[float]:
+    return [random.random() for _ in range(DIMENSIONS)]
+
+
+def run(seconds: float, searchers: int) -> dict[str, float]:
+    stop = threading.Event()
+    searches = 0
+    upserts = 0
+    counter_lock = threading.Lock()
+
+    def ingest():
+        nonlocal upserts
+        chunk_index = 0
+        while not stop.is_set():
+            points = [{"object_id": "ingest", "text": "x", "embedding": random_vector(), "chunk_index": chunk_index + i} for i in range(64)]
+            qdrant_tasks.upsert_points_sync("ingest", points)
+            chunk_index += len(points)
+            with counter_lock:
+                upserts += 1
+
+    def search():
+        nonlocal searches
+        while not stop.is_set():
+            qdrant_tasks.search_points_sync("search", random_vector(), limit=5)
+            with counter_lock:
+                searches += 1
+
+    threads = [threading.Thread(target=ingest)] + [threading.Thread(target=search) for _ in range(searchers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {"searches_per_second": searches / seconds, "upserts_per_second": upserts / seconds}
+
+
+@contextmanager
+def global_lock():
+    """Replace the collection locks with one process-wide lock for the baseline run."""
+    lock = RLock()
+
+    @contextmanager
+    def _locked(vid: str):
+        with lock:
+            yield
+
+    original = qdrant_tasks._collection_read, qdrant_tasks._collection_write
+    qdrant_tasks._collection_read = qdrant_tasks._collection_write = _locked
+    try:
+        yield
+    finally:
+        qdrant_tasks._collection_read, qdrant_tasks._collection_write = original
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--searchers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        client = QdrantClient(path=directory, force_disable_check_same_thread=True)
+        for vid in ("ingest", "search"):
+            client.create_collection(f"{vid}_text_collection", vectors_config=VectorParams(size=DIMENSIONS, distance=Distance.COSINE))
+        qdrant_tasks.get_qdrant_client = lambda: client
+        qdrant_tasks.upsert_points_sync("search", [{"object_id": "search", "text": "x", "embedding": random_vector(), "chunk_index": i} for i in range(5000)])
+
+        with global_lock():
+            baseline = run(args.seconds, args.searchers)
+        per_collection = run(args.seconds, args.searchers)
+        client.close()
+
+    print(f"global lock:          {baseline['searches_per_second']:.1f} searches/s, {baseline['upserts_per_second']:.1f} upserts/s")
+    print(f"per-collection locks: {per_collection['searches_per_second']:.1f} searches/s, {per_collection['upserts_per_second']:.1f} upserts/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,58 @@ from __future__ import annotations
 import sys
 from pathlib import Path
 
+import pytest
+from diskcache import Cache
+
 
 BACKEND_ROOT = Path(__file__).resolve().parents[1]
 
 if str(BACKEND_ROOT) not in sys.path:
     sys.path.insert(0, str(BACKEND_ROOT))
+
+from utilities.ai_utils import embeddings as embeddings_module  # noqa: E402
+from utilities.ai_utils.embedding_cache import EmbeddingCache  # noqa: E402
+from utilities.workflow import cancel as cancel_module  # noqa: E402
+from utilities.workflow import progress as progress_module  # noqa: E402
+from utilities.workflow import run_events as run_events_module  # noqa: E402
+from utilities.workflow import state as state_module  # noqa: E402
+
+
+def make_node(
+    node_id: str,
+    template: dict | None = None,
+    node_type: str = "Text",
+    task_name: str = "text_processing.concat",
+    category: str = "textProcessing",
+    status: int | None = None,
+) -> dict:
+    node = {
+        "id": node_id,
+        "type": node_type,
+        "category": category,
+        "data": {"task_name": task_name, "template": template or {}},
+    }
+    if status is not None:
+        node["data"]["status"] = status
+    return node
+
+
+@pytest.fixture(autouse=True)
+def embedding_cache(monkeypatch: pytest.MonkeyPatch, tmp_path) -> EmbeddingCache:
+    # Keep cached embeddings of one test out of the data directory and other tests
+    embedding_cache = EmbeddingCache(tmp_path / "embedding_cache", size_limit=1024**2)
+    monkeypatch.setattr(embeddings_module, "embedding_cache", embedding_cache)
+    yield embedding_cache
+    if embedding_cache._cache is not None:
+        embedding_cache.cache.close()
+
+
+@pytest.fixture
+def disk_cache(monkeypatch: pytest.MonkeyPatch, tmp_path) -> Cache:
+    # Keep the workflow run state of one test out of the shared cache and other tests
+    disk_cache = Cache(tmp_path / "cache")
+    for module in (cancel_module, progress_module, run_events_module, state_module):
+        monkeypatch.setattr(module, "cache", disk_cache)
+    monkeypatch.setattr(cancel_module, "_cancelled_records", set())
+    yield disk_cache
+    disk_cache.close()
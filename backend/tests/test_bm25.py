@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from utilities.text_processing.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_identifiers_and_splits_cjk() -> None:
+    assert tokenize("Call foo.bar_baz()") == ["call", "foo.bar_baz", "foo", "bar", "baz"]
+    assert tokenize("向量库") == ["向", "量", "库", "向量", "量库"]
+
+
+def test_bm25_ranks_exact_identifier_first() -> None:
+    index = BM25Index()
+    index.add("The retry helper waits between attempts.", {"id": 1})
+    index.add("Set MAX_RETRY_COUNT in the config to limit retries.", {"id": 2})
+    index.add("向量数据库支持混合检索。", {"id": 3})
+
+    assert [payload["id"] for payload, _score in index.search("MAX_RETRY_COUNT", limit=2)] == [2, 1]
+    assert [payload["id"] for payload, _score in index.search("混合检索", limit=1)] == [3]
+    assert BM25Index().search("anything") == []
+
+
+def test_reciprocal_rank_fusion_prefers_results_found_by_both() -> None:
+    vector = [("a", "A"), ("b", "B"), ("c", "C")]
+    keyword = [("c", "C"), ("d", "D")]
+
+    assert reciprocal_rank_fusion([vector, keyword], limit=3) == ["C", "A", "B"]
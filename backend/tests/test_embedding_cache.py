@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import utilities.ai_utils.embeddings as embeddings_module
+from utilities.ai_utils.embedding_cache import EmbeddingCache, pack_embedding, unpack_embedding
+
+
+def make_client(calls: list[list[str]], dimensions: int | None = None) -> embeddings_module.EmbeddingClient:
+    class _FakeBackend:
+        def embed(self, text: str, dimensions: int | None = None) -> list[float]:
+            calls.append([text])
+            return [float(len(text)), 0.5]
+
+        def embed_batch(self, texts: list[str], dimensions: int | None = None) -> list[list[float]]:
+            calls.append(texts)
+            return [[float(len(text)), 0.5] for text in texts]
+
+    client = embeddings_module.EmbeddingClient.__new__(embeddings_module.EmbeddingClient)
+    client.provider, client.model_id, client.dimensions = "openai", "text-embedding-3-small", dimensions
+    client.use_cache = True
+    client.client = _FakeBackend()
+    return client
+
+
+def test_embeddings_are_packed_as_float32() -> None:
+    data = pack_embedding([0.25, -1.5, 3.0])
+
+    assert len(data) == 12
+    assert unpack_embedding(data) == [0.25, -1.5, 3.0]
+
+
+def test_client_only_embeds_texts_missing_from_cache(embedding_cache: EmbeddingCache) -> None:
+    calls: list[list[str]] = []
+    client = make_client(calls)
+
+    assert client.get(["a", "bb", "a"]) == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert client.get("bb") == [2.0, 0.5]
+    assert client.get(["bb", "ccc"]) == [[2.0, 0.5], [3.0, 0.5]]
+
+    assert calls == [["a", "bb"], ["ccc"]]
+    stats = embedding_cache.stats()
+    assert stats["count"] == 3
+    assert stats["hits"] == 2
+    assert stats["misses"] == 4
+
+
+def test_cache_key_includes_dimensions(embedding_cache: EmbeddingCache) -> None:
+    calls: list[list[str]] = []
+
+    make_client(calls).get("text")
+    make_client(calls, dimensions=256).get("text")
+
+    assert calls == [["text"], ["text"]]
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from email.utils import formatdate
+
+import pytest
+
+from utilities.ai_utils import endpoint_router
+from utilities.ai_utils.endpoint_router import EndpointRouter, backoff_delay, retry_after_seconds
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(endpoint_router, "time", clock)
+    return clock
+
+
+def test_select_prefers_fast_and_idle_endpoints(clock: FakeClock) -> None:
+    router = EndpointRouter()
+    router._get("slow").latency = 4.0
+    router._get("fast").latency = 0.5
+
+    assert router.select(["slow", "fast"]) == "fast"
+    assert router.stats("fast").in_flight == 1
+    # Requests in flight make the fast endpoint look busier than the slow one
+    assert router.select(["slow", "fast"]) == "fast"
+    assert router.select(["slow", "fast"]) == "fast"
+    assert router.select(["slow", "fast"]) == "slow"
+
+    # An endpoint that fails the availability check (e.g. its rate limit) is skipped
+    router.release("fast")
+    assert router.select(["slow", "fast"], is_available=lambda endpoint_id: endpoint_id != "fast") == "slow"
+    assert router.select(["slow", "fast"], exclude=["fast"]) == "slow"
+
+
+def test_circuit_opens_after_consecutive_failures_and_probes_once(clock: FakeClock) -> None:
+    router = EndpointRouter(failure_threshold=2, open_seconds=5)
+
+    for _ in range(2):
+        assert router.select(["a"]) == "a"
+        router.failure("a")
+    assert router.select(["a"]) is None
+    assert router.wait_time(["a"]) == 5
+
+    clock.now += 5
+    # Half open: a single probe request is let through
+    assert router.select(["a"]) == "a"
+    assert router.select(["a"]) is None
+    router.failure("a")
+    # Each further failure doubles the open time
+    assert router.wait_time(["a"]) == 10
+
+    clock.now += 10
+    assert router.select(["a"]) == "a"
+    router.success("a", 1.0)
+    stats = router.stats("a")
+    assert stats.consecutive_failures == 0 and stats.latency == 1.0 and stats.in_flight == 0
+    assert router.select(["a"]) == "a"
+    assert router.select(["a"]) == "a"
+
+
+def test_retry_after_keeps_an_endpoint_out_of_rotation(clock: FakeClock) -> None:
+    router = EndpointRouter()
+
+    assert router.select(["a", "b"], is_available=lambda endpoint_id: endpoint_id == "a") == "a"
+    router.failure("a", retry_after=30)
+    assert router.select(["a", "b"]) == "b"
+    assert router.wait_time(["a"]) == 30
+    clock.now += 30
+    assert router.select(["a"]) == "a"
+
+
+def test_retry_after_seconds_parses_headers(clock: FakeClock) -> None:
+    assert retry_after_seconds({"retry-after": "12"}) == 12
+    assert retry_after_seconds({"retry-after-ms": "1500", "retry-after": "12"}) == 1.5
+    assert retry_after_seconds({"retry-after": formatdate(clock.now + 20, usegmt=True)}) == 20
+    assert retry_after_seconds({"retry-after": "soon"}) is None
+    assert retry_after_seconds({}) is None
+
+
+def test_backoff_delay_is_jittered_and_capped() -> None:
+    delays = [backoff_delay(attempt, base=0.5, cap=4) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import time
+import threading
+from concurrent.futures import ALL_COMPLETED
+
+import pytest
+
+from utilities.general.executor import BoundedExecutor, get_shared_executor
+
+
+@pytest.fixture
+def executor() -> BoundedExecutor:
+    bounded_executor = BoundedExecutor("test", max_workers=2)
+    yield bounded_executor
+    bounded_executor.shutdown()
+
+
+def test_run_all_returns_futures_in_call_order(executor: BoundedExecutor) -> None:
+    futures = executor.run_all([lambda value=value: value * 2 for value in range(5)])
+
+    assert [future.result() for future in futures] == [0, 2, 4, 6, 8]
+    assert executor.metrics()["completed"] == 5
+    assert executor.metrics()["queued"] == 0
+
+
+def test_run_all_respects_max_concurrency(executor: BoundedExecutor) -> None:
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def call() -> None:
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+
+    executor.run_all([call] * 6, max_concurrency=1)
+
+    assert max_running == 1
+
+
+def test_first_exception_cancels_queued_siblings(executor: BoundedExecutor) -> None:
+    started: list[int] = []
+
+    def fail() -> None:
+        started.append(0)
+        raise ValueError("boom")
+
+    def slow(index: int) -> None:
+        started.append(index)
+        time.sleep(0.05)
+
+    futures = executor.run_all([fail] + [lambda index=index: slow(index) for index in range(1, 6)], max_concurrency=1)
+
+    assert isinstance(futures[0].exception(), ValueError)
+    assert all(future.cancelled() for future in futures[1:])
+    assert started == [0]
+
+
+def test_all_completed_runs_every_call(executor: BoundedExecutor) -> None:
+    def fail() -> None:
+        raise ValueError("boom")
+
+    futures = executor.run_all([fail, lambda: 1, lambda: 2], return_when=ALL_COMPLETED)
+
+    assert isinstance(futures[0].exception(), ValueError)
+    assert [future.result() for future in futures[1:]] == [1, 2]
+    assert executor.metrics()["failed"] == 1
+
+
+def test_shared_executor_is_created_once() -> None:
+    assert get_shared_executor("test-shared", max_workers=3) is get_shared_executor("test-shared")
+    assert get_shared_executor("test-shared").max_workers == 3
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from utilities.network import http_clients
+
+
+class FakeSettings:
+    values: dict = {"use_system_proxy": False, "skip_ssl_verification": False}
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+@pytest.fixture(autouse=True)
+def fake_settings(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(http_clients, "Settings", FakeSettings)
+    monkeypatch.setattr(FakeSettings, "values", {"use_system_proxy": False, "skip_ssl_verification": False})
+    http_clients.reset_httpx_clients()
+    yield
+    http_clients.close_httpx_clients()
+
+
+def test_sync_client_is_shared_until_settings_change() -> None:
+    client = http_clients.get_httpx_client()
+    assert http_clients.get_httpx_client(is_async=False) is client
+
+    FakeSettings.values = {"use_system_proxy": False, "skip_ssl_verification": True}
+    # The settings are re-read only after the TTL or a reset
+    assert http_clients.get_httpx_client() is client
+    http_clients.reset_httpx_clients()
+    assert http_clients.get_httpx_client() is not client
+
+
+def test_closed_client_is_replaced() -> None:
+    client = http_clients.get_httpx_client()
+    client.close()
+    assert http_clients.get_httpx_client() is not client
+
+
+def test_async_clients_are_kept_per_event_loop() -> None:
+    async def get_twice():
+        return http_clients.get_httpx_client(is_async=True), http_clients.get_httpx_client(is_async=True)
+
+    first, again = asyncio.run(get_twice())
+    other, _ = asyncio.run(get_twice())
+    assert first is again
+    assert other is not first
+
+
+def test_llm_client_is_a_shared_httpx2_client() -> None:
+    import httpx2
+
+    client = http_clients.get_llm_http_client()
+    assert isinstance(client, httpx2.Client)
+    assert http_clients.get_llm_http_client() is client
+    assert http_clients.get_httpx_client() is not client
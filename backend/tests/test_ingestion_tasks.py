@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from peewee import SqliteDatabase
+
+from background_task import ingestion_tasks
+from models import User, UserObject, UserObjectContent, UserVectorDatabase
+
+
+MODELS = [User, UserVectorDatabase, UserObject, UserObjectContent]
+
+
+@pytest.fixture
+def vector_database() -> UserVectorDatabase:
+    test_database = SqliteDatabase(":memory:", check_same_thread=False)
+    with test_database.bind_ctx(MODELS):
+        test_database.create_tables(MODELS)
+        yield UserVectorDatabase.create(name="docs", status="VALID", embedding_provider="openai", embedding_model="m", embedding_size=3)
+    test_database.close()
+
+
+def test_ingest_files_parses_in_pool_and_queues_embedding(vector_database: UserVectorDatabase, tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    files = []
+    for index in range(5):
+        path = tmp_path / f"doc{index}.txt"
+        path.write_text(f"first paragraph {index}\n\nsecond paragraph {index}", encoding="utf-8")
+        files.append(str(path))
+    files.append(str(tmp_path / "missing.docx"))
+    user_objects = [
+        UserObject.create(title=file, data_type="TEXT", vector_database=vector_database, raw_data={"file": file}, status="PR") for file in files
+    ]
+
+    in_flight = 0
+    max_in_flight = 0
+
+    def read_and_split_file(file, rules):
+        if file.endswith(".docx"):
+            raise FileNotFoundError(file)
+        text = open(file, encoding="utf-8").read()
+        return text, [{"index": index, "text": part, "word_counts": len(part), "hash": str(index)} for index, part in enumerate(text.split("\n\n"))]
+
+    class CountingPool(ThreadPoolExecutor):
+        def submit(self, fn, *args):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            future = super().submit(fn, *args)
+
+            def _done(_future):
+                nonlocal in_flight
+                in_flight -= 1
+
+            future.add_done_callback(_done)
+            return future
+
+    pool = CountingPool(max_workers=1)
+    queued = []
+    progress = []
+    monkeypatch.setattr(ingestion_tasks, "get_ingestion_pool", lambda: (pool, 1))
+    monkeypatch.setattr(ingestion_tasks, "read_and_split_file", read_and_split_file)
+    monkeypatch.setattr(ingestion_tasks.embedding_and_upload, "delay", lambda **kwargs: queued.append(kwargs))
+    monkeypatch.setattr(ingestion_tasks, "set_object_progress", lambda vid, object_id, **kwargs: progress.append((object_id, kwargs)))
+
+    # 排队期间被删除的对象被跳过 / An object deleted while queued is skipped
+    object_ids = [user_object.oid.hex for user_object in user_objects]
+    object_ids.insert(1, uuid.uuid4().hex)
+    ingestion_tasks.ingest_files(vector_database.vid.hex, object_ids, {"split_method": "general"})
+    pool.shutdown()
+
+    assert max_in_flight <= ingestion_tasks.DOCUMENTS_PER_PROCESS
+    assert {kwargs["object_id"]: kwargs["input"] for kwargs in queued} == {
+        user_object.oid.hex: [f"first paragraph {index}", f"second paragraph {index}"] for index, user_object in enumerate(user_objects[:5])
+    }
+    assert (user_objects[0].oid.hex, {"stage": "parsing"}) in progress
+
+    stored = UserObject.get(UserObject.oid == user_objects[0].oid)
+    assert stored.info["paragraph_counts"] == 2
+    assert stored.load_raw_data()["segments"][1]["text"] == "second paragraph 0"
+    assert stored.raw_data == {"file": files[0]}
+    assert UserObject.get(UserObject.oid == user_objects[5].oid).status == "IN"
+
+
+def test_ingest_files_recovers_from_a_broken_process_pool(vector_database: UserVectorDatabase, tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    files = []
+    for index in range(3):
+        path = tmp_path / f"doc{index}.txt"
+        path.write_text(f"paragraph {index}", encoding="utf-8")
+        files.append(str(path))
+    user_objects = [
+        UserObject.create(title=file, data_type="TEXT", vector_database=vector_database, raw_data={"file": file}, status="PR") for file in files
+    ]
+
+    def read_and_split_file(file, rules):
+        text = open(file, encoding="utf-8").read()
+        return text, [{"index": 0, "text": text, "word_counts": len(text), "hash": "0"}]
+
+    class BrokenPool:
+        # 第一个文档的解析进程崩溃，之后的提交都失败
+        # The parser of the first document crashes and every later submit fails
+        def __init__(self):
+            self.submitted = 0
+
+        def submit(self, fn, *args):
+            self.submitted += 1
+            if self.submitted > 1:
+                raise BrokenProcessPool("pool is broken")
+            future = Future()
+            future.set_exception(BrokenProcessPool("a child process terminated abruptly"))
+            return future
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            pass
+
+    broken_pool = BrokenPool()
+    healthy_pool = ThreadPoolExecutor(max_workers=1)
+    created = iter([healthy_pool])
+
+    monkeypatch.setattr(ingestion_tasks, "_INGESTION_POOL", broken_pool)
+    monkeypatch.setattr(ingestion_tasks, "_INGESTION_POOL_SIZE", 1)
+    monkeypatch.setattr(ingestion_tasks, "ProcessPoolExecutor", lambda **kwargs: next(created))
+    monkeypatch.setattr(ingestion_tasks, "read_and_split_file", read_and_split_file)
+    queued = []
+    monkeypatch.setattr(ingestion_tasks.embedding_and_upload, "delay", lambda **kwargs: queued.append(kwargs["object_id"]))
+    monkeypatch.setattr(ingestion_tasks, "set_object_progress", lambda vid, object_id, **kwargs: None)
+
+    ingestion_tasks.ingest_files(vector_database.vid.hex, [user_object.oid.hex for user_object in user_objects], {"split_method": "general"})
+    healthy_pool.shutdown()
+
+    assert UserObject.get(UserObject.oid == user_objects[0].oid).status == "IN"
+    assert sorted(queued) == sorted(user_object.oid.hex for user_object in user_objects[1:])
+    assert ingestion_tasks.get_ingestion_pool()[0] is healthy_pool
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from utilities.ai_utils.llm_response_cache import LLMResponseCache, llm_response_cache_key, response_cache_enabled
+
+
+@pytest.fixture
+def response_cache(tmp_path) -> LLMResponseCache:
+    response_cache = LLMResponseCache(tmp_path / "llm_response_cache", size_limit=1024**2)
+    yield response_cache
+    response_cache.cache.close()
+
+
+def test_cache_mode_bypasses_sampling_temperatures_unless_forced() -> None:
+    assert response_cache_enabled("auto", 0)
+    assert response_cache_enabled("auto", None)
+    assert not response_cache_enabled("auto", 0.7)
+    assert response_cache_enabled("force", 0.7)
+    assert not response_cache_enabled("off", 0)
+    assert not response_cache_enabled(None, 0)
+
+
+def test_key_covers_every_parameter_that_changes_the_output() -> None:
+    messages = [{"role": "user", "content": "你好"}]
+    key = llm_response_cache_key("openai", "gpt-4o", messages, 0, None, None, top_p=1)
+
+    assert key == llm_response_cache_key("openai", "gpt-4o", [{"content": "你好", "role": "user"}], 0, None, None, top_p=1)
+    assert key.startswith("openai:gpt-4o:")
+    assert key != llm_response_cache_key("openai", "gpt-4o-mini", messages, 0, None, None, top_p=1)
+    assert key != llm_response_cache_key("openai", "gpt-4o", messages, 0.2, None, None, top_p=1)
+    assert key != llm_response_cache_key("openai", "gpt-4o", messages, 0, [{"type": "function"}], None, top_p=1)
+    assert key != llm_response_cache_key("openai", "gpt-4o", messages, 0, None, {"type": "json_object"}, top_p=1)
+    assert key != llm_response_cache_key("openai", "gpt-4o", messages, 0, None, None, top_p=0.5)
+
+
+def test_entries_expire_after_ttl(response_cache: LLMResponseCache) -> None:
+    output = {"content_output": "hi", "prompt_tokens": 3, "completion_tokens": 1}
+
+    response_cache.set("kept", output, ttl=60)
+    response_cache.set("expired", output, ttl=0.05)
+    time.sleep(0.1)
+
+    assert response_cache.get("kept") == output
+    assert response_cache.get("expired") is None
+    stats = response_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from utilities.workflow.node_stream import NodeDataStream, NodeStreamRegistry
+
+
+def test_read_returns_items_after_cursor() -> None:
+    stream = NodeDataStream()
+    for index in range(3):
+        stream.append({"content": str(index)})
+
+    assert stream.read(1, timeout=0) == [{"content": "1"}, {"content": "2"}]
+    assert stream.read(3, timeout=0) == []
+
+
+def test_read_blocks_until_new_item() -> None:
+    stream = NodeDataStream()
+    threading.Timer(0.05, stream.append, args=({"content": "hi"},)).start()
+
+    start = time.time()
+    items = stream.read(0, timeout=5)
+
+    assert items == [{"content": "hi"}]
+    assert time.time() - start < 5
+
+
+def test_end_marker_closes_stream() -> None:
+    stream = NodeDataStream()
+    stream.append({"end": True})
+
+    assert stream.closed
+    assert stream.read(1, timeout=5) == []
+
+
+def test_registry_drops_expired_streams() -> None:
+    registry = NodeStreamRegistry(expire=0)
+    old_stream = registry.get("run-1", "node-1")
+    old_stream.updated_at -= 1
+
+    registry.get("run-1", "node-2")
+
+    assert registry.get("run-1", "node-1") is not old_stream
+
+
+def test_finish_wakes_readers_waiting_past_an_end_marker() -> None:
+    stream = NodeDataStream()
+    stream.append({"content": "hi"})
+    stream.append({"end": True})
+    threading.Timer(0.05, stream.finish).start()
+
+    # An end marker from a single request does not end the read, the source node finishing does
+    start = time.time()
+    assert stream.read(2, timeout=5, until_finished=True) == []
+    assert stream.finished
+    assert time.time() - start < 5
+
+
+def test_finish_appends_end_marker_to_open_stream() -> None:
+    stream = NodeDataStream()
+    stream.append({"content": "hi"})
+    stream.finish()
+
+    assert stream.read(0, timeout=0) == [{"content": "hi"}, {"end": True}]
+
+
+def test_registry_keeps_live_streams() -> None:
+    registry = NodeStreamRegistry(expire=0)
+    live_stream = registry.open("run-1", "node-1")
+    live_stream.updated_at -= 1
+
+    registry.get("run-1", "node-2")
+
+    assert registry.find("run-1", "node-1") is live_stream
@@ -62,3 +62,248 @@ def test_search_points_sync_uses_query_points_and_returns_payloads(monkeypatch:
         "with_payload": True,
         "with_vectors": False,
     }
+
+
+def test_split_embedding_batches_respects_count_and_token_budget(monkeypatch: pytest.MonkeyPatch) -> None:
+    from utilities.ai_utils import embeddings
+
+    monkeypatch.setattr(embeddings, "get_token_counts", lambda text, model, use_token_server_first: len(text))
+
+    batches = list(embeddings.split_embedding_batches(["aa", "bb", "cc", "d" * 20, "ee"], batch_size=2, batch_tokens=10))
+
+    assert batches == [(0, ["aa", "bb"]), (2, ["cc"]), (3, ["d" * 20]), (4, ["ee"])]
+
+
+def test_embedding_and_upload_upserts_one_bulk_request_per_batch(monkeypatch: pytest.MonkeyPatch) -> None:
+    embed_calls: list[list[str]] = []
+    upserts: list[dict[str, object]] = []
+    progress: list[dict[str, int]] = []
+    valid_objects: list[str] = []
+
+    class _FakeEmbeddingClient:
+        def __init__(self, **kwargs: object) -> None:
+            pass
+
+        def get(self, texts: list[str]) -> list[list[float]]:
+            embed_calls.append(texts)
+            return [[float(len(text))] for text in texts]
+
+    class _FakeClient:
+        def upsert(self, **kwargs: object) -> None:
+            upserts.append(kwargs)
+
+    monkeypatch.setattr(qdrant_tasks, "EmbeddingClient", _FakeEmbeddingClient)
+    monkeypatch.setattr(qdrant_tasks, "get_qdrant_client", lambda: _FakeClient())
+    monkeypatch.setattr(qdrant_tasks, "Settings", lambda: SimpleNamespace(get=lambda key, default: {"vector_database.embedding_batch_size": 2}.get(key, default)))
+    monkeypatch.setattr(qdrant_tasks, "split_embedding_batches", lambda texts, size, tokens: ((i, list(texts[i : i + size])) for i in range(0, len(texts), size)))
+    monkeypatch.setattr(qdrant_tasks, "cache", SimpleNamespace(set=lambda key, value, expire: progress.append(value)))
+    monkeypatch.setattr(qdrant_tasks, "_mark_object_valid", lambda vid, object_id: valid_objects.append(object_id))
+
+    result = qdrant_tasks.embedding_and_upload(
+        vid="db-1",
+        object_id="obj-1",
+        input=["a", "bb", "ccc"],
+        embedding_provider="openai",
+        embedding_model="text-embedding-3-small",
+        embedding_type="text",
+    )
+
+    assert result is True
+    assert embed_calls == [["a", "bb"], ["ccc"]]
+    assert [len(upsert["points"]) for upsert in upserts] == [2, 1]
+    assert all(upsert["collection_name"] == "db-1_text_collection" for upsert in upserts)
+    assert progress == [
+        {"stage": "embedding", "chunk_index": 1, "chunk_count": 3},
+        {"stage": "embedding", "chunk_index": 2, "chunk_count": 3},
+    ]
+    assert valid_objects == ["obj-1"]
+
+    # Point ids are derived from the chunk content so a retried task overwrites the same points
+    first_ids = [point.id for point in upserts[0]["points"]]
+    assert first_ids == qdrant_tasks.chunk_point_ids("obj-1", [qdrant_tasks.chunk_hash("a"), qdrant_tasks.chunk_hash("bb")])
+
+
+def test_embedding_and_upload_only_embeds_changed_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    embed_calls: list[list[str]] = []
+    upserted: list[dict] = []
+    deleted: list[list[str] | None] = []
+    moved: list[dict[str, int]] = []
+
+    class _FakeEmbeddingClient:
+        def __init__(self, **kwargs: object) -> None:
+            pass
+
+        def get(self, texts: list[str]) -> list[list[float]]:
+            embed_calls.append(texts)
+            return [[1.0] for _ in texts]
+
+    monkeypatch.setattr(qdrant_tasks, "EmbeddingClient", _FakeEmbeddingClient)
+    monkeypatch.setattr(qdrant_tasks, "Settings", lambda: SimpleNamespace(get=lambda key, default: default))
+    monkeypatch.setattr(qdrant_tasks, "split_embedding_batches", lambda texts, size, tokens: iter([(0, list(texts))] if texts else []))
+    monkeypatch.setattr(qdrant_tasks, "upsert_points_sync", lambda vid, points: upserted.extend(points))
+    monkeypatch.setattr(qdrant_tasks, "delete_object_points_sync", lambda vid, object_id, point_ids=None: deleted.append(point_ids))
+    monkeypatch.setattr(qdrant_tasks, "set_chunk_indexes_sync", lambda vid, chunk_indexes: moved.append(chunk_indexes))
+    monkeypatch.setattr(qdrant_tasks, "cache", SimpleNamespace(set=lambda key, value, expire: None))
+    monkeypatch.setattr(qdrant_tasks, "_mark_object_valid", lambda vid, object_id: None)
+
+    previous = ["intro", "old detail", "outro"]
+    current = ["new header", "intro", "outro"]
+    qdrant_tasks.embedding_and_upload(
+        vid="db-1",
+        object_id="obj-1",
+        input=current,
+        embedding_provider="openai",
+        embedding_model="text-embedding-3-small",
+        embedding_type="text",
+        previous_chunk_hashes=[qdrant_tasks.chunk_hash(text) for text in previous],
+    )
+
+    previous_ids = qdrant_tasks.chunk_point_ids("obj-1", [qdrant_tasks.chunk_hash(text) for text in previous])
+    assert embed_calls == [["new header"]]
+    assert [(point["text"], point["chunk_index"]) for point in upserted] == [("new header", 0)]
+    assert deleted == [[previous_ids[1]]]
+    assert moved == [{previous_ids[0]: 1}]
+
+
+def test_embedding_and_upload_marks_object_invalid_after_last_retry(monkeypatch: pytest.MonkeyPatch) -> None:
+    from celery.exceptions import MaxRetriesExceededError
+
+    invalid_objects: list[str] = []
+
+    class _FailingEmbeddingClient:
+        def __init__(self, **kwargs: object) -> None:
+            pass
+
+        def get(self, texts: list[str]) -> list[list[float]]:
+            raise RuntimeError("embedding service unavailable")
+
+    def _retry(**kwargs: object) -> None:
+        raise MaxRetriesExceededError()
+
+    monkeypatch.setattr(qdrant_tasks, "EmbeddingClient", _FailingEmbeddingClient)
+    monkeypatch.setattr(qdrant_tasks, "Settings", lambda: SimpleNamespace(get=lambda key, default: default))
+    monkeypatch.setattr(qdrant_tasks, "split_embedding_batches", lambda texts, size, tokens: iter([(0, list(texts))]))
+    monkeypatch.setattr(qdrant_tasks, "delete_object_points_sync", lambda vid, object_id, point_ids=None: None)
+    monkeypatch.setattr(qdrant_tasks, "set_chunk_indexes_sync", lambda vid, chunk_indexes: None)
+    monkeypatch.setattr(qdrant_tasks, "_mark_object_invalid", invalid_objects.append)
+    monkeypatch.setattr(qdrant_tasks.embedding_and_upload, "retry", _retry)
+
+    result = qdrant_tasks.embedding_and_upload(
+        vid="db-1",
+        object_id="obj-1",
+        input=["a"],
+        embedding_provider="openai",
+        embedding_model="text-embedding-3-small",
+        embedding_type="text",
+    )
+
+    assert result is False
+    assert invalid_objects == ["obj-1"]
+
+
+def test_chunk_point_ids_distinguish_repeated_chunks() -> None:
+    hashes = [qdrant_tasks.chunk_hash("same"), qdrant_tasks.chunk_hash("same")]
+
+    first, second = qdrant_tasks.chunk_point_ids("obj-1", hashes)
+
+    assert first != second
+    assert qdrant_tasks.chunk_point_ids("obj-1", hashes[:1]) == [first]
+    assert qdrant_tasks.segment_chunk_hashes([{"text": "a", "hash": "h1"}]) == ["h1"]
+    assert qdrant_tasks.segment_chunk_hashes([{"text": "a"}]) is None
+
+
+def test_search_points_batch_sync_runs_all_queries_in_one_call(monkeypatch: pytest.MonkeyPatch) -> None:
+    from qdrant_client import QdrantClient
+    from qdrant_client.http.models import Distance, VectorParams
+
+    client = QdrantClient(location=":memory:")
+    client.create_collection("db-1_text_collection", vectors_config=VectorParams(size=2, distance=Distance.COSINE))
+    monkeypatch.setattr(qdrant_tasks, "get_qdrant_client", lambda: client)
+    qdrant_tasks.upsert_points_sync(
+        "db-1",
+        [
+            {"object_id": "obj-1", "text": "x", "embedding": [1.0, 0.0], "chunk_index": 0},
+            {"object_id": "obj-1", "text": "y", "embedding": [0.0, 1.0], "chunk_index": 1},
+        ],
+    )
+
+    batch_calls: list[int] = []
+    query_batch_points = client.query_batch_points
+
+    def _query_batch_points(**kwargs: object) -> list:
+        batch_calls.append(len(kwargs["requests"]))
+        return query_batch_points(**kwargs)
+
+    monkeypatch.setattr(client, "query_batch_points", _query_batch_points)
+
+    results = qdrant_tasks.search_points_batch_sync("db-1", [[0.0, 1.0], [1.0, 0.1]], limit=1)
+
+    assert batch_calls == [2]
+    assert [[payload["text"] for payload in payloads] for payloads in results] == [["y"], ["x"]]
+    assert qdrant_tasks.search_points_batch_sync("db-1", []) == []
+
+
+def test_search_in_one_collection_is_not_blocked_by_writes_to_another(monkeypatch: pytest.MonkeyPatch) -> None:
+    import threading
+
+    write_started = threading.Event()
+    release_write = threading.Event()
+
+    class _FakeClient:
+        def upsert(self, **kwargs: object) -> None:
+            write_started.set()
+            release_write.wait(2)
+
+        def query_points(self, **kwargs: object) -> SimpleNamespace:
+            return SimpleNamespace(points=[SimpleNamespace(payload={"text": kwargs["collection_name"]})])
+
+    monkeypatch.setattr(qdrant_tasks, "get_qdrant_client", lambda: _FakeClient())
+
+    writer = threading.Thread(target=qdrant_tasks.upsert_points_sync, args=("db-1", [{"object_id": "obj-1", "embedding": [0.1]}]))
+    writer.start()
+    assert write_started.wait(1)
+
+    try:
+        assert qdrant_tasks.search_points_sync("db-2", [0.1]) == [{"text": "db-2_text_collection"}]
+    finally:
+        release_write.set()
+        writer.join()
+
+
+def test_hybrid_search_fuses_vector_and_keyword_results_and_reranks(monkeypatch: pytest.MonkeyPatch) -> None:
+    from utilities.text_processing.bm25 import BM25Index
+
+    keyword_index = BM25Index()
+    keyword_index.add("set MAX_RETRY_COUNT to 3", {"object_id": "obj-1", "text": "set MAX_RETRY_COUNT to 3", "chunk_index": 4})
+    keyword_index.add("unrelated", {"object_id": "obj-2", "text": "unrelated", "chunk_index": 0})
+    fetched: list[int] = []
+
+    def _search_points_batch_sync(vid: str, text_embeddings: list, limit: int = 5) -> list[list[dict]]:
+        fetched.append(limit)
+        return [[{"object_id": "obj-3", "text": "retry policy"}, {"object_id": "obj-1", "text": "set MAX_RETRY_COUNT to 3"}]]
+
+    class _FakeReranker:
+        def rank(self, query: str, documents: list[str], top_n: int | None = None) -> list[int]:
+            return sorted(range(len(documents)), key=lambda index: documents[index])
+
+    monkeypatch.setattr(qdrant_tasks, "search_points_batch_sync", _search_points_batch_sync)
+    monkeypatch.setattr(qdrant_tasks.keyword_indexes, "get", lambda vid: keyword_index)
+
+    vector_only = qdrant_tasks.hybrid_search_batch_sync("db-1", ["MAX_RETRY_COUNT"], [[0.1]], limit=2)
+    assert [payload["text"] for payload in vector_only[0]] == ["retry policy", "set MAX_RETRY_COUNT to 3"]
+    assert fetched == [2]
+    fetched.clear()
+
+    fused = qdrant_tasks.hybrid_search_batch_sync("db-1", ["MAX_RETRY_COUNT"], [[0.1]], limit=2, search_mode="hybrid")
+    assert [payload["text"] for payload in fused[0]] == ["set MAX_RETRY_COUNT to 3", "retry policy"]
+    assert fetched == [2 * qdrant_tasks.CANDIDATE_FACTOR]
+
+    keyword_only = qdrant_tasks.hybrid_search_batch_sync("db-1", ["MAX_RETRY_COUNT"], None, limit=2, search_mode="keyword")
+    assert [payload["chunk_index"] for payload in keyword_only[0]] == [4]
+    assert len(fetched) == 1
+
+    reranked = qdrant_tasks.hybrid_search_batch_sync("db-1", ["MAX_RETRY_COUNT"], [[0.1]], limit=1, search_mode="hybrid", reranker=_FakeReranker())
+    assert [payload["text"] for payload in reranked[0]] == ["retry policy"]
+
+    with pytest.raises(ValueError):
+        qdrant_tasks.hybrid_search_batch_sync("db-1", ["q"], [[0.1]], search_mode="sparse")
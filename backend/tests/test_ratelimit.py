@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+from diskcache import Cache
+
+from utilities.general import ratelimit
+from utilities.general.ratelimit import DiskCacheRateLimitStore, RateLimiter, estimate_tokens
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def test_requests_burst_up_to_rpm_then_refill_evenly(clock: FakeClock) -> None:
+    limiter = RateLimiter()
+
+    assert [limiter.try_acquire("endpoint", rpm=3) for _ in range(4)] == [True, True, True, False]
+    clock.now += 19
+    assert not limiter.try_acquire("endpoint", rpm=3)
+    clock.now += 1
+    assert limiter.try_acquire("endpoint", rpm=3)
+    assert limiter.try_acquire("other", rpm=3)
+
+
+def test_tokens_are_reserved_and_corrected_with_actual_usage(clock: FakeClock) -> None:
+    limiter = RateLimiter()
+
+    assert limiter.try_acquire("endpoint", rpm=100, tpm=1000, tokens=600)
+    # Not enough tokens left, and the failed check reserves nothing
+    assert not limiter.try_acquire("endpoint", rpm=100, tpm=1000, tokens=600)
+    limiter.record("endpoint", tpm=1000, tokens=-400)
+    assert limiter.try_acquire("endpoint", rpm=100, tpm=1000, tokens=600)
+    # A single request larger than the whole budget still passes once the bucket is full
+    clock.now += 60
+    assert limiter.try_acquire("endpoint", rpm=100, tpm=1000, tokens=5000)
+
+
+def test_acquire_waits_until_allowed_or_timeout(clock: FakeClock) -> None:
+    limiter = RateLimiter()
+    for _ in range(2):
+        assert limiter.acquire("endpoint", rpm=2)
+
+    assert not limiter.acquire("endpoint", rpm=2, timeout=10)
+    start = clock.now
+    assert limiter.acquire("endpoint", rpm=2, timeout=60)
+    assert clock.now - start == pytest.approx(30)
+
+
+def test_diskcache_store_is_shared_between_limiters(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = Cache(tmp_path / "cache")
+    monkeypatch.setattr(DiskCacheRateLimitStore, "cache", cache)
+    first = RateLimiter(DiskCacheRateLimitStore())
+    second = RateLimiter(DiskCacheRateLimitStore())
+
+    results = []
+    threads = [threading.Thread(target=lambda limiter=limiter: results.append(limiter.try_acquire("shared", rpm=5))) for limiter in [first, second] * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.close()
+
+    assert sorted(results) == [False, False, False, True, True, True, True, True]
+
+
+def test_estimate_tokens_counts_cjk_characters() -> None:
+    assert estimate_tokens("向量数据库") == 5
+    assert estimate_tokens("a" * 40) == 10
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import sqlite3
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+from utilities.database import close_connection_pool, create_from_table, get_schema_from_table, iter_table_chunks
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    path = (tmp_path / "import.db").as_posix()
+    yield path
+    close_connection_pool(path)
+
+
+def test_csv_import_streams_chunks_with_progress(tmp_path, database_path: str) -> None:
+    csv_path = tmp_path / "items.csv"
+    csv_path.write_text("item name,price\n" + "".join(f"item {index},{index}.5\n" for index in range(7)) + "last,\n", encoding="utf-8")
+
+    chunks = list(iter_table_chunks(csv_path, is_excel=False, chunksize=3))
+    assert [len(chunk) for chunk, _fraction in chunks] == [3, 3, 2]
+    assert chunks[-1][1] == 1.0
+
+    columns_info = get_schema_from_table(csv_path, is_excel=False, sample_rows=3)
+    assert columns_info == [{"name": "item_name", "type": "VARCHAR", "max_length": 6}, {"name": "price", "type": "REAL", "max_length": None}]
+
+    progress = []
+    create_from_table(csv_path, "items", database_path, columns_info, is_excel=False, progress=lambda rows, fraction: progress.append(rows))
+
+    connection = sqlite3.connect(database_path)
+    assert connection.execute('SELECT COUNT(*), SUM("price") FROM "items"').fetchone() == (8, 24.5)
+    assert connection.execute('SELECT "price" FROM "items" WHERE "item_name" = \'last\'').fetchone() == (None,)
+    connection.close()
+    assert progress == [8]
+
+
+def test_xlsx_import_reads_rows_in_read_only_mode(tmp_path, database_path: str) -> None:
+    xlsx_path = tmp_path / "events.xlsx"
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.append(["name", "count", "time"])
+    for index in range(5):
+        worksheet.append([f"event {index}", index, datetime(2026, 1, index + 1, 8, 30)])
+    workbook.save(xlsx_path)
+
+    assert [len(chunk) for chunk, _fraction in iter_table_chunks(xlsx_path, is_excel=True, chunksize=2)] == [2, 2, 1]
+
+    columns_info = get_schema_from_table(xlsx_path, is_excel=True)
+    create_from_table(xlsx_path, "events", database_path, columns_info, is_excel=True)
+
+    connection = sqlite3.connect(database_path)
+    assert connection.execute('SELECT "name", "count", "time" FROM "events" ORDER BY rowid LIMIT 1').fetchone() == (
+        "event 0",
+        0,
+        "2026-01-01 08:30:00",
+    )
+    assert connection.execute('SELECT COUNT(*) FROM "events"').fetchone() == (5,)
+    connection.close()
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+
+import pytest
+from peewee import SqliteDatabase
+
+from models import User, UserRelationalDatabase, UserRelationalTable
+from utilities.database import SQLiteConnectionPool, UserDatabaseControl, close_connection_pool
+
+
+MODELS = [User, UserRelationalDatabase, UserRelationalTable]
+
+
+@pytest.fixture
+def user_database(tmp_path) -> UserRelationalDatabase:
+    database_path = (tmp_path / "user.db").as_posix()
+    sqlite3.connect(database_path).close()
+    test_database = SqliteDatabase(":memory:")
+    with test_database.bind_ctx(MODELS):
+        test_database.create_tables(MODELS)
+        database = UserRelationalDatabase.create(name="db", database_path=database_path)
+        UserRelationalTable.create(name="items", database=database, schema={"columns": []})
+        control = UserDatabaseControl(database)
+        control.run_sql('CREATE TABLE "items" ("name" VARCHAR(32), "price" REAL)')
+        yield database
+    close_connection_pool(database_path)
+    test_database.close()
+
+
+def test_pool_reuses_connections_in_wal_mode(tmp_path) -> None:
+    pool = SQLiteConnectionPool((tmp_path / "pool.db").as_posix(), pool_size=2)
+
+    with pool.connection() as first:
+        assert first.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        first.execute("CREATE TABLE t (x)")
+        # Uncommitted work is rolled back when the connection goes back to the pool
+        first.execute("INSERT INTO t VALUES (1)")
+    with pool.connection() as again:
+        assert again is first
+        assert again.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+    borrowed = []
+    release = threading.Event()
+
+    def borrow():
+        with pool.connection() as connection:
+            borrowed.append(connection)
+            release.wait(5)
+
+    threads = [threading.Thread(target=borrow) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len({id(connection) for connection in borrowed}) <= 2
+    pool.close()
+
+
+def test_row_counts_are_cached_and_maintained_on_write(user_database: UserRelationalDatabase) -> None:
+    control = UserDatabaseControl(user_database)
+    pool = control.pool
+
+    assert control.add("items", [{"name": "a", "price": 1.0}, {"name": "b", "price": 2.0}, {"name": "c"}]) == 3
+    counts = []
+    original_count = pool.row_count
+    pool.row_count = lambda table_name, count: original_count(table_name, lambda: counts.append(table_name) or count())
+
+    page = control.get("items", page_num=1, page_size=2, sort_field="price", sort_order="descend")
+    assert [record["name"] for record in page["records"]] == ["b", "a"]
+    assert page["total"] == 3
+
+    assert control.delete("items", [record["rowid"] for record in page["records"]]) == 1
+    assert control.add("items", [{"name": "d"}]) == 2
+    assert control.get("items", page_num=1, page_size=10, sort_field="", sort_order="")["total"] == 2
+    assert counts == []
+    assert UserRelationalTable.get(UserRelationalTable.name == "items").current_rows == 2
+
+    # Arbitrary SQL drops the cached counts
+    control.run_sql('DELETE FROM "items"')
+    assert control.get_table_max_rows("items") == 0
+    assert counts == ["items"]
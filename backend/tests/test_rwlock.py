@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from utilities.general.rwlock import KeyedReadWriteLocks, ReadWriteLock
+
+
+def test_readers_share_the_lock_and_writers_wait_for_them() -> None:
+    lock = ReadWriteLock()
+    events: list[str] = []
+    both_reading = threading.Barrier(2, timeout=2)
+
+    def reader(name: str) -> None:
+        with lock.read():
+            # Both readers must be inside at once or the barrier times out
+            both_reading.wait()
+            time.sleep(0.05)
+            events.append(f"{name}-done")
+
+    def writer() -> None:
+        with lock.write():
+            events.append("writer")
+
+    readers = [threading.Thread(target=reader, args=(name,)) for name in ("r1", "r2")]
+    for thread in readers:
+        thread.start()
+    time.sleep(0.01)
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    for thread in readers + [writer_thread]:
+        thread.join(timeout=2)
+
+    assert events[-1] == "writer"
+    assert sorted(events[:2]) == ["r1-done", "r2-done"]
+
+
+def test_waiting_writer_blocks_new_readers() -> None:
+    lock = ReadWriteLock()
+    order: list[str] = []
+    first_reader_in = threading.Event()
+    release_first_reader = threading.Event()
+
+    def first_reader() -> None:
+        with lock.read():
+            first_reader_in.set()
+            release_first_reader.wait(2)
+
+    def writer() -> None:
+        with lock.write():
+            order.append("writer")
+
+    def late_reader() -> None:
+        with lock.read():
+            order.append("late-reader")
+
+    threads = [threading.Thread(target=first_reader)]
+    threads[0].start()
+    first_reader_in.wait(2)
+    threads.append(threading.Thread(target=writer))
+    threads[1].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=late_reader))
+    threads[2].start()
+    time.sleep(0.05)
+    release_first_reader.set()
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert order == ["writer", "late-reader"]
+
+
+def test_keyed_locks_do_not_block_other_keys() -> None:
+    locks = KeyedReadWriteLocks()
+    acquired = threading.Event()
+
+    def other_key_writer() -> None:
+        with locks.write("b"):
+            acquired.set()
+
+    with locks.write("a"):
+        thread = threading.Thread(target=other_key_writer)
+        thread.start()
+        assert acquired.wait(1)
+    thread.join()
+    assert locks.get("a") is locks.get("a")
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import pytest
+from peewee import SqliteDatabase
+
+from background_task.keyword_index import build_keyword_index
+from models import User, UserObject, UserObjectContent, UserVectorDatabase
+
+
+MODELS = [User, UserVectorDatabase, UserObject, UserObjectContent]
+
+
+@pytest.fixture
+def vector_database() -> UserVectorDatabase:
+    test_database = SqliteDatabase(":memory:")
+    with test_database.bind_ctx(MODELS):
+        test_database.create_tables(MODELS)
+        yield UserVectorDatabase.create(name="docs", status="VALID")
+    test_database.close()
+
+
+def test_text_and_segments_are_stored_outside_the_object_row(vector_database: UserVectorDatabase) -> None:
+    user_object = UserObject.create(title="doc", data_type="TEXT", vector_database=vector_database, source_url="https://example.com")
+    user_object.save_raw_data(
+        {
+            "text": "向量数据库 MAX_RETRY_COUNT",
+            "source_url": "https://example.com",
+            "segments": [{"text": "向量数据库", "hash": "h1"}, {"text": "MAX_RETRY_COUNT", "hash": "h2"}],
+        }
+    )
+
+    stored = UserObject.get(UserObject.oid == user_object.oid)
+    assert stored.raw_data == {"source_url": "https://example.com"}
+    assert stored.load_raw_data()["segments"][1] == {"text": "MAX_RETRY_COUNT", "hash": "h2"}
+
+    # Saving again replaces the content row instead of adding one
+    stored.save_raw_data({"text": "updated", "segments": []})
+    assert UserObjectContent.select().count() == 1
+    assert stored.load_raw_data() == {"text": "updated", "segments": []}
+
+
+def test_keyword_index_reads_segments_from_content_table(vector_database: UserVectorDatabase) -> None:
+    user_object = UserObject.create(title="doc", data_type="TEXT", vector_database=vector_database)
+    user_object.save_raw_data({"text": "a", "segments": [{"text": "retry policy"}, {"text": "set MAX_RETRY_COUNT"}]})
+
+    index = build_keyword_index(vector_database.vid.hex)
+
+    assert [(payload["text"], payload["chunk_index"]) for payload, _score in index.search("MAX_RETRY_COUNT", limit=1)] == [
+        ("set MAX_RETRY_COUNT", 1)
+    ]
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import threading
+
+from conftest import make_node
+from utilities.workflow import Workflow, parsed_workflow_scope
+
+
+def make_edge(source: str, source_handle: str, target: str, target_handle: str) -> dict:
+    return {
+        "source": source,
+        "sourceHandle": source_handle,
+        "target": target,
+        "targetHandle": target_handle,
+    }
+
+
+def make_chain_workflow(length: int) -> dict:
+    nodes = [make_node(f"node-{i}", {"input": {"value": ""}, "output": {"value": f"value-{i}"}}) for i in range(length)]
+    edges = [make_edge(f"node-{i}", "output", f"node-{i + 1}", "input") for i in range(length - 1)]
+    return {"wid": "wf-1", "rid": "run-1", "nodes": nodes, "edges": edges}
+
+
+class _CountingWorkflow(Workflow):
+    get_node_calls = 0
+
+    def get_node(self, node_id: str):
+        _CountingWorkflow.get_node_calls += 1
+        return super().get_node(node_id)
+
+
+def test_get_node_field_value_reads_connected_source_value() -> None:
+    workflow = Workflow(make_chain_workflow(3))
+
+    assert workflow.get_node_field_value("node-2", "input") == "value-1"
+    assert workflow.get_node("node-2").get_field("input")["value"] == "value-1"
+    assert workflow.get_node_field_value("node-0", "input", "default") == ""
+
+
+def test_get_node_field_value_ignores_empty_and_button_trigger_sources() -> None:
+    workflow = Workflow(
+        {
+            "nodes": [
+                make_node("trigger", {"output": {"value": "ignored"}}, node_type="ButtonTrigger"),
+                make_node("target", {"input": {"value": "own"}}),
+            ],
+            "edges": [make_edge("trigger", "output", "target", "input")],
+        }
+    )
+
+    assert workflow.get_node_field_value("target", "input") == "own"
+
+
+def test_edge_index_tracks_subworkflow_edges() -> None:
+    workflow = Workflow(make_chain_workflow(2))
+    invoke_node = workflow.get_node("node-1")
+    subworkflow = make_chain_workflow(2)
+
+    subnodes = workflow.add_subnodes_and_subedges(subworkflow, [], invoke_node)
+
+    first_id, second_id = (subnode["id"] for subnode in subnodes)
+    assert workflow.get_input_edges(second_id, "input")[0]["source"] == first_id
+    assert workflow.get_output_edges(first_id, "output")[0]["target"] == second_id
+    assert len(workflow.get_input_edges(second_id)) == 1
+
+
+def test_field_lookup_cost_does_not_grow_with_edge_count() -> None:
+    # Micro-benchmark: resolving one field must touch a constant number of nodes
+    # regardless of how many edges the workflow has.
+    calls_per_lookup = []
+    for length in (10, 1000):
+        workflow = _CountingWorkflow(make_chain_workflow(length))
+        _CountingWorkflow.get_node_calls = 0
+        workflow.get_node_field_value(f"node-{length - 1}", "input")
+        calls_per_lookup.append(_CountingWorkflow.get_node_calls)
+
+    assert calls_per_lookup[0] == calls_per_lookup[1]
+
+
+def test_mark_branch_skipped_uses_edge_index_for_deep_chains() -> None:
+    data = make_chain_workflow(500)
+    data["nodes"].append(make_node("conditional", {"true_output": {"value": ""}, "false_output": {"value": ""}}))
+    data["edges"].append(make_edge("conditional", "false_output", "node-0", "input"))
+    workflow = Workflow(data)
+
+    workflow.mark_branch_skipped("conditional", "false_output")
+
+    assert workflow.is_node_skipped("node-0") is True
+    assert workflow.is_node_skipped("node-499") is True
+
+
+def test_workflow_construction_does_not_copy_original_data() -> None:
+    data = make_chain_workflow(3)
+
+    Workflow(data)
+
+    assert "original_workflow_data" not in data
+
+
+def test_original_workflow_data_prefers_legacy_payload_copy() -> None:
+    data = make_chain_workflow(2)
+    data["original_workflow_data"] = {"nodes": [], "edges": []}
+
+    assert Workflow(data).original_workflow_data == {"nodes": [], "edges": []}
+
+
+def test_from_data_reuses_parsed_workflow_within_scope() -> None:
+    data = make_chain_workflow(3)
+    with parsed_workflow_scope():
+        workflow = Workflow(data)
+
+        assert Workflow.from_data(data) is workflow
+        assert Workflow.from_data(data).get_node("node-1") is workflow.get_node("node-1")
+        assert Workflow.from_data(make_chain_workflow(3)) is not workflow
+
+        # 其他线程不会拿到同一个实例 / Other threads never get the same instance
+        other_thread: list[Workflow] = []
+        thread = threading.Thread(target=lambda: other_thread.append(Workflow.from_data(data)))
+        thread.start()
+        thread.join()
+        assert other_thread[0] is not workflow
+
+    # 作用域结束后不再持有运行数据 / Run data is not held once the scope ends
+    assert Workflow.from_data(data) is not workflow
+
+
+def test_from_data_reparses_when_nodes_are_replaced() -> None:
+    data = make_chain_workflow(3)
+    with parsed_workflow_scope():
+        workflow = Workflow(data)
+
+        data["nodes"] = [make_node("node-x")]
+        rewrapped = Workflow.from_data(data)
+
+    assert rewrapped is not workflow
+    assert rewrapped.get_node("node-x") is not None
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import utilities.workflow.cancel as cancel_module
+from conftest import make_node
+from utilities.workflow import ReadyQueueExecutor, Workflow, WorkflowCancelled
+from utilities.workflow.cancel import (
+    cancel_checker,
+    forget_cancelled_run,
+    get_child_runs,
+    is_workflow_cancelled,
+    raise_if_cancelled,
+    register_child_runs,
+    request_cancel,
+)
+
+
+pytestmark = pytest.mark.usefixtures("disk_cache")
+
+
+def test_cancel_flag_is_visible_to_other_processes() -> None:
+    assert is_workflow_cancelled("run-1") is False
+    assert request_cancel("run-1") is True
+    assert request_cancel("run-1") is False
+
+    # Another process only sees the flag stored in the disk cache
+    cancel_module._cancelled_records.clear()
+
+    assert is_workflow_cancelled("run-1") is True
+    with pytest.raises(WorkflowCancelled):
+        raise_if_cancelled("run-1")
+    raise_if_cancelled("run-2")
+    raise_if_cancelled(None)
+
+
+def test_cancel_checker_throttles_disk_reads(disk_cache, monkeypatch: pytest.MonkeyPatch) -> None:
+    reads: list[str] = []
+    cache_get = disk_cache.get
+    monkeypatch.setattr(disk_cache, "get", lambda key, default=None: reads.append(key) or cache_get(key, default))
+    now = [100.0]
+    monkeypatch.setattr(cancel_module, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    is_cancelled = cancel_checker("run-1", interval=0.5)
+    assert [is_cancelled() for _ in range(50)] == [False] * 50
+    assert len(reads) == 1
+
+    # Another process stops the run, the next read after the interval sees it
+    disk_cache.set(cancel_module._cancel_key("run-1"), True)
+    assert is_cancelled() is False
+    now[0] += 0.5
+    assert is_cancelled() is True
+    assert len(reads) == 2
+
+    # The in-process flag is used without reading the disk again
+    assert is_cancelled() is True
+    assert len(reads) == 2
+
+
+def test_finished_runs_leave_the_in_process_flags() -> None:
+    request_cancel("run-1")
+    assert "run-1" in cancel_module._cancelled_records
+
+    forget_cancelled_run("run-1")
+
+    assert "run-1" not in cancel_module._cancelled_records
+    assert is_workflow_cancelled("run-1") is True
+
+
+def test_child_runs_are_registered_once() -> None:
+    register_child_runs("parent", ["child-1"])
+    register_child_runs("parent", ["child-1", "child-2"])
+
+    assert get_child_runs("parent") == ["child-1", "child-2"]
+
+
+def test_executor_stops_dispatching_after_cancel() -> None:
+    nodes = [make_node("first")] + [make_node(f"node-{i}") for i in range(4)]
+    edges = [{"source": "first", "sourceHandle": "output", "target": f"node-{i}", "targetHandle": "input"} for i in range(4)]
+    workflow = Workflow({"wid": "wf-1", "rid": "run-1", "nodes": nodes, "edges": edges})
+    calls: list[str] = []
+    lock = threading.Lock()
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        with lock:
+            calls.append(node_id)
+        if node_id == "first":
+            request_cancel("run-1")
+        return workflow_data
+
+    executor = ReadyQueueExecutor(workflow, run_node, is_cancelled=lambda: is_workflow_cancelled("run-1"))
+    with pytest.raises(WorkflowCancelled):
+        executor.run()
+
+    assert calls == ["first"]
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from conftest import make_node
+from utilities.workflow import DAG, ReadyQueueExecutor, Workflow, WorkflowExecutionError
+from utilities.workflow import executor as executor_module
+
+
+class _Retry(Exception):
+    def __init__(self, retry_delay: float):
+        super().__init__("retry")
+        self.retry_delay = retry_delay
+
+
+def make_edge(source: str, target: str) -> dict:
+    return {"source": source, "sourceHandle": "output", "target": target, "targetHandle": "input"}
+
+
+def make_workflow(nodes: list[dict], edges: list[tuple[str, str]]) -> Workflow:
+    return Workflow({"wid": "wf-1", "rid": "run-1", "nodes": nodes, "edges": [make_edge(*edge) for edge in edges]})
+
+
+def test_dag_critical_path_lengths_use_weights() -> None:
+    dag = DAG()
+    dag.add_edge("a", "b")
+    dag.add_edge("b", "c")
+    dag.add_edge("a", "d")
+
+    lengths = dag.critical_path_lengths({"a": 1, "b": 5, "c": 1, "d": 2})
+
+    assert lengths == {"a": 7, "b": 6, "c": 1, "d": 2}
+    assert sorted(dag.get_parents("b")) == ["a"]
+
+
+def test_node_starts_when_its_own_parents_finish() -> None:
+    # slow -> slow_child and fast -> fast_child: in the layered model fast_child waits for slow
+    workflow = make_workflow(
+        [make_node("slow"), make_node("fast"), make_node("slow_child"), make_node("fast_child")],
+        [("slow", "slow_child"), ("fast", "fast_child")],
+    )
+    finished_at: dict[str, float] = {}
+    start = time.time()
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        time.sleep(0.3 if node_id == "slow" else 0.01)
+        finished_at[node_id] = time.time() - start
+        return workflow_data
+
+    ReadyQueueExecutor(workflow, run_node, max_workers=4).run()
+
+    assert finished_at["fast_child"] < finished_at["slow"]
+    assert set(workflow.data["node_run_time"]) == {"slow", "fast", "slow_child", "fast_child"}
+
+
+def test_task_type_concurrency_limit_is_respected() -> None:
+    workflow = make_workflow([make_node(f"llm-{i}", task_name="llms.open_ai") for i in range(6)], [])
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return workflow_data
+
+    ReadyQueueExecutor(workflow, run_node, max_workers=6, task_concurrency={"llms": 2}).run()
+
+    assert max_running == 2
+
+
+def test_retry_exception_reschedules_node() -> None:
+    workflow = make_workflow([make_node("invoke", task_name="tools.workflow_invoke"), make_node("after")], [("invoke", "after")])
+    calls: list[str] = []
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        calls.append(node_id)
+        if node_id == "invoke" and calls.count("invoke") < 3:
+            raise _Retry(0.01)
+        return workflow_data
+
+    ReadyQueueExecutor(workflow, run_node, retry_exceptions=(_Retry,)).run()
+
+    assert calls == ["invoke", "invoke", "invoke", "after"]
+
+
+def test_failure_stops_dispatching_children() -> None:
+    workflow = make_workflow([make_node("broken"), make_node("child")], [("broken", "child")])
+    calls: list[str] = []
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        calls.append(node_id)
+        raise ValueError("boom")
+
+    with pytest.raises(WorkflowExecutionError) as exc_info:
+        ReadyQueueExecutor(workflow, run_node).run()
+
+    assert exc_info.value.node_id == "broken"
+    assert calls == ["broken"]
+
+
+class _WaitRetry(Exception):
+    def __init__(self, wait_for: list[str]):
+        super().__init__("retry")
+        self.retry_delay = 60
+        self.wait_for = wait_for
+
+
+def test_node_waiting_for_runs_is_woken_by_future() -> None:
+    workflow = make_workflow([make_node("invoke", task_name="tools.workflow_invoke")], [])
+    calls: list[str] = []
+    child_finished = Future()
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        calls.append(node_id)
+        if len(calls) == 1:
+            threading.Timer(0.05, child_finished.set_result, args=(None,)).start()
+            raise _WaitRetry(["child-1"])
+        return workflow_data
+
+    start = time.time()
+    ReadyQueueExecutor(
+        workflow,
+        run_node,
+        retry_exceptions=(_WaitRetry,),
+        wait_for_runs=lambda record_ids: child_finished,
+    ).run()
+
+    # The fallback delay is 60 seconds, the future wakes the node right after the child finished
+    assert calls == ["invoke", "invoke"]
+    assert time.time() - start < 5
+
+
+def make_streaming_workflow(record_id: str, target_task: str = "output.audio") -> Workflow:
+    edge = {**make_edge("llm", "output"), "targetHandle": "content", "data": {"streaming": True}}
+    llm_node = make_node("llm", task_name="llms.open_ai")
+    llm_node["data"]["template"]["output"] = {"value": ""}
+    return Workflow(
+        {
+            "wid": "wf-1",
+            "rid": record_id,
+            "nodes": [llm_node, make_node("output", task_name=target_task)],
+            "edges": [edge],
+        }
+    )
+
+
+def test_streaming_edge_lets_child_read_chunks_while_parent_runs() -> None:
+    workflow = make_streaming_workflow("run-streaming")
+    events: list[str] = []
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        node_workflow = Workflow(workflow_data)
+        if node_id == "llm":
+            for chunk in ["Hello", ", ", "world"]:
+                node_workflow.push_node_data("llm", {"content": chunk})
+                time.sleep(0.05)
+            node_workflow.push_node_data("llm", {"end": True})
+            events.append("llm finished")
+            node_workflow.update_node_field_value("llm", "output", "Hello, world!")
+        else:
+            for chunk in node_workflow.iter_node_field_chunks("output", "content"):
+                events.append(chunk)
+        return workflow_data
+
+    ReadyQueueExecutor(workflow, run_node, max_workers=2).run()
+
+    assert events.index("Hello") < events.index("llm finished")
+    # The part of the final value that was not streamed comes after the source finishes
+    assert "".join(event for event in events if event != "llm finished") == "Hello, world!"
+
+
+def test_streaming_edge_falls_back_to_whole_value() -> None:
+    workflow = make_streaming_workflow("run-streaming-whole")
+    received: list[str] = []
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        node_workflow = Workflow(workflow_data)
+        if node_id == "llm":
+            node_workflow.update_node_field_value("llm", "output", "Hello, world!")
+        else:
+            received.extend(node_workflow.iter_node_field_chunks("output", "content"))
+        return workflow_data
+
+    ReadyQueueExecutor(workflow, run_node, max_workers=2).run()
+
+    assert received == ["Hello, world!"]
+
+
+def test_failed_streaming_parent_releases_child() -> None:
+    workflow = make_streaming_workflow("run-streaming-failed")
+    received: list[str] = []
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        node_workflow = Workflow(workflow_data)
+        if node_id == "llm":
+            node_workflow.push_node_data("llm", {"content": "Hel"})
+            time.sleep(0.05)
+            raise ValueError("boom")
+        received.extend(node_workflow.iter_node_field_chunks("output", "content"))
+        return workflow_data
+
+    start = time.time()
+    with pytest.raises(WorkflowExecutionError) as exc_info:
+        ReadyQueueExecutor(workflow, run_node, max_workers=2).run()
+
+    assert exc_info.value.node_id == "llm"
+    assert time.time() - start < 5
+
+
+def test_streaming_child_is_dispatched_once_parent_runs(monkeypatch: pytest.MonkeyPatch) -> None:
+    workflow = make_streaming_workflow("run-streaming-start")
+    pool = ThreadPoolExecutor(max_workers=1)
+    gate = threading.Event()
+    # Occupy the only pool thread so the parent stays queued until the gate opens
+    pool.submit(gate.wait, 5)
+    submitted: list[tuple[str, bool]] = []
+
+    class RecordingPool:
+        def submit(self, fn, node_id: str, task_name: str) -> Future:
+            submitted.append((node_id, gate.is_set()))
+            return pool.submit(fn, node_id, task_name)
+
+    monkeypatch.setattr(executor_module, "get_shared_executor", lambda name: RecordingPool())
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        return workflow_data
+
+    threading.Timer(0.1, gate.set).start()
+    ReadyQueueExecutor(workflow, run_node, max_workers=2).run()
+    pool.shutdown()
+
+    assert submitted == [("llm", False), ("output", True)]
+
+
+def test_streaming_edge_to_task_without_stream_input_waits_for_parent() -> None:
+    workflow = make_streaming_workflow("run-streaming-unsupported", target_task="text_processing.template_compose")
+    events: list[str] = []
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        time.sleep(0.05 if node_id == "llm" else 0)
+        events.append(node_id)
+        return workflow_data
+
+    ReadyQueueExecutor(workflow, run_node, max_workers=2).run()
+
+    assert workflow.get_streaming_parents("output") == set()
+    assert events == ["llm", "output"]
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import time
+
+from diskcache import Cache
+
+from conftest import make_node
+from utilities.workflow.progress import NodeProgressAggregator, finished_nodes_key
+
+
+def test_updates_are_coalesced_into_compact_entries(disk_cache: Cache) -> None:
+    aggregator = NodeProgressAggregator(flush_interval=60)
+
+    aggregator.report("run-1", make_node("llm", category="llms", status=202), 202)
+    aggregator.report("run-1", make_node("output", category="outputs", status=200), 200)
+    aggregator.report("run-1", make_node("llm", category="llms", status=200), 200)
+    assert disk_cache.get(finished_nodes_key("run-1")) is None
+
+    aggregator.flush("run-1")
+
+    assert disk_cache.get(finished_nodes_key("run-1")) == [
+        {"id": "llm", "type": "Text", "category": "llms", "status": 200},
+        {
+            "id": "output",
+            "type": "Text",
+            "category": "outputs",
+            "status": 200,
+            "data": make_node("output", category="outputs", status=200)["data"],
+        },
+    ]
+
+
+def test_background_thread_flushes_within_interval(disk_cache: Cache) -> None:
+    aggregator = NodeProgressAggregator(flush_interval=0.01)
+
+    aggregator.report("run-1", make_node("a"), 200)
+    deadline = time.time() + 2
+    while disk_cache.get(finished_nodes_key("run-1")) is None and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert [node["id"] for node in disk_cache.get(finished_nodes_key("run-1"))] == ["a"]
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import pytest
+from diskcache import Cache
+
+import utilities.workflow.run_events as run_events_module
+from utilities.workflow.run_events import WorkflowRunEvents
+
+
+@pytest.fixture
+def run_events(disk_cache: Cache) -> WorkflowRunEvents:
+    for record_id in ("child-1", "child-2"):
+        disk_cache.set(f"workflow:record:{record_id}", 202)
+    return WorkflowRunEvents()
+
+
+def test_future_completes_after_all_runs_end(run_events: WorkflowRunEvents) -> None:
+    future = run_events.wait_future(["child-1", "child-2"])
+
+    run_events.publish("child-1", 200)
+    assert not future.done()
+    assert run_events.get_status("child-1") == 200
+    assert run_events.get_status("child-2") is None
+
+    run_events.publish("child-2", 500)
+    assert future.done()
+
+
+def test_future_is_done_when_runs_already_ended(run_events: WorkflowRunEvents) -> None:
+    run_events.publish("child-1", 200)
+    run_events_module.cache.set("workflow:record:child-2", 200)
+
+    assert run_events.wait_future(["child-1", "child-2"]).done()
+
+
+def test_publish_ignores_cancelled_waiters(run_events: WorkflowRunEvents) -> None:
+    future = run_events.wait_future(["child-1"])
+    future.cancel()
+
+    run_events.publish("child-1", 200)
+
+    assert future.cancelled()
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import pytest
+from diskcache import Cache
+
+import utilities.workflow.state as state_module
+from utilities.workflow import ReadyQueueExecutor, Workflow
+from utilities.workflow.state import (
+    WorkflowStateSession,
+    WorkflowStateStore,
+    apply_state_delta,
+    diff_state,
+    is_state_ref,
+    snapshot_state,
+)
+
+
+def make_workflow_data() -> dict:
+    return {
+        "wid": "wf-1",
+        "rid": "run-1",
+        "nodes": [
+            {
+                "id": "source",
+                "type": "Text",
+                "category": "textProcessing",
+                "data": {"task_name": "text_processing.concat", "template": {"output": {"value": ""}}},
+            },
+            {
+                "id": "target",
+                "type": "Text",
+                "category": "textProcessing",
+                "data": {"task_name": "text_processing.concat", "template": {"input": {"value": ""}}},
+            },
+        ],
+        "edges": [{"source": "source", "sourceHandle": "output", "target": "target", "targetHandle": "input"}],
+    }
+
+
+@pytest.fixture
+def state_store(monkeypatch: pytest.MonkeyPatch, disk_cache: Cache) -> WorkflowStateStore:
+    store = WorkflowStateStore()
+    monkeypatch.setattr(state_module, "workflow_state_store", store)
+    return store
+
+
+def test_diff_state_only_contains_changed_fields() -> None:
+    workflow_data = make_workflow_data()
+    before = snapshot_state(workflow_data)
+
+    workflow = Workflow(workflow_data)
+    workflow.update_node_field_value("source", "output", "hello")
+    workflow.get_node("source").run_time = 1.5
+    workflow_data["skipped_nodes"] = ["target"]
+
+    delta = diff_state(before, workflow_data)
+
+    assert delta == {
+        "nodes": {"source": {"fields": {"output": "hello"}, "run_time": 1.5}},
+        "data": {"skipped_nodes": ["target"]},
+    }
+
+
+def test_apply_state_delta_updates_fields_and_removes_keys() -> None:
+    workflow_data = make_workflow_data()
+    workflow_data["async_tasks"] = {"target": {}}
+
+    apply_state_delta(
+        workflow_data,
+        {
+            "nodes": {"target": {"fields": {"input": "hello"}, "status": 200}},
+            "data": {"node_run_time": {"target": 0.5}},
+            "removed": ["async_tasks"],
+        },
+    )
+
+    target = workflow_data["nodes"][1]
+    assert target["data"]["template"]["input"]["value"] == "hello"
+    assert target["data"]["status"] == 200
+    assert workflow_data["node_run_time"] == {"target": 0.5}
+    assert "async_tasks" not in workflow_data
+
+
+def test_session_returns_reference_with_delta(state_store: WorkflowStateStore) -> None:
+    ref = state_store.create(make_workflow_data())
+
+    session = WorkflowStateSession(ref)
+    Workflow(session.workflow_data).update_node_field_value("source", "output", "hello")
+    result = session.finish(session.workflow_data)
+
+    assert is_state_ref(result)
+    assert "nodes" not in result
+    assert result["delta"] == {"nodes": {"source": {"fields": {"output": "hello"}}}}
+
+
+def test_store_replays_deltas_in_another_process(state_store: WorkflowStateStore) -> None:
+    ref = state_store.create(make_workflow_data())
+    state_store.apply(ref, {"nodes": {"source": {"fields": {"output": "hello"}}}})
+
+    # A fresh store has no in-memory state and must rebuild it from the delta log
+    other_store = WorkflowStateStore()
+    state = other_store.load(ref)
+
+    assert state["nodes"][0]["data"]["template"]["output"]["value"] == "hello"
+
+    state_store.discard("run-1")
+    with pytest.raises(KeyError):
+        WorkflowStateStore().load(ref)
+
+
+def test_full_payload_passes_through_session() -> None:
+    workflow_data = make_workflow_data()
+
+    session = WorkflowStateSession(workflow_data)
+
+    assert session.is_delta is False
+    assert session.finish(workflow_data) is workflow_data
+
+
+def test_ready_queue_records_node_deltas(state_store: WorkflowStateStore) -> None:
+    workflow = Workflow(make_workflow_data())
+    ref = state_store.create(workflow.data)
+
+    def run_node(workflow_data: dict, node_id: str, task_name: str) -> dict:
+        node_workflow = Workflow(workflow_data)
+        if node_id == "source":
+            node_workflow.update_node_field_value("source", "output", "hello")
+        else:
+            node_workflow.get_node_field_value("target", "input")
+        return workflow_data
+
+    ReadyQueueExecutor(workflow, run_node, state_ref=ref).run()
+
+    # Another process rebuilds the outputs from the base state and the recorded deltas
+    state = WorkflowStateStore().load(ref)
+    assert state["nodes"][0]["data"]["template"]["output"]["value"] == "hello"
+    assert state["nodes"][1]["data"]["template"]["input"]["value"] == "hello"
+    assert set(state["node_run_time"]) == {"source", "target"}
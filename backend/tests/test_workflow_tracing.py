@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import time
+
+from conftest import make_node
+from utilities.workflow import ReadyQueueExecutor, Workflow
+from utilities.workflow.tracing import (
+    WorkflowTracer,
+    get_workflow_tracer,
+    pop_workflow_tracer,
+    start_workflow_trace,
+    trace_span,
+)
+
+
+def test_chrome_trace_export_contains_spans_and_summary() -> None:
+    tracer = WorkflowTracer("run-1")
+    with tracer.span("tasks.llms.open_ai", "execute", "node-1") as attributes:
+        time.sleep(0.01)
+        attributes["prompt_tokens"] = 12
+    tracer.add_event("retry", "retry", "node-1", attempt=1)
+
+    trace = tracer.to_chrome_trace()
+
+    complete_event, instant_event, thread_event = trace["traceEvents"]
+    assert complete_event["ph"] == "X"
+    assert complete_event["dur"] >= 10_000
+    assert complete_event["args"] == {"prompt_tokens": 12, "node_id": "node-1"}
+    assert instant_event["ph"] == "i"
+    assert thread_event["ph"] == "M"
+    assert trace["otherData"]["summary"]["node-1"]["execute"] >= 0.01
+
+
+def test_trace_span_is_noop_without_tracer() -> None:
+    with trace_span("run-without-trace", "execute") as attributes:
+        attributes["value"] = 1
+
+    assert get_workflow_tracer("run-without-trace") is None
+
+
+def test_executor_records_queue_wait() -> None:
+    workflow = Workflow({"wid": "wf-1", "rid": "run-trace", "nodes": [make_node("a"), make_node("b")], "edges": []})
+    start_workflow_trace("run-trace")
+
+    ReadyQueueExecutor(workflow, lambda workflow_data, node_id, task_name: workflow_data, max_workers=1).run()
+
+    tracer = pop_workflow_tracer("run-trace")
+    assert tracer is not None
+    assert sorted(span["node_id"] for span in tracer.spans if span["category"] == "queue") == ["a", "b"]
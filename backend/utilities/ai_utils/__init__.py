@@ -11,6 +11,9 @@ from vv_llm.chat_clients.utils import get_token_counts, format_messages, cutoff_
 from utilities.config import Settings
 from .agent import ToolCallData
 from .embeddings import EmbeddingClient
+from .embedding_cache import embedding_cache
+from .llm_response_cache import llm_response_cache
+from .rerank import RerankClient
 from .client import get_openai_client_and_model_id
 
 
@@ -41,6 +44,9 @@ def conversation_title_generator(
 __all__ = [
     "ToolCallData",
     "EmbeddingClient",
+    "embedding_cache",
+    "llm_response_cache",
+    "RerankClient",
     "format_messages",
     "cutoff_messages",
     "get_token_counts",
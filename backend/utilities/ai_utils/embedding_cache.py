@@ -0,0 +1,96 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+按内容寻址的嵌入向量磁盘缓存。
+
+键由 (provider, model, dimensions, 文本 sha256) 组成，值是 float32 打包后的向量字节，
+比 JSON 列表小得多且读写无需解析。缓存有总大小上限，超出后按最近最少使用淘汰；命中和
+未命中次数由 diskcache 记录，多个进程共享。
+
+Content addressed on-disk cache of embedding vectors.
+
+Keys are (provider, model, dimensions, sha256 of the text) and values are the vectors packed
+as float32 bytes, much smaller than JSON lists and read without parsing. The cache has a
+total size limit and evicts the least recently used entries beyond it. Hits and misses are
+counted by diskcache and shared between processes.
+"""
+
+import hashlib
+from array import array
+from pathlib import Path
+
+from diskcache import Cache
+
+from utilities.config import Settings, config
+
+
+# 默认缓存大小上限（字节）
+# Default cache size limit in bytes
+DEFAULT_SIZE_LIMIT = 1024**3
+
+
+def embedding_cache_key(provider: str, model_id: str, dimensions: int | None, text: str) -> str:
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{provider}:{model_id}:{dimensions or 0}:{text_hash}"
+
+
+def pack_embedding(embedding: list[float]) -> bytes:
+    return array("f", embedding).tobytes()
+
+
+def unpack_embedding(data: bytes) -> list[float]:
+    embedding = array("f")
+    embedding.frombytes(data)
+    return embedding.tolist()
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str | Path | None = None, size_limit: int | None = None):
+        self._directory = directory
+        self._size_limit = size_limit
+        self._cache: Cache | None = None
+
+    @property
+    def cache(self) -> Cache:
+        # 第一次使用时才打开，导入模块不会创建缓存目录
+        # Opened on first use so importing the module does not create the cache directory
+        if self._cache is None:
+            directory = self._directory or Path(config.data_path) / "embedding_cache"
+            size_limit = self._size_limit or Settings().get("vector_database.embedding_cache_size_limit", DEFAULT_SIZE_LIMIT)
+            self._cache = Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used", statistics=True)
+        return self._cache
+
+    def get_many(self, provider: str, model_id: str, dimensions: int | None, texts: list[str]) -> list[list[float] | None]:
+        """
+        按顺序返回每个文本的缓存向量，未命中的位置为 None。
+        Return the cached vector of each text in order, None where it missed.
+        """
+        results: list[list[float] | None] = []
+        for text in texts:
+            data = self.cache.get(embedding_cache_key(provider, model_id, dimensions, text))
+            results.append(unpack_embedding(data) if data is not None else None)
+        return results
+
+    def set_many(self, provider: str, model_id: str, dimensions: int | None, texts: list[str], embeddings: list[list[float]]):
+        with self.cache.transact():
+            for text, embedding in zip(texts, embeddings):
+                self.cache.set(embedding_cache_key(provider, model_id, dimensions, text), pack_embedding(embedding))
+
+    def stats(self) -> dict[str, int | float]:
+        hits, misses = self.cache.stats()
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "count": len(self.cache),
+            "size": self.cache.volume(),
+            "size_limit": self.cache.size_limit,
+        }
+
+    def clear(self):
+        self.cache.clear()
+        self.cache.stats(reset=True)
+
+
+embedding_cache = EmbeddingCache()
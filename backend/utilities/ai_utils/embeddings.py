@@ -1,18 +1,43 @@
 # -*- coding: utf-8 -*-
 # @Author: Bi Ying
 # @Date:   2023-05-16 18:15:11
-from collections.abc import Sequence
+from collections.abc import Iterator, Sequence
 
 from vv_llm.embedding_clients import create_embedding_client
 from vv_llm.settings import settings as vv_llm_settings
+from vv_llm.chat_clients.utils import get_token_counts
 
 from utilities.config import Settings
+from .embedding_cache import embedding_cache
 
 
 LEGACY_TEI_PROVIDER = "text-embeddings-inference"
 LEGACY_TEI_MODEL = "text-embeddings-inference"
 
 
+def split_embedding_batches(texts: Sequence[str], batch_size: int, batch_tokens: int) -> Iterator[tuple[int, list[str]]]:
+    """
+    把文本按数量和估算 token 数切分为嵌入请求批次，单个超出 token 预算的文本单独成批。
+    Split texts into embedding request batches by count and estimated tokens, a single text
+    over the token budget forms its own batch.
+
+    Yields:
+        tuple[int, list[str]]: 批次第一个文本的下标和批次文本 / Index of the batch's first text and the batch texts.
+    """
+    batch_start = 0
+    batch: list[str] = []
+    tokens = 0
+    for index, text in enumerate(texts):
+        text_tokens = get_token_counts(text, "gpt-4o", False)
+        if batch and (len(batch) >= batch_size or tokens + text_tokens > batch_tokens):
+            yield batch_start, batch
+            batch_start, batch, tokens = index, [], 0
+        batch.append(text)
+        tokens += text_tokens
+    if batch:
+        yield batch_start, batch
+
+
 class EmbeddingClient:
     def __init__(self, provider: str, model_id: str, dimensions: int | None = None) -> None:
         self.provider, self.model_id = self._normalize_provider_and_model(provider, model_id)
@@ -20,6 +45,7 @@ class EmbeddingClient:
 
         user_settings = Settings()
         vv_llm_settings.load(user_settings.get("llm_settings"))
+        self.use_cache = user_settings.get("vector_database.embedding_cache", True)
         self.client = create_embedding_client(
             backend=self.provider,
             model=self.model_id or None,
@@ -37,7 +63,24 @@ class EmbeddingClient:
         return normalized_provider, normalized_model
 
     def get(self, input: str | Sequence[str]) -> list[float] | list[list[float]]:
-        if isinstance(input, str):
-            return self.client.embed(input, dimensions=self.dimensions)
+        if not self.use_cache:
+            if isinstance(input, str):
+                return self.client.embed(input, dimensions=self.dimensions)
+            return self.client.embed_batch(list(input), dimensions=self.dimensions)
+
+        texts = [input] if isinstance(input, str) else list(input)
+        embeddings = embedding_cache.get_many(self.provider, self.model_id, self.dimensions, texts)
+
+        # 只为未命中的文本请求嵌入，重复的文本只请求一次
+        # Only request embeddings for the texts that missed, each distinct text once
+        missing_texts = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing_texts:
+            if len(missing_texts) == 1:
+                new_embeddings = [self.client.embed(missing_texts[0], dimensions=self.dimensions)]
+            else:
+                new_embeddings = self.client.embed_batch(missing_texts, dimensions=self.dimensions)
+            embedding_cache.set_many(self.provider, self.model_id, self.dimensions, missing_texts, new_embeddings)
+            new_embedding_map = dict(zip(missing_texts, new_embeddings))
+            embeddings = [embedding if embedding is not None else new_embedding_map[text] for text, embedding in zip(texts, embeddings)]
 
-        return self.client.embed_batch(list(input), dimensions=self.dimensions)
+        return embeddings[0] if isinstance(input, str) else embeddings
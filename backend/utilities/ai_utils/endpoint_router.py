@@ -0,0 +1,212 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+按端点健康状况和负载选择 LLM 端点。
+
+路由器为每个端点记录延迟和错误率的指数滑动平均值、正在进行的请求数和服务端返回的
+Retry-After。选择时跳过熔断中的端点，在其余端点中选择 延迟 × (1 + 进行中请求数) / 成功率
+最小的一个。连续失败达到阈值后端点熔断，熔断时间按失败次数指数增长；熔断结束后只放行
+一个探测请求，成功后恢复。
+
+Pick LLM endpoints by health and load.
+
+The router keeps, per endpoint, exponential moving averages of latency and error rate, the
+number of requests in flight and Retry-After hints from the server. Selection skips open
+(circuit broken) endpoints and picks the one with the smallest
+latency × (1 + in flight) / success rate. An endpoint opens after consecutive failures reach
+a threshold, for a time that grows exponentially with the failures. Once that time passes a
+single probe request is let through and the endpoint closes again when it succeeds.
+"""
+
+import time
+import random
+import threading
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterable, Mapping
+
+
+@dataclass
+class EndpointStats:
+    # 延迟的滑动平均秒数，没有成功请求时为 None / Moving average latency in seconds, None before any success
+    latency: float | None = None
+    error_rate: float = 0.0
+    in_flight: int = 0
+    consecutive_failures: int = 0
+    # 熔断或 Retry-After 结束的时间（time.monotonic）/ When the circuit or Retry-After ends (time.monotonic)
+    open_until: float = 0.0
+
+
+class EndpointRouter:
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        failure_threshold: int = 3,
+        open_seconds: float = 5.0,
+        max_open_seconds: float = 300.0,
+    ):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self._stats: dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, endpoint_id: str) -> EndpointStats:
+        stats = self._stats.get(endpoint_id)
+        if stats is None:
+            stats = self._stats[endpoint_id] = EndpointStats()
+        return stats
+
+    def _usable(self, stats: EndpointStats, now: float) -> bool:
+        if stats.open_until > now:
+            return False
+        # 熔断结束后的半开状态只放行一个探测请求 / Half open after the circuit: let a single probe through
+        if stats.consecutive_failures >= self.failure_threshold and stats.in_flight > 0:
+            return False
+        return True
+
+    def _score(self, stats: EndpointStats) -> float:
+        # 没有延迟数据的端点按 0 计，优先尝试 / Endpoints without latency data count as 0 and are tried first
+        latency = stats.latency or 0.0
+        return (latency + 1.0) * (1 + stats.in_flight) / max(1.0 - stats.error_rate, 0.05)
+
+    def select(
+        self,
+        endpoint_ids: Iterable[str],
+        is_available: Callable[[str], bool] | None = None,
+        exclude: Iterable[str] = (),
+    ) -> str | None:
+        """
+        选择得分最低的可用端点并将其进行中请求数加一，之后必须调用 success、failure 或 release。
+        is_available 按得分顺序检查端点（例如预留限流额度），返回 True 的端点被选中。
+
+        Pick the usable endpoint with the lowest score and count a request in flight on it,
+        success, failure or release must be called afterwards. is_available checks endpoints
+        in score order (e.g. reserving rate limit quota) and the first one returning True is
+        picked.
+
+        Returns:
+            str | None: 选中的端点，没有可用端点时为 None / The picked endpoint, None when none is usable.
+        """
+        excluded = set(exclude)
+        candidates = list(dict.fromkeys(endpoint_id for endpoint_id in endpoint_ids if endpoint_id not in excluded))
+        # 打乱后稳定排序，得分相同的端点随机分摊 / Shuffle before the stable sort so ties are spread randomly
+        random.shuffle(candidates)
+        with self._lock:
+            now = time.monotonic()
+            scored = [(self._score(self._get(endpoint_id)), endpoint_id) for endpoint_id in candidates if self._usable(self._get(endpoint_id), now)]
+        scored.sort(key=lambda item: item[0])
+
+        for _, endpoint_id in scored:
+            if is_available is not None and not is_available(endpoint_id):
+                continue
+            with self._lock:
+                stats = self._get(endpoint_id)
+                if not self._usable(stats, time.monotonic()):
+                    continue
+                stats.in_flight += 1
+            return endpoint_id
+        return None
+
+    def success(self, endpoint_id: str, latency: float):
+        with self._lock:
+            stats = self._get(endpoint_id)
+            stats.in_flight = max(0, stats.in_flight - 1)
+            stats.latency = latency if stats.latency is None else stats.latency + self.alpha * (latency - stats.latency)
+            stats.error_rate -= self.alpha * stats.error_rate
+            stats.consecutive_failures = 0
+            stats.open_until = 0.0
+
+    def failure(self, endpoint_id: str, retry_after: float | None = None):
+        """
+        记录一次失败。retry_after 为服务端要求的等待秒数，端点在此期间不会被选中。
+        Record a failure. retry_after is the wait in seconds asked by the server, the endpoint is not picked meanwhile.
+        """
+        with self._lock:
+            now = time.monotonic()
+            stats = self._get(endpoint_id)
+            stats.in_flight = max(0, stats.in_flight - 1)
+            stats.error_rate += self.alpha * (1.0 - stats.error_rate)
+            stats.consecutive_failures += 1
+            open_seconds = 0.0
+            if stats.consecutive_failures >= self.failure_threshold:
+                exponent = stats.consecutive_failures - self.failure_threshold
+                open_seconds = min(self.max_open_seconds, self.open_seconds * 2 ** min(exponent, 16))
+            if retry_after is not None:
+                open_seconds = max(open_seconds, min(retry_after, self.max_open_seconds))
+            stats.open_until = max(stats.open_until, now + open_seconds)
+
+    def release(self, endpoint_id: str):
+        """
+        结束一次不计入健康统计的请求，例如请求本身有误或被取消。
+        End a request that says nothing about the endpoint's health, e.g. an invalid or cancelled request.
+        """
+        with self._lock:
+            stats = self._get(endpoint_id)
+            stats.in_flight = max(0, stats.in_flight - 1)
+
+    def wait_time(self, endpoint_ids: Iterable[str]) -> float:
+        """
+        返回最早一个端点恢复可用前的秒数，已有可用端点时为 0。
+        Return the seconds until the first endpoint becomes usable again, 0 when one already is.
+        """
+        with self._lock:
+            now = time.monotonic()
+            waits = [max(0.0, self._get(endpoint_id).open_until - now) for endpoint_id in endpoint_ids]
+        return min(waits, default=0.0)
+
+    def stats(self, endpoint_id: str) -> EndpointStats:
+        with self._lock:
+            stats = self._get(endpoint_id)
+            return EndpointStats(**vars(stats))
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    带完全抖动的指数退避：在 [0, min(cap, base × 2^attempt)] 内随机取值，避免多个请求同时重试。
+    Exponential backoff with full jitter: a random value in [0, min(cap, base × 2^attempt)] so retries do not line up.
+    """
+    return random.uniform(0, min(cap, base * 2 ** min(attempt, 16)))
+
+
+def retry_after_seconds(headers: Mapping[str, str] | None) -> float | None:
+    """
+    解析 retry-after-ms 或 retry-after 响应头（秒数或 HTTP 日期），没有或无法解析时返回 None。
+    Parse the retry-after-ms or retry-after header (seconds or an HTTP date), None when missing or invalid.
+    """
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_routers: dict[str, EndpointRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_endpoint_router(name: str) -> EndpointRouter:
+    """
+    获取进程内共享的路由器，同一个模型的所有任务共用端点统计。
+    Get the process-wide router with this name, every task of a model shares its endpoint statistics.
+    """
+    with _routers_lock:
+        router = _routers.get(name)
+        if router is None:
+            router = _routers[name] = EndpointRouter()
+        return router
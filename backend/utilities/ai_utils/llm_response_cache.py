@@ -0,0 +1,116 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+LLM 节点响应的磁盘缓存。
+
+键是 (backend, model, 消息, temperature, 工具, 输出格式及其他影响输出的参数) 的 sha256，
+值是节点输出（内容、推理内容、工具调用和 token 用量）。条目按 TTL 过期，缓存有总大小上限，
+超出后按最近最少使用淘汰。缓存由节点按需开启：auto 模式只在 temperature 为 0 或未设置时
+使用缓存，force 模式总是使用。
+
+On-disk cache of LLM node responses.
+
+Keys are the sha256 of (backend, model, messages, temperature, tools, response format and
+the other parameters that affect the output). Values are the node output: content, reasoning
+content, tool calls and token usage. Entries expire after a TTL and the cache has a total
+size limit, evicting the least recently used entries beyond it. Nodes opt in: the auto mode
+only uses the cache when temperature is 0 or unset, the force mode always uses it.
+"""
+
+import json
+import hashlib
+from pathlib import Path
+from typing import Any
+
+from diskcache import Cache
+
+from utilities.config import Settings, config
+
+
+# 默认缓存大小上限（字节）和条目有效期（秒）
+# Default cache size limit in bytes and entry lifetime in seconds
+DEFAULT_SIZE_LIMIT = 256 * 1024**2
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+RESPONSE_CACHE_MODES = ("off", "auto", "force")
+
+
+def response_cache_enabled(mode: str | None, temperature: float | None) -> bool:
+    """
+    节点的缓存模式是否允许本次请求使用缓存，auto 模式下 temperature 大于 0 时跳过缓存。
+    Whether the node's cache mode allows this request to use the cache. The auto mode bypasses it for temperature above 0.
+    """
+    if mode == "force":
+        return True
+    if mode == "auto":
+        return temperature is None or temperature <= 0
+    return False
+
+
+def llm_response_cache_key(
+    backend: str,
+    model: str,
+    messages: list[Any],
+    temperature: float | None,
+    tools: list[Any] | None,
+    response_format: Any,
+    **options: Any,
+) -> str:
+    payload = json.dumps(
+        {
+            "messages": messages,
+            "temperature": temperature,
+            "tools": tools,
+            "response_format": response_format,
+            "options": options,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    payload_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"{backend}:{model}:{payload_hash}"
+
+
+class LLMResponseCache:
+    def __init__(self, directory: str | Path | None = None, size_limit: int | None = None):
+        self._directory = directory
+        self._size_limit = size_limit
+        self._cache: Cache | None = None
+
+    @property
+    def cache(self) -> Cache:
+        # 第一次使用时才打开，导入模块不会创建缓存目录
+        # Opened on first use so importing the module does not create the cache directory
+        if self._cache is None:
+            directory = self._directory or Path(config.data_path) / "llm_response_cache"
+            size_limit = self._size_limit or Settings().get("llm_response_cache.size_limit", DEFAULT_SIZE_LIMIT)
+            self._cache = Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used", statistics=True)
+        return self._cache
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        return self.cache.get(key)
+
+    def set(self, key: str, output: dict[str, Any], ttl: float | None = None):
+        if ttl is None:
+            ttl = Settings().get("llm_response_cache.ttl", DEFAULT_TTL)
+        self.cache.set(key, output, expire=ttl or None)
+
+    def stats(self) -> dict[str, int | float]:
+        hits, misses = self.cache.stats()
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "count": len(self.cache),
+            "size": self.cache.volume(),
+            "size_limit": self.cache.size_limit,
+        }
+
+    def clear(self):
+        self.cache.clear()
+        self.cache.stats(reset=True)
+
+
+llm_response_cache = LLMResponseCache()
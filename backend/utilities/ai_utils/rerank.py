@@ -0,0 +1,30 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+from vv_llm.rerank_clients import create_rerank_client
+from vv_llm.settings import settings as vv_llm_settings
+
+from utilities.config import Settings
+
+
+class RerankClient:
+    def __init__(self, provider: str, model_id: str) -> None:
+        self.provider = provider.strip().lower()
+        self.model_id = model_id.strip()
+
+        user_settings = Settings()
+        vv_llm_settings.load(user_settings.get("llm_settings"))
+        self.client = create_rerank_client(
+            backend=self.provider,
+            model=self.model_id or None,
+            settings=vv_llm_settings,
+        )
+
+    def rank(self, query: str, documents: list[str], top_n: int | None = None) -> list[int]:
+        """
+        返回按相关性从高到低排列的文档下标。
+        Return the document indexes ordered from most to least relevant.
+        """
+        if not documents:
+            return []
+        response = self.client.rerank(query=query, documents=documents, top_n=top_n, return_documents=False)
+        return [result.index for result in sorted(response.results, key=lambda result: result.relevance_score, reverse=True)]
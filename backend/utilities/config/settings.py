@@ -82,6 +82,59 @@ DEFAULT_SETTINGS = {
     },
     "microphone_device": 0,
     "shortcuts": {},
+    "workflow": {
+        # full: 每个任务传递完整工作流数据 / every task passes the full workflow data
+        # delta: 任务之间只传递状态引用和字段增量，ready_queue 下节点共享进程内数据，每个节点的增量记录到状态存储
+        # tasks pass a state reference and field deltas. With ready_queue nodes share the in-process
+        # data and each node's delta is recorded to the state store
+        "state_mode": "full",
+        # layered: 按拓扑层串联执行 / run topological layers as a chain
+        # ready_queue: 父节点完成后立即派发节点，整个运行占用一个 Celery worker，
+        # 嵌套的子工作流调用层数需要小于 worker 并发数
+        # dispatch a node as soon as its parents finish. The whole run holds a Celery worker,
+        # so nested sub-workflow invocations need fewer levels than the worker concurrency.
+        # 流式连线只在 ready_queue 下生效，layered 忽略它 / streaming edges only take effect with ready_queue, layered ignores them
+        "scheduler": "layered",
+        "max_concurrency": 8,
+        # 按任务名或模块名限制并发 / concurrency limits keyed by task name or module name
+        "task_concurrency": {"llms": 4, "image_generation": 2, "media_processing": 2},
+        # 记录节点级追踪并保存到运行记录 / record node level traces and save them to the run record
+        "tracing": True,
+    },
+    "vector_database": {
+        # 单次嵌入请求的最大文本数和估算 token 数，每批写入 Qdrant 一次
+        # Maximum texts and estimated tokens per embedding request, each batch is upserted to Qdrant once
+        "embedding_batch_size": 64,
+        "embedding_batch_tokens": 8000,
+        # 按内容缓存嵌入向量，大小上限为字节数 / cache embeddings by content, size limit in bytes
+        "embedding_cache": True,
+        "embedding_cache_size_limit": 1024**3,
+        # 解析文件的进程数，0 表示按 CPU 核数自动选择 / processes parsing files, 0 picks one from the CPU count
+        "ingestion_processes": 0,
+    },
+    "rate_limit": {
+        # 限流状态保存在 diskcache 中，由多个进程共享，修改后重启生效
+        # Keep rate limit state in diskcache shared by several processes, takes effect after a restart
+        "cross_process": False,
+    },
+    "llm_routing": {
+        # 非流式请求超过该秒数仍未返回时向另一个端点发出备份请求，先返回的结果生效，0 表示关闭
+        # Send a backup request to another endpoint when a non-streaming request takes longer
+        # than this many seconds, the first result wins, 0 disables it
+        "hedge_after": 0,
+    },
+    "llm_response_cache": {
+        # 节点开启响应缓存后条目的有效期（秒）和缓存大小上限（字节）
+        # Lifetime in seconds of entries cached by nodes that opt in, and the cache size limit in bytes
+        "ttl": 7 * 24 * 60 * 60,
+        "size_limit": 256 * 1024**2,
+    },
+    "relational_database": {
+        # 每个数据库文件的最大连接数和每个连接缓存的预编译语句数
+        # Maximum connections per database file and prepared statements cached per connection
+        "pool_size": 4,
+        "statement_cache_size": 256,
+    },
     "tts": {
         "piper": {"api_base": "http://localhost:5000"},
         "reecho": {"api_key": "", "voices": []},
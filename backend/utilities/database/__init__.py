@@ -4,6 +4,7 @@ from .relational_db import (
     get_table_names,
     create_from_sql,
     create_from_table,
+    iter_table_chunks,
     get_schema_from_sql,
     UserDatabaseControl,
     get_schema_from_table,
@@ -11,16 +12,25 @@ from .relational_db import (
     generate_create_table_sql,
     create_relational_database_table,
 )
+from .connection_pool import (
+    SQLiteConnectionPool,
+    get_connection_pool,
+    close_connection_pool,
+)
 
 
 __all__ = [
     "get_table_names",
     "create_from_sql",
     "create_from_table",
+    "iter_table_chunks",
     "get_schema_from_sql",
     "UserDatabaseControl",
     "get_schema_from_table",
     "get_row_count_by_table",
     "generate_create_table_sql",
     "create_relational_database_table",
+    "SQLiteConnectionPool",
+    "get_connection_pool",
+    "close_connection_pool",
 ]
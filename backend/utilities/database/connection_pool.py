@@ -0,0 +1,172 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+用户关系数据库的 SQLite 连接池。
+
+每个数据库文件一个连接池，连接以 WAL 模式打开，读写可以并发；连接复用时 sqlite3 自带的
+语句缓存可以复用预编译语句。连接池同时缓存各表的行数，写入时增量维护，分页查询不再每次
+全表 COUNT(*)。
+
+SQLite connection pools for user relational databases.
+
+One pool per database file. Connections are opened in WAL mode so readers and a writer can
+run concurrently, and reusing connections lets sqlite3's statement cache reuse prepared
+statements. The pool also caches the row count of each table and keeps it up to date on
+writes, so paginated listing no longer runs a COUNT(*) scan on every call.
+"""
+
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from utilities.config import Settings
+
+
+class SQLiteConnectionPool:
+    def __init__(self, database_path: str, pool_size: int = 4, statement_cache_size: int = 256):
+        self.database_path = database_path
+        self.pool_size = pool_size
+        self.statement_cache_size = statement_cache_size
+        self._connections: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._opened = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._row_counts: dict[str, int] = {}
+        self._row_counts_version = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.database_path,
+            timeout=30,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._connections.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"Connection pool for {self.database_path} is closed")
+            can_open = self._opened < self.pool_size
+            if can_open:
+                self._opened += 1
+        if not can_open:
+            return self._connections.get()
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _discard(self, connection: sqlite3.Connection):
+        with self._lock:
+            self._opened -= 1
+        connection.close()
+
+    def _release(self, connection: sqlite3.Connection):
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            # 无法回滚的连接状态未知，直接关闭 / A connection that cannot roll back is in an unknown state, close it
+            self._discard(connection)
+            return
+        with self._lock:
+            closed = self._closed
+        if closed:
+            self._discard(connection)
+        else:
+            self._connections.put(connection)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        借出一个连接，用完后归还。未提交的事务在归还时回滚。
+        Borrow a connection and return it afterwards. Uncommitted transactions are rolled back on return.
+        """
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            self._release(connection)
+
+    def row_count(self, table_name: str, count: Callable[[], int]) -> int:
+        """Return the cached row count of a table, computing it with count() on a miss."""
+        with self._lock:
+            cached = self._row_counts.get(table_name)
+            version = self._row_counts_version
+        if cached is not None:
+            return cached
+        rows = count()
+        with self._lock:
+            # 计数期间有写入时不缓存 / Do not cache a count that raced with a write
+            if self._row_counts_version == version:
+                self._row_counts[table_name] = rows
+        return rows
+
+    def adjust_row_count(self, table_name: str, delta: int):
+        with self._lock:
+            self._row_counts_version += 1
+            if table_name in self._row_counts:
+                self._row_counts[table_name] = max(0, self._row_counts[table_name] + delta)
+
+    def invalidate_row_counts(self, table_name: str | None = None):
+        with self._lock:
+            self._row_counts_version += 1
+            if table_name is None:
+                self._row_counts.clear()
+            else:
+                self._row_counts.pop(table_name, None)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                connection = self._connections.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+
+_POOLS: dict[str, SQLiteConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _pool_key(database_path: str | Path) -> str:
+    return Path(database_path).resolve().as_posix()
+
+
+def get_connection_pool(database_path: str | Path) -> SQLiteConnectionPool:
+    key = _pool_key(database_path)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            settings = Settings()
+            pool = _POOLS[key] = SQLiteConnectionPool(
+                key,
+                pool_size=settings.get("relational_database.pool_size", 4),
+                statement_cache_size=settings.get("relational_database.statement_cache_size", 256),
+            )
+        return pool
+
+
+def close_connection_pool(database_path: str | Path):
+    """
+    关闭并移除数据库文件的连接池，删除或替换数据库文件前调用。
+    Close and drop the pool of a database file, call before deleting or replacing the file.
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.pop(_pool_key(database_path), None)
+    if pool is not None:
+        pool.close()
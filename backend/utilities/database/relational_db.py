@@ -3,18 +3,31 @@
 import json
 import sqlite3
 import traceback
+from functools import partial
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, date, time
+from typing import Any, Callable, Iterator
 
 import sqlparse
+import openpyxl
+import numpy as np
 import pandas as pd
 
 from models import UserRelationalDatabase, UserRelationalTable, Status
+from utilities.config import cache
 from utilities.general import mprint_with_name
+from .connection_pool import get_connection_pool
 
 
 mprint = mprint_with_name(name="Relational Database")
 
+# 推断表结构时读取的行数，之后的行不影响推断结果
+# Rows read to infer a table schema, later rows do not affect the result
+SCHEMA_SAMPLE_ROWS = 10000
+# 导入表格文件时每个事务写入的行数
+# Rows written per transaction when importing a table file
+IMPORT_CHUNK_ROWS = 20000
+
 
 def _require_database_path(database: UserRelationalDatabase) -> str:
     database_path = database.database_path
@@ -35,11 +48,14 @@ def get_row_count_by_table(conn: sqlite3.Connection, table_name: str) -> int:
     return count
 
 
-def get_schema_from_table(file_path: str | Path, is_excel: bool):
+def get_schema_from_table(file_path: str | Path, is_excel: bool, sample_rows: int = SCHEMA_SAMPLE_ROWS):
+    # 只读取文件开头的样本推断类型和长度，SQLite 不强制 VARCHAR 长度，后面更长的值仍可写入
+    # Only a sampled prefix is read to infer types and lengths. SQLite does not enforce
+    # VARCHAR lengths so longer values further down still import
     if is_excel:
-        df = pd.read_excel(file_path)
+        df = pd.read_excel(file_path, nrows=sample_rows)
     else:
-        df = pd.read_csv(file_path)
+        df = pd.read_csv(file_path, nrows=sample_rows)
 
     # 创建一个空列表用于存储结果
     columns_info = []
@@ -140,21 +156,92 @@ def generate_create_table_sql(table_name, columns_info):
     return create_table_sql
 
 
+def _sql_value(value: Any):
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, np.generic):
+        return _sql_value(value.item())
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return value
+
+
+def _excel_column_names(header: tuple) -> list[str]:
+    return [str(name) if name is not None else f"Unnamed: {index}" for index, name in enumerate(header)]
+
+
+def iter_table_chunks(
+    file_path: str | Path,
+    is_excel: bool,
+    chunksize: int = IMPORT_CHUNK_ROWS,
+) -> Iterator[tuple[pd.DataFrame, float | None]]:
+    """
+    分块读取 CSV/Excel 文件，返回 (数据块, 已读取比例)，无法估计比例时为 None。
+    Read a CSV/Excel file in chunks, yielding (chunk, fraction read) with None when the
+    fraction cannot be estimated.
+    """
+    if not is_excel:
+        total_size = Path(file_path).stat().st_size or 1
+        with open(file_path, "rb") as file:
+            for chunk in pd.read_csv(file, chunksize=chunksize):
+                yield chunk, min(file.tell() / total_size, 1.0)
+        return
+
+    if Path(file_path).suffix.lower() == ".xls":
+        # openpyxl 不支持 .xls，只能整体读取
+        # openpyxl cannot read .xls, read it whole
+        df = pd.read_excel(file_path)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start : start + chunksize], min((start + chunksize) / len(df), 1.0)
+        return
+
+    # 与 pd.read_excel 一样读取第一个工作表，只读模式逐行解析
+    # Read the first worksheet like pd.read_excel, parsing row by row in read-only mode
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        total_rows = worksheet.max_row
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _excel_column_names(header)
+        batch = []
+        read_rows = 1
+        for row in rows:
+            read_rows += 1
+            if all(value is None for value in row):
+                continue
+            batch.append(row[: len(columns)])
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=columns), min(read_rows / total_rows, 1.0) if total_rows else None
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns), 1.0
+    finally:
+        workbook.close()
+
+
 def create_from_table(
     file_path: str | Path,
     table_name: str,
     db_path: str,
     columns_info: list,
     is_excel: bool = True,
+    progress: Callable[[int, float | None], None] | None = None,
 ):
-    if is_excel:
-        df = pd.read_excel(file_path)
-    else:
-        df = pd.read_csv(file_path)
-
-    df.columns = df.columns.str.replace(" ", "_")
-
-    conn = sqlite3.connect(db_path)
+    """
+    流式导入表格文件，每个数据块在一个事务中批量写入，内存占用与文件大小无关。
+    progress(已导入行数, 已读取比例) 在每个数据块提交后调用。
+    Stream a table file into the database, each chunk is written with executemany in one
+    transaction so memory does not depend on the file size. progress(imported rows,
+    fraction read) is called after each chunk commits.
+    """
+    pool = get_connection_pool(db_path)
 
     create_table_sql = f'CREATE TABLE IF NOT EXISTS "{table_name}" ('
     for column_info in columns_info:
@@ -167,27 +254,39 @@ def create_from_table(
             create_table_sql += f'"{column_name}" {column_type}, '
     create_table_sql = create_table_sql.rstrip(", ") + ")"
 
-    conn.execute(create_table_sql)
-
-    df.to_sql(table_name, conn, if_exists="append", index=False)
-
-    conn.commit()
-    conn.close()
+    imported_rows = 0
+    try:
+        with pool.connection() as conn:
+            conn.execute(create_table_sql)
+            conn.commit()
+            for df, fraction in iter_table_chunks(file_path, is_excel):
+                columns = [str(column).replace(" ", "_") for column in df.columns]
+                insert_sql = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+                    table_name,
+                    ", ".join(f'"{column}"' for column in columns),
+                    ", ".join("?" for _ in columns),
+                )
+                rows = [tuple(_sql_value(value) for value in row) for row in df.itertuples(index=False, name=None)]
+                conn.executemany(insert_sql, rows)
+                conn.commit()
+                imported_rows += len(rows)
+                if progress is not None:
+                    progress(imported_rows, fraction)
+    finally:
+        pool.invalidate_row_counts(table_name)
 
 
 def create_from_sql(
     db_path: str,
     sql_statement: str,
 ):
-    # 建立与SQLite数据库的连接
-    conn = sqlite3.connect(db_path)
-
-    # 执行CREATE TABLE语句
-    conn.executescript(sql_statement)
-
-    # 提交更改并关闭连接
-    conn.commit()
-    conn.close()
+    pool = get_connection_pool(db_path)
+    with pool.connection() as conn:
+        # 执行CREATE TABLE语句并提交
+        conn.executescript(sql_statement)
+        conn.commit()
+    # 脚本可能写入任意表 / The script may write to any table
+    pool.invalidate_row_counts()
 
 
 def create_relational_database_table(
@@ -220,7 +319,15 @@ def create_relational_database_table(
         if file is not None:
             if not file.endswith(".sql"):
                 is_excel = file.endswith((".xlsx", ".xls"))
-                create_from_table(file, table_name, database_path, columns_info, is_excel)
+                progress_key = f"relational-table-import-progress:{table.tid.hex}"
+
+                def report_progress(rows: int, fraction: float | None):
+                    cache.set(progress_key, {"rows": rows, "progress": fraction}, expire=3600)
+
+                try:
+                    create_from_table(file, table_name, database_path, columns_info, is_excel, progress=report_progress)
+                finally:
+                    cache.delete(progress_key)
                 created = True
             else:
                 sql_statement = Path(file).read_text()
@@ -234,20 +341,21 @@ def create_relational_database_table(
             database.database_file_last_modified = datetime.now()
             database.save()
 
-            conn = sqlite3.connect(database_path)
-            table_names = get_table_names(conn)
-            for table_name in table_names:
-                table_qs = UserRelationalTable.select().where(
-                    UserRelationalTable.name == table_name, UserRelationalTable.database == database
-                )
-                if not table_qs.exists():
-                    continue
+            pool = get_connection_pool(database_path)
+            with pool.connection() as conn:
+                table_names = get_table_names(conn)
+                for table_name in table_names:
+                    table_qs = UserRelationalTable.select().where(
+                        UserRelationalTable.name == table_name, UserRelationalTable.database == database
+                    )
+                    if not table_qs.exists():
+                        continue
 
-                table = table_qs.first()
-                if table.status == Status.PROCESSING:
-                    table.current_rows = get_row_count_by_table(conn, table_name)
-                    table.status = Status.VALID
-                    table.save()
+                    table = table_qs.first()
+                    if table.status == Status.PROCESSING:
+                        table.current_rows = pool.row_count(table_name, partial(get_row_count_by_table, conn, table_name))
+                        table.status = Status.VALID
+                        table.save()
 
             return True
         else:
@@ -269,6 +377,10 @@ class UserDatabaseControl:
         else:
             self.db = db
 
+    @property
+    def pool(self):
+        return get_connection_pool(_require_database_path(self.db))
+
     def get(
         self,
         table_name: str,
@@ -285,34 +397,31 @@ class UserDatabaseControl:
         else:
             sort_field = ""
 
-        connection = sqlite3.connect(database_path)
-        connection.row_factory = sqlite3.Row
-        cursor = connection.cursor()
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = sqlite3.Row
 
-        # 获取表的主键信息
-        cursor.execute(f'PRAGMA table_info("{table_name}")')
-        columns_info = cursor.fetchall()
-        primary_key = next((col[1] for col in columns_info if col[5] == 1), None)  # col[5] 表示是否为主键
+            # 获取表的主键信息
+            cursor.execute(f'PRAGMA table_info("{table_name}")')
+            columns_info = cursor.fetchall()
+            primary_key = next((col[1] for col in columns_info if col[5] == 1), None)  # col[5] 表示是否为主键
 
-        # 如果存在主键，同时返回主键和rowid；否则只返回rowid
-        if primary_key:
-            select_fields = f'*, "{primary_key}" as primary_key, rowid'
-        else:
-            select_fields = "*, rowid"
-            primary_key = "rowid"
-
-        cursor.execute(
-            f'SELECT {select_fields} FROM "{table_name}" {sort_field} LIMIT {page_size} OFFSET {(page_num - 1) * page_size}'
-        )
-        records = [dict(row) for row in cursor.fetchall()]
+            # 如果存在主键，同时返回主键和rowid；否则只返回rowid
+            if primary_key:
+                select_fields = f'*, "{primary_key}" as primary_key, rowid'
+            else:
+                select_fields = "*, rowid"
+                primary_key = "rowid"
 
-        cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"')
-        total = cursor.fetchone()[0]
-        connection.close()
+            cursor.execute(
+                f'SELECT {select_fields} FROM "{table_name}" {sort_field} LIMIT ? OFFSET ?',
+                (page_size, (page_num - 1) * page_size),
+            )
+            records = [dict(row) for row in cursor.fetchall()]
 
         return {
             "records": records,
-            "total": total,
+            "total": self.get_table_max_rows(table_name),
             "primary_key": primary_key,  # 返回主键信息
         }
 
@@ -321,12 +430,14 @@ class UserDatabaseControl:
         if not database_path or not Path(database_path).exists():
             return 0
         try:
-            connection = sqlite3.connect(database_path)
-            cursor = connection.cursor()
-            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-            result = cursor.fetchone()
-            connection.close()
-            return result[0]
+            pool = self.pool
+
+            def count() -> int:
+                with pool.connection() as connection:
+                    return get_row_count_by_table(connection, table_name)
+
+            # 行数缓存在连接池中，写入时增量维护 / Row counts are cached in the pool and maintained on writes
+            return pool.row_count(table_name, count)
         except Exception as e:
             mprint.error(f"database {self.db.rid.hex} failed to get table max rows: {e}")
             return 0
@@ -344,11 +455,11 @@ class UserDatabaseControl:
             return -1
 
         try:
-            connection = sqlite3.connect(database_path)
-            cursor = connection.cursor()
-            cursor.execute(f'DROP TABLE "{table_name}"')
-            connection.commit()
-            connection.close()
+            pool = self.pool
+            with pool.connection() as connection:
+                connection.execute(f'DROP TABLE "{table_name}"')
+                connection.commit()
+            pool.invalidate_row_counts(table_name)
             return 0
         except Exception as e:
             mprint.error(f"database {self.db.rid.hex} failed to delete table: {e}")
@@ -360,16 +471,15 @@ class UserDatabaseControl:
             return -1
 
         try:
-            connection = sqlite3.connect(database_path)
-            cursor = connection.cursor()
-            for record in records:
-                rowid = record.pop("rowid")
-                update_query = 'UPDATE "{}" SET {} WHERE rowid = ?'.format(
-                    table_name, ", ".join('"{}"=?'.format(k) for k in record)
-                )
-                cursor.execute(update_query, list(record.values()) + [rowid])
-            connection.commit()
-            connection.close()
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                for record in records:
+                    rowid = record.pop("rowid")
+                    update_query = 'UPDATE "{}" SET {} WHERE rowid = ?'.format(
+                        table_name, ", ".join('"{}"=?'.format(k) for k in record)
+                    )
+                    cursor.execute(update_query, list(record.values()) + [rowid])
+                connection.commit()
             table_max_rows = self.get_table_max_rows(table_name)
             self.set_table_max_rows(table_name, table_max_rows)
             return table_max_rows
@@ -383,13 +493,14 @@ class UserDatabaseControl:
             return -1
 
         try:
-            connection = sqlite3.connect(database_path)
-            cursor = connection.cursor()
-            for rowid in records:
+            pool = self.pool
+            with pool.connection() as connection:
+                cursor = connection.cursor()
                 delete_query = 'DELETE FROM "{}" WHERE rowid = ?'.format(table_name)
-                cursor.execute(delete_query, [rowid])
-            connection.commit()
-            connection.close()
+                cursor.executemany(delete_query, [[rowid] for rowid in records])
+                deleted = cursor.rowcount
+                connection.commit()
+            pool.adjust_row_count(table_name, -deleted)
             table_max_rows = self.get_table_max_rows(table_name)
             self.set_table_max_rows(table_name, table_max_rows)
             return table_max_rows
@@ -402,20 +513,23 @@ class UserDatabaseControl:
         if not database_path or not Path(database_path).exists():
             return -1
 
-        table_max_rows = self.get_table_max_rows(table_name)
-
         try:
-            connection = sqlite3.connect(database_path)
-            cursor = connection.cursor()
-            for record in records:
-                insert_query = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
-                    table_name,
-                    ", ".join(f'"{k}"' for k in record),
-                    ", ".join("?" for _ in record),
-                )
-                cursor.execute(insert_query, list(record.values()))
-            connection.commit()
-            connection.close()
+            pool = self.pool
+            inserted = 0
+            with pool.connection() as connection:
+                cursor = connection.cursor()
+                for record in records:
+                    # 相同列的记录生成相同的语句，由连接的语句缓存复用
+                    # Records with the same columns produce the same statement, reused by the connection's statement cache
+                    insert_query = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+                        table_name,
+                        ", ".join(f'"{k}"' for k in record),
+                        ", ".join("?" for _ in record),
+                    )
+                    cursor.execute(insert_query, list(record.values()))
+                    inserted += cursor.rowcount
+                connection.commit()
+            pool.adjust_row_count(table_name, inserted)
             table_max_rows = self.get_table_max_rows(table_name)
             self.set_table_max_rows(table_name, table_max_rows)
             return table_max_rows
@@ -461,59 +575,63 @@ class UserDatabaseControl:
         sql_script = sqlparse.format(sql_script, strip_comments=True)
         sql_statements = sqlparse.split(sql_script)
         results = []
+        wrote = False
 
-        connection = sqlite3.connect(database_path)
-        if include_column_names:
-            connection.row_factory = sqlite3.Row
-
-        cursor = connection.cursor()
-        cursor.execute("BEGIN TRANSACTION;")
-
-        try:
-            for sql_statement in sql_statements:
-                try:
-                    sql_type = sqlparse.parse(sql_statement)[0].get_type()
-
-                    cursor.execute(sql_statement)
-                    if sql_type == "SELECT":
-                        if max_count:
-                            data = cursor.fetchmany(size=max_count)
-                        else:
-                            data = cursor.fetchall()
-                        columns = [description[0] for description in cursor.description]
-                        if include_column_names:
-                            records = [dict(row) for row in data]
+        pool = self.pool
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            if include_column_names:
+                cursor.row_factory = sqlite3.Row
+            cursor.execute("BEGIN TRANSACTION;")
+
+            try:
+                for sql_statement in sql_statements:
+                    try:
+                        sql_type = sqlparse.parse(sql_statement)[0].get_type()
+
+                        cursor.execute(sql_statement)
+                        if sql_type == "SELECT":
+                            if max_count:
+                                data = cursor.fetchmany(size=max_count)
+                            else:
+                                data = cursor.fetchall()
+                            columns = [description[0] for description in cursor.description]
+                            if include_column_names:
+                                records = [dict(row) for row in data]
+                            else:
+                                records = data
+                            results.append(
+                                {
+                                    "success": True,
+                                    "type": sql_type,
+                                    "columns": columns,
+                                    "records": records,
+                                }
+                            )
                         else:
-                            records = data
+                            wrote = True
+                            results.append({"success": True, "type": sql_type, "rows": cursor.rowcount})
+                    except Exception as e:
                         results.append(
                             {
-                                "success": True,
-                                "type": sql_type,
-                                "columns": columns,
-                                "records": records,
+                                "success": False,
+                                "msg": f"Failed to run {sql_statement}: {e}",
                             }
                         )
-                    else:
-                        results.append({"success": True, "type": sql_type, "rows": cursor.rowcount})
-                except Exception as e:
-                    results.append(
-                        {
-                            "success": False,
-                            "msg": f"Failed to run {sql_statement}: {e}",
-                        }
-                    )
 
-            if read_only:
+                if read_only:
+                    connection.rollback()
+                else:
+                    connection.commit()
+
+            except Exception as e:
                 connection.rollback()
-            else:
-                connection.commit()
+                mprint.error(f"Failed to run sql: {e}")
+                results = []
 
-        except Exception as e:
-            connection.rollback()
-            mprint.error(f"Failed to run sql: {e}")
-            results = []
-        finally:
-            connection.close()
+        if wrote and not read_only:
+            # 任意语句都可能改变行数 / Arbitrary statements may change row counts
+            pool.invalidate_row_counts()
 
         return {
             "status": 200,
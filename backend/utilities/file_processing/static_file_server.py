@@ -13,7 +13,7 @@ from http.server import SimpleHTTPRequestHandler, HTTPServer
 
 from utilities.config import config
 from utilities.general import mprint_with_name
-from utilities.network import new_httpx_client
+from utilities.network import get_httpx_client
 
 
 mprint = mprint_with_name(name="Static File Server")
@@ -94,7 +94,7 @@ class StaticFileServer:
 
     @staticmethod
     def copy_online_file(file_url: str, folder: str | Path):
-        response = new_httpx_client(is_async=False).get(file_url, timeout=30)
+        response = get_httpx_client(is_async=False).get(file_url, timeout=30)
         if response.status_code == 200:
             file_type = response.headers.get("Content-Type", "").split("/")[-1]
             file_name = urlparse(file_url).path.split("/")[-1]
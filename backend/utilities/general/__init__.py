@@ -1,8 +1,9 @@
 # @Author: Bi Ying
 # @Date:   2024-06-09 12:02:10
 from .print_utils import LogServer, mprint_with_name, mprint
-from .ratelimit import add_request_record, clear_expired_records, is_request_allowed
+from .ratelimit import RateLimiter, add_request_record, clear_expired_records, get_rate_limiter, is_request_allowed
 from .retry import Retry
+from .executor import BoundedExecutor, get_shared_executor, shared_executor_metrics
 
 
 def align_elements(input_data):
@@ -50,6 +51,9 @@ def align_elements(input_data):
 
 __all__ = [
     "Retry",
+    "BoundedExecutor",
+    "get_shared_executor",
+    "shared_executor_metrics",
     "mprint",
     "LogServer",
     "align_elements",
@@ -57,4 +61,6 @@ __all__ = [
     "add_request_record",
     "is_request_allowed",
     "clear_expired_records",
+    "RateLimiter",
+    "get_rate_limiter",
 ]
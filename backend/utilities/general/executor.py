@@ -0,0 +1,156 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+import threading
+from typing import Any, Callable, TypeVar
+from concurrent.futures import FIRST_COMPLETED, FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+
+
+ResultType = TypeVar("ResultType")
+
+# 进程内共享线程池的默认大小。工作流节点和 LLM 请求使用不同的线程池，
+# 节点内部等待 LLM 请求时不会占满同一个线程池导致死锁。
+# Default sizes of the process-wide pools. Workflow nodes and LLM requests use separate
+# pools so a node waiting on its LLM requests cannot deadlock the pool it runs on.
+DEFAULT_POOL_SIZES = {
+    "workflow_nodes": 16,
+    "llm_requests": 32,
+    "llm_hedges": 16,
+}
+
+
+class BoundedExecutor:
+    """
+    有上限的线程池，记录排队数量和运行数量。
+    A bounded thread pool that tracks queue depth and running count.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"pool-{name}")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._peak_queued = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+
+    def submit(self, fn: Callable[..., ResultType], *args: Any, **kwargs: Any) -> "Future[ResultType]":
+        with self._lock:
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+
+        def _run():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self._failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+            return result
+
+        future = self._executor.submit(_run)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+                self._cancelled += 1
+
+    def run_all(
+        self,
+        calls: list[Callable[[], ResultType]],
+        max_concurrency: int | None = None,
+        return_when: str = FIRST_EXCEPTION,
+    ) -> "list[Future[ResultType]]":
+        """
+        并发执行一组调用，同时提交的数量不超过 ``max_concurrency``。
+        ``return_when`` 为 ``FIRST_EXCEPTION`` 时，任何一个调用失败后不再提交新的调用，
+        并取消还在排队的兄弟调用；为 ``ALL_COMPLETED`` 时等待所有调用结束。
+
+        Run a list of calls concurrently with at most ``max_concurrency`` submitted at once.
+        With ``FIRST_EXCEPTION`` a failing call stops further submissions and cancels queued
+        siblings, with ``ALL_COMPLETED`` every call runs to the end.
+
+        Returns:
+            list[Future]: 与 ``calls`` 顺序一致的 Future，未提交的调用对应已取消的 Future /
+            Futures in the order of ``calls``, calls that were never submitted get a cancelled Future.
+        """
+        window = max(1, max_concurrency or len(calls) or 1)
+        futures: list[Future | None] = [None] * len(calls)
+        pending: set[Future] = set()
+        next_index = 0
+
+        while next_index < len(calls) or pending:
+            while next_index < len(calls) and len(pending) < window:
+                future = self.submit(calls[next_index])
+                futures[next_index] = future
+                pending.add(future)
+                next_index += 1
+
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if return_when == FIRST_EXCEPTION and any(not future.cancelled() and future.exception() is not None for future in done):
+                # 取消还在排队的兄弟调用后立即返回，已经开始运行的调用无法被强制中断
+                # Cancel queued siblings and return at once, calls already running cannot be interrupted
+                for future in pending:
+                    future.cancel()
+                break
+
+        results: list[Future] = []
+        for future in futures:
+            if future is None:
+                future = Future()
+                future.cancel()
+            results.append(future)
+        return results
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "running": self._running,
+                "peak_queued": self._peak_queued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_shared_executors: dict[str, BoundedExecutor] = {}
+_shared_executors_lock = threading.Lock()
+
+
+def get_shared_executor(name: str, max_workers: int | None = None) -> BoundedExecutor:
+    """
+    获取进程内共享的有上限线程池，同名线程池只会创建一次。
+    Get the process-wide bounded pool with this name, it is created only once.
+    """
+    with _shared_executors_lock:
+        executor = _shared_executors.get(name)
+        if executor is None:
+            executor = BoundedExecutor(name, max_workers or DEFAULT_POOL_SIZES.get(name, 8))
+            _shared_executors[name] = executor
+        return executor
+
+
+def shared_executor_metrics() -> list[dict[str, Any]]:
+    with _shared_executors_lock:
+        executors = list(_shared_executors.values())
+    return [executor.metrics() for executor in executors]
@@ -1,13 +1,216 @@
 # @Author: Bi Ying
 # @Date:   2024-04-30 16:26:47
+"""
+按 GCRA（通用信元速率算法，令牌桶的等价形式）实现的请求和 token 限流。
+
+每个限流键只保存一个“理论到达时间”，检查时惰性计算，不需要后台线程清理过期记录。
+一个周期内最多允许 rpm 次请求和 tpm 个 token，可以在周期开始时突发用完。token 先按
+估算值预留，拿到实际用量后再用 record 修正。状态默认保存在进程内，也可以保存在 diskcache
+中由多个进程共享。
+
+Request and token rate limiting with GCRA (the generic cell rate algorithm, equivalent to a
+token bucket).
+
+Each limit key keeps a single theoretical arrival time that is evaluated lazily on
+check, so no background thread prunes expired records. Up to rpm requests and tpm tokens
+are allowed per period, and may be used in a burst. Tokens are reserved from an estimate
+and corrected with record once the actual usage is known. State lives in the process by
+default, or in diskcache to be shared by several processes.
+"""
+
+import math
 import time
 import threading
-from collections import defaultdict, deque
+from contextlib import AbstractContextManager, contextmanager
+from typing import Iterator, Protocol
+
+
+# 默认限流周期（秒）/ Default rate limit period in seconds
+RATE_LIMIT_PERIOD = 60
+
+
+class RateLimitStore(Protocol):
+    def transaction(self) -> AbstractContextManager[None]: ...
+
+    def get(self, key: str) -> float | None: ...
+
+    def set(self, key: str, value: float, expire: float): ...
+
+
+class MemoryRateLimitStore:
+    def __init__(self):
+        self._values: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self._lock:
+            yield
+
+    def get(self, key: str) -> float | None:
+        value = self._values.get(key)
+        if value is None:
+            return None
+        if value[1] < time.time():
+            del self._values[key]
+            return None
+        return value[0]
+
+    def set(self, key: str, value: float, expire: float):
+        self._values[key] = (value, time.time() + expire)
+
+
+class DiskCacheRateLimitStore:
+    """
+    保存在 diskcache 中的状态，diskcache 的事务在 SQLite 上加锁，多个进程之间也是原子的。
+    State kept in diskcache. Its transactions lock the SQLite file so they are atomic across processes.
+    """
+
+    def __init__(self, prefix: str = "ratelimit:"):
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        from utilities.config import cache
+
+        return cache
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.cache.transact():
+            yield
 
-# 使用defaultdict来存储每个产品的请求时间戳队列
-# Use defaultdict to store the request timestamp queue for each product
-request_records = defaultdict(deque)
-lock = threading.Lock()
+    def get(self, key: str) -> float | None:
+        return self.cache.get(f"{self.prefix}{key}")
+
+    def set(self, key: str, value: float, expire: float):
+        self.cache.set(f"{self.prefix}{key}", value, expire=expire)
+
+
+class RateLimiter:
+    def __init__(self, store: RateLimitStore | None = None):
+        self.store = store or MemoryRateLimitStore()
+
+    @staticmethod
+    def _limits(key: str, rpm: int | None, tpm: int | None, requests: float, tokens: float) -> list[tuple[str, int, float]]:
+        limits = []
+        if rpm and rpm > 0 and requests:
+            limits.append((f"{key}:requests", rpm, requests))
+        if tpm and tpm > 0 and tokens:
+            limits.append((f"{key}:tokens", tpm, tokens))
+        return limits
+
+    def _reserve(self, limits: list[tuple[str, int, float]], period: float, consume: bool, force: bool = False) -> float:
+        """
+        预留所有限额，返回需要等待的秒数，0 表示已预留（consume 为 False 时只检查）。
+        force 为 True 时无论是否超限都记录。
+        Reserve every limit and return the seconds to wait, 0 when reserved (only checked
+        when consume is False). With force the usage is recorded even over the limit.
+        """
+        now = time.time()
+        with self.store.transaction():
+            wait = 0.0
+            arrivals = []
+            for state_key, capacity, cost in limits:
+                interval = period / capacity
+                arrival = max(self.store.get(state_key) or now, now)
+                # 单次用量超过容量时按容量计，否则永远无法通过
+                # Cap a single cost at the capacity, otherwise it could never pass
+                new_arrival = max(arrival + min(cost, capacity) * interval, now)
+                wait = max(wait, new_arrival - now - period)
+                arrivals.append((state_key, new_arrival))
+            if not consume or (wait > 0 and not force):
+                return wait
+            for state_key, new_arrival in arrivals:
+                self.store.set(state_key, new_arrival, expire=math.ceil(new_arrival - now) + 1)
+        return 0.0
+
+    def try_acquire(
+        self,
+        key: str,
+        rpm: int | None = None,
+        tpm: int | None = None,
+        tokens: float = 0,
+        period: float = RATE_LIMIT_PERIOD,
+        consume: bool = True,
+    ) -> bool:
+        """
+        不等待地尝试预留一次请求和 tokens 个 token。
+        Try to reserve one request and the given tokens without waiting.
+        """
+        return self._reserve(self._limits(key, rpm, tpm, 1, tokens), period, consume) <= 0
+
+    def acquire(
+        self,
+        key: str,
+        rpm: int | None = None,
+        tpm: int | None = None,
+        tokens: float = 0,
+        period: float = RATE_LIMIT_PERIOD,
+        timeout: float | None = None,
+    ) -> bool:
+        """
+        预留一次请求和 tokens 个 token，超限时等待到允许为止。timeout 秒内无法预留时返回 False。
+        Reserve one request and the given tokens, waiting while over the limit. Return False
+        when they cannot be reserved within timeout seconds.
+        """
+        limits = self._limits(key, rpm, tpm, 1, tokens)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._reserve(limits, period, consume=True)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def record(
+        self,
+        key: str,
+        rpm: int | None = None,
+        tpm: int | None = None,
+        requests: float = 0,
+        tokens: float = 0,
+        period: float = RATE_LIMIT_PERIOD,
+    ):
+        """
+        无条件记录用量，tokens 可以为负，用于按实际用量修正预留的估算值。
+        Record usage unconditionally. tokens may be negative to correct a reserved estimate with the actual usage.
+        """
+        self._reserve(self._limits(key, rpm, tpm, requests, tokens), period, consume=True, force=True)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    不调用分词器的粗略 token 估算：中日韩字符每个约一个 token，其他字符约四个一个 token。
+    A rough token estimate without a tokenizer: about one token per CJK character and one per four other characters.
+    """
+    cjk = sum(1 for char in text if "\u3040" <= char <= "\u9fff" or "\uac00" <= char <= "\ud7af")
+    return cjk + (len(text) - cjk) // 4
+
+
+_rate_limiter: RateLimiter | None = None
+_rate_limiter_lock = threading.Lock()
+# 旧接口 add_request_record 没有传入上限，使用 is_request_allowed 最近一次传入的上限
+# The legacy add_request_record has no limit argument, use the last one passed to is_request_allowed
+_request_limits: dict[str, int] = {}
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    返回进程共享的限流器。设置 rate_limit.cross_process 为 True 时状态保存在 diskcache 中，多个进程共享。
+    Return the process-wide rate limiter. With rate_limit.cross_process set the state lives
+    in diskcache and is shared between processes.
+    """
+    global _rate_limiter
+
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            from utilities.config import Settings
+
+            cross_process = Settings().get("rate_limit.cross_process", False)
+            _rate_limiter = RateLimiter(DiskCacheRateLimitStore() if cross_process else MemoryRateLimitStore())
+        return _rate_limiter
 
 
 def add_request_record(product: str, cycle: int = 60) -> bool:
@@ -15,33 +218,15 @@ def add_request_record(product: str, cycle: int = 60) -> bool:
     向内存中添加对特定产品的请求记录。
     Add a request record for a specific product to memory.
     """
-    current_time = time.time()
-
-    with lock:
-        # 为特定产品添加当前时间戳到队列
-        # Add the current timestamp to the queue for the specific product
-        request_records[product].append(current_time)
-        # 清理超过周期的旧记录
-        # Clean up old records that exceed the cycle
-        while request_records[product] and request_records[product][0] < current_time - cycle:
-            request_records[product].popleft()
-
-        if len(request_records[product]) > 0:
-            threading.Timer(interval=cycle, function=clear_expired_records, args=[product, cycle]).start()
-        return True
+    get_rate_limiter().record(product, rpm=_request_limits.get(product), requests=1, period=cycle)
+    return True
 
 
 def clear_expired_records(product: str, cycle: int = 60):
     """
-    清理指定产品的过期请求记录。
-    Clear the expired request records for the specified product.
+    过期状态在检查时惰性清理，保留此函数以兼容旧调用。
+    Expired state is dropped lazily on check, kept for compatibility with old callers.
     """
-    current_time = time.time()
-    with lock:
-        while request_records[product] and request_records[product][0] < current_time - cycle:
-            request_records[product].popleft()
-        if not request_records[product]:
-            request_records[product].clear()
 
 
 def is_request_allowed(product: str, cycle: int, max_count: int, add_record: bool = False) -> bool:
@@ -49,23 +234,8 @@ def is_request_allowed(product: str, cycle: int, max_count: int, add_record: boo
     检查是否允许请求特定产品。
     Check if it is allowed to request a specific product.
     """
-    current_time = time.time()
-
-    with lock:
-        # 清理超过周期的旧记录
-        # Clean up old records that exceed the cycle
-        while request_records[product] and request_records[product][0] < current_time - cycle:
-            request_records[product].popleft()
-
-        # 检查当前的请求次数是否超过了允许的最大次数
-        # Check if the current number of requests exceeds the maximum allowed
-        if len(request_records[product]) >= max_count:
-            return False
-
-        if add_record:
-            request_records[product].append(current_time)
-            threading.Timer(cycle, clear_expired_records, [product, cycle]).start()
-        return True
+    _request_limits[product] = max_count
+    return get_rate_limiter().try_acquire(product, rpm=max_count, period=cycle, consume=add_record)
 
 
 if __name__ == "__main__":
@@ -3,7 +3,7 @@
 import time
 from typing import Optional, Any, Callable, Tuple, Union, TypeVar, Generic
 
-from .ratelimit import is_request_allowed, add_request_record
+from .ratelimit import get_rate_limiter
 
 
 ResultType = TypeVar("ResultType")
@@ -64,18 +64,14 @@ class Retry(Generic[ResultType]):
         while try_times <= self.__retry_times and time.time() - start_time < self.__timeout:
             if self.__rate_limit_args is not None:
                 product, cycle, max_count = self.__rate_limit_args
-                if not is_request_allowed(product, cycle, max_count):
-                    print(f"<{product}> has reached the request limit, waiting for {self.__sleep_time} seconds...")
-                    if time.time() - start_time > self.__timeout:
-                        print(f"Failed to request within {self.__timeout} seconds due to reaching the request limit.")
-                        return False, None
-                    time.sleep(self.__sleep_time)
-                    continue
+                # 超限时等待到允许为止，不超过剩余的超时时间
+                # Wait while over the limit, for no longer than the remaining timeout
+                remaining = self.__timeout - (time.time() - start_time)
+                if not get_rate_limiter().acquire(product, rpm=max_count, period=cycle, timeout=remaining):
+                    print(f"Failed to request within {self.__timeout} seconds due to reaching the request limit.")
+                    return False, None
 
             try:
-                if self.__rate_limit_args is not None:
-                    product, cycle, _ = self.__rate_limit_args
-                    add_request_record(product, cycle)
                 result: ResultType = self.function(*self.pargs, **self.kwargs)
                 if self._check_result(result):
                     return True, result
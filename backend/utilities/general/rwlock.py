@@ -0,0 +1,77 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class ReadWriteLock:
+    """
+    读写锁：多个读者可以同时持有，写者独占。有写者等待时新的读者会等待，写者不会饿死。
+    不可重入。
+    A read/write lock: many readers may hold it together, writers hold it exclusively.
+    New readers wait while a writer is waiting so writers are not starved. Not reentrant.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._condition:
+            self._condition.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._condition:
+            self._waiting_writers += 1
+            try:
+                self._condition.wait_for(lambda: not self._writer and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class KeyedReadWriteLocks:
+    """
+    按键分配的读写锁，例如每个集合一把。
+    Read/write locks allocated per key, e.g. one per collection.
+    """
+
+    def __init__(self):
+        self._locks: dict[str, ReadWriteLock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> ReadWriteLock:
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = ReadWriteLock()
+            return lock
+
+    @contextmanager
+    def read(self, key: str) -> Iterator[None]:
+        with self.get(key).read():
+            yield
+
+    @contextmanager
+    def write(self, key: str) -> Iterator[None]:
+        with self.get(key).write():
+            yield
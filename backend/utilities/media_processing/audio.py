@@ -19,7 +19,7 @@ from openai._types import FileTypes
 
 from utilities.config import Settings, config
 from utilities.general import mprint_with_name
-from utilities.network import new_httpx_client
+from utilities.network import get_httpx_client
 
 
 OpenAIVoiceType = Literal["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
@@ -89,7 +89,7 @@ class TTSClient:
                 "audio_sample_rate": self.audio_sample_rate,
                 "bitrate": 128000,
             }
-            http_client = new_httpx_client(is_async=False)
+            http_client = get_httpx_client(is_async=False)
             response = http_client.post(url, headers=headers, json=data)
             if response.status_code != 200:
                 mprint.error("Minimax TTS failed", response.status_code, response.text)
@@ -114,7 +114,7 @@ class TTSClient:
                 "stream": False,
             }
             headers = {"Authorization": f"Bearer {self.api_key}"}
-            http_client = new_httpx_client(is_async=False)
+            http_client = get_httpx_client(is_async=False)
             response = http_client.post(url, headers=headers, json=payload, timeout=None)
             audio_url = response.json()["data"]["audio"]
             response = http_client.get(audio_url, headers=headers, timeout=None)
@@ -137,7 +137,7 @@ class TTSClient:
 
             url = f"https://{self.service_region}.tts.speech.microsoft.com/cognitiveservices/v1"
 
-            http_client = new_httpx_client(is_async=False)
+            http_client = get_httpx_client(is_async=False)
             response = http_client.post(url, headers=headers, content=ssml)
 
             if response.status_code == 200:
@@ -189,7 +189,7 @@ class TTSClient:
                 },
                 "stream": True,
             }
-            http_client = new_httpx_client(is_async=False)
+            http_client = get_httpx_client(is_async=False)
             with http_client.stream("POST", url, headers=headers, json=body) as response:
                 for chunk in response.iter_lines():
                     if self._stop_flag:
@@ -205,7 +205,7 @@ class TTSClient:
         elif self.provider == "piper":
             stream = p.open(format=8, channels=1, rate=self.audio_sample_rate, output=True)
             headers = {"content-type": "text/plain"}
-            http_client = new_httpx_client(is_async=False)
+            http_client = get_httpx_client(is_async=False)
             # httpx typing: use `content` for raw string/bytes bodies (not `data`)
             with http_client.stream("POST", self.api_base, headers=headers, content=text) as response:
                 for chunk in response.iter_bytes():
@@ -227,7 +227,7 @@ class TTSClient:
                 "stream": True,
             }
             headers = {"Authorization": f"Bearer {self.api_key}"}
-            http_client = new_httpx_client(is_async=False)
+            http_client = get_httpx_client(is_async=False)
             response = http_client.post(url, headers=headers, json=payload, timeout=None)
             stream_url = response.json()["data"]["streamUrl"]
 
@@ -303,7 +303,7 @@ class TTSClient:
             stream = p.open(format=pyaudio.paInt16, channels=1, rate=self.audio_sample_rate, output=True)
 
             try:
-                http_client = new_httpx_client(is_async=False)
+                http_client = get_httpx_client(is_async=False)
                 with http_client.stream("POST", url, headers=headers, content=ssml) as response:
                     if response.status_code == 200:
                         for chunk in response.iter_bytes():
@@ -415,7 +415,7 @@ class SpeechRecognitionClient:
                 client = OpenAI(
                     api_key=settings.get("asr.openai.api_key"),
                     base_url=settings.get("asr.openai.api_base"),
-                    http_client=new_httpx_client(is_async=False),
+                    http_client=get_httpx_client(is_async=False),
                 )
                 model_id = settings.get("asr.openai.model", "whisper-1")
             self.provider = OpenAIProvider(client, model_id, _language)
@@ -13,7 +13,7 @@ from PIL.ImageFile import ImageFile
 from PIL import Image, ImageDraw, ImageFont
 
 from utilities.config import config
-from utilities.network import new_httpx_client
+from utilities.network import get_httpx_client
 
 
 class ImageProcessor:
@@ -41,7 +41,7 @@ class ImageProcessor:
             assert isinstance(self.image_source, str), "Non-local image source must be a string URL"
             image_url = self.image_source
             print(f"Downloading image from {image_url}")
-            http_client = new_httpx_client(is_async=False)
+            http_client = get_httpx_client(is_async=False)
             response = http_client.get(image_url, timeout=30)
             return Image.open(BytesIO(response.content))
         else:
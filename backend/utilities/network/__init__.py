@@ -1,6 +1,17 @@
 # @Author: Bi Ying
 # @Date:   2024-06-09 12:05:30
 from .web_crawler import headers, proxies, proxies_for_requests, crawl_text_from_url, new_httpx_client
+from .http_clients import get_httpx_client, get_llm_http_client, reset_httpx_clients, close_httpx_clients
 
 
-__all__ = ["headers", "proxies", "proxies_for_requests", "crawl_text_from_url", "new_httpx_client"]
+__all__ = [
+    "headers",
+    "proxies",
+    "proxies_for_requests",
+    "crawl_text_from_url",
+    "new_httpx_client",
+    "get_httpx_client",
+    "get_llm_http_client",
+    "reset_httpx_clients",
+    "close_httpx_clients",
+]
@@ -0,0 +1,164 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+进程内共享的 httpx 客户端。
+
+客户端按代理和 SSL 设置分组长期复用，保持连接池和 HTTP/2 连接，后续请求不再重复 DNS、TCP
+和 TLS 握手。设置变化后新的请求会得到按新设置创建的客户端。异步客户端的连接属于创建它的
+事件循环，因此按事件循环分别保存。
+
+Process-wide shared httpx clients.
+
+Clients are kept per proxy and SSL settings and reused with their connection pools and
+HTTP/2 connections, so later requests skip DNS, TCP and TLS handshakes. When the settings
+change new requests get a client built from the new settings. Connections of an async client
+belong to the event loop that created it, so async clients are kept per event loop.
+
+vv_llm 的对话客户端只接受 httpx2 的客户端，get_llm_http_client 以同样方式提供共享的 httpx2 客户端。
+vv_llm chat clients only accept httpx2 clients, get_llm_http_client shares httpx2 clients the same way.
+"""
+
+import re
+import time
+import asyncio
+import threading
+import urllib.request
+import importlib.util
+from types import ModuleType
+from weakref import WeakKeyDictionary
+from typing import Any, overload, Literal
+
+import httpx
+
+from utilities.config import Settings
+
+
+# 客户端设置（代理、SSL）重新读取的间隔秒数，修改设置时会立即失效
+# Seconds between re-reading client settings (proxies, SSL), changing settings invalidates them at once
+CLIENT_SETTINGS_TTL = 30
+
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+
+# HTTP/2 需要可选依赖 h2 / HTTP/2 needs the optional h2 dependency
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+http_proxy_host_re = re.compile(r"http.*://(.*?)$")
+
+ClientKey = tuple[bool, tuple[tuple[str, str], ...]]
+# 客户端按 (httpx 模块名, 设置) 保存 / Clients are kept per (httpx module name, settings)
+ClientsKey = tuple[str, ClientKey]
+
+_lock = threading.Lock()
+_client_key: ClientKey | None = None
+_client_key_time = 0.0
+_sync_clients: dict[ClientsKey, Any] = {}
+_async_clients: "WeakKeyDictionary[asyncio.AbstractEventLoop, dict[ClientsKey, Any]]" = WeakKeyDictionary()
+
+
+def system_proxy_urls() -> dict[str, str]:
+    """Return system proxies as {protocol: proxy url}, empty when use_system_proxy is off."""
+    settings = Settings()
+    if not settings.get("use_system_proxy", True):
+        return {}
+    proxy_urls = {}
+    for protocol, proxy in urllib.request.getproxies().items():
+        http_proxy_host = http_proxy_host_re.findall(proxy)
+        if http_proxy_host:
+            proxy_urls[protocol] = f"http://{http_proxy_host[0]}"
+    return proxy_urls
+
+
+def _current_client_key() -> ClientKey:
+    global _client_key, _client_key_time
+
+    with _lock:
+        if _client_key is not None and time.monotonic() - _client_key_time < CLIENT_SETTINGS_TTL:
+            return _client_key
+    ssl_verification = not Settings().get("skip_ssl_verification", False)
+    key = (ssl_verification, tuple(sorted(system_proxy_urls().items())))
+    with _lock:
+        _client_key = key
+        _client_key_time = time.monotonic()
+    return key
+
+
+def _build_client(key: ClientKey, is_async: bool, module: ModuleType = httpx):
+    ssl_verification, proxy_urls = key
+    limits = module.Limits(
+        max_connections=HTTP_LIMITS.max_connections,
+        max_keepalive_connections=HTTP_LIMITS.max_keepalive_connections,
+        keepalive_expiry=HTTP_LIMITS.keepalive_expiry,
+    )
+    transport_class = module.AsyncHTTPTransport if is_async else module.HTTPTransport
+    mounts = {
+        f"{protocol}://": transport_class(proxy=proxy_url, verify=ssl_verification, http2=HTTP2_AVAILABLE, limits=limits)
+        for protocol, proxy_url in proxy_urls
+    }
+    client_class = module.AsyncClient if is_async else module.Client
+    return client_class(mounts=mounts, verify=ssl_verification, http2=HTTP2_AVAILABLE, limits=limits)
+
+
+def _get_client(is_async: bool, module: ModuleType):
+    key = _current_client_key()
+    clients_key = (module.__name__, key)
+    with _lock:
+        if is_async:
+            clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+        else:
+            clients = _sync_clients
+        client = clients.get(clients_key)
+        if client is None or client.is_closed:
+            client = clients[clients_key] = _build_client(key, is_async, module)
+        return client
+
+
+@overload
+def get_httpx_client(is_async: Literal[False] = False) -> httpx.Client: ...
+
+
+@overload
+def get_httpx_client(is_async: Literal[True]) -> httpx.AsyncClient: ...
+
+
+def get_httpx_client(is_async: bool = False) -> httpx.Client | httpx.AsyncClient:
+    """
+    返回当前设置对应的共享客户端。调用方不要关闭它。
+    Return the shared client for the current settings. Callers must not close it.
+    """
+    return _get_client(is_async, httpx)
+
+
+def get_llm_http_client(is_async: bool = False):
+    """
+    返回当前设置对应的共享 httpx2 客户端，传给 vv_llm 的对话客户端。调用方不要关闭它。
+    Return the shared httpx2 client for the current settings, for vv_llm chat clients. Callers must not close it.
+    """
+    import httpx2
+
+    return _get_client(is_async, httpx2)
+
+
+def reset_httpx_clients():
+    """
+    设置变化后调用：之后的请求使用按新设置创建的客户端。旧客户端不主动关闭，正在进行的请求不受影响。
+    Call when settings change: later requests use clients built from the new settings. Old
+    clients are not closed so in-flight requests are unaffected.
+    """
+    global _client_key
+
+    with _lock:
+        _client_key = None
+        _sync_clients.clear()
+        _async_clients.clear()
+
+
+def close_httpx_clients():
+    """Close the shared sync clients, e.g. on shutdown."""
+    global _client_key
+
+    with _lock:
+        clients = list(_sync_clients.values())
+        _sync_clients.clear()
+        _client_key = None
+    for client in clients:
+        client.close()
@@ -7,7 +7,6 @@ import re
 import json
 import time
 import base64
-import urllib.request
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import unpad
 from typing import overload, Literal, Mapping
@@ -19,6 +18,7 @@ from markdownify import MarkdownConverter
 
 from utilities.config import Settings
 from utilities.general import mprint_with_name
+from .http_clients import get_httpx_client, system_proxy_urls
 
 
 mprint = mprint_with_name(name="Web Crawler")
@@ -27,9 +27,6 @@ headers = {
     "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36"
 }
 
-http_proxy_host_re = re.compile(r"http.*://(.*?)$")
-
-
 def _chomp(text: str) -> tuple[str, str, str]:
     prefix_len = len(text) - len(text.lstrip())
     suffix_len = len(text) - len(text.rstrip())
@@ -47,38 +44,12 @@ def proxies(is_async: Literal[True]) -> Mapping[str, httpx.AsyncHTTPTransport]:
 
 
 def proxies(is_async: bool = False) -> Mapping[str, httpx.HTTPTransport | httpx.AsyncHTTPTransport]:
-    settings = Settings()
-    if not settings.get("use_system_proxy", True):
-        return {}
-    else:
-        system_proxies = urllib.request.getproxies()
-        proxies = {}
-        for protocol, proxy in system_proxies.items():
-            http_proxy_host = http_proxy_host_re.findall(proxy)
-            if not http_proxy_host:
-                continue
-            proxy_url = f"http://{http_proxy_host[0]}"
-            if is_async:
-                proxies[f"{protocol}://"] = httpx.AsyncHTTPTransport(proxy=proxy_url)
-            else:
-                proxies[f"{protocol}://"] = httpx.HTTPTransport(proxy=proxy_url)
-        return proxies
+    transport_class = httpx.AsyncHTTPTransport if is_async else httpx.HTTPTransport
+    return {f"{protocol}://": transport_class(proxy=proxy_url) for protocol, proxy_url in system_proxy_urls().items()}
 
 
 def proxies_for_requests():
-    settings = Settings()
-    if not settings.get("use_system_proxy", True):
-        return {}
-    else:
-        system_proxies = urllib.request.getproxies()
-        proxies_for_requests = {}
-        for protocol, proxy in system_proxies.items():
-            http_proxy_host = http_proxy_host_re.findall(proxy)
-            if not http_proxy_host:
-                continue
-            proxy_url = f"http://{http_proxy_host[0]}"
-            proxies_for_requests[protocol] = proxy_url
-        return proxies_for_requests
+    return system_proxy_urls()
 
 
 @overload
@@ -90,6 +61,10 @@ def new_httpx_client(is_async: Literal[True]) -> httpx.AsyncClient: ...
 
 
 def new_httpx_client(is_async: bool = False) -> httpx.Client | httpx.AsyncClient:
+    """
+    创建独立的客户端，由调用方负责关闭。一般请求使用 get_httpx_client 返回的共享客户端。
+    Create a private client that the caller closes. Regular requests use the shared client from get_httpx_client.
+    """
     settings = Settings()
     ssl_verification = not settings.get("skip_ssl_verification", False)
     if is_async:
@@ -134,7 +109,7 @@ def crawl_text_from_url(url: str):
     if not url.startswith("http"):
         url = f"http://{url}"
 
-    http_client = new_httpx_client(is_async=False)
+    http_client = get_httpx_client(is_async=False)
 
     try_times = 0
     crawl_success = False
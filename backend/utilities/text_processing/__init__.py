@@ -1,20 +1,24 @@
 # @Author: Bi Ying
 # @Date:   2024-06-09 12:24:24
 from .text import (
+    chunk_hash,
     split_text,
     extract_url,
     clean_markdown,
     extract_image_url,
     remove_url_and_email,
     remove_markdown_image,
+    read_and_split_file,
 )
 
 
 __all__ = [
+    "chunk_hash",
     "split_text",
     "extract_url",
     "clean_markdown",
     "extract_image_url",
     "remove_url_and_email",
     "remove_markdown_image",
+    "read_and_split_file",
 ]
@@ -0,0 +1,109 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+BM25 关键词检索和倒数排名融合。
+
+向量检索对精确的标识符、代码符号不敏感，关键词检索正好互补。分词对拉丁文字按单词和标识符
+（保留 foo.bar、snake_case 这样的整体，同时拆出各部分），对中日韩文字使用单字和相邻双字，
+不依赖额外的分词库。
+
+BM25 keyword retrieval and reciprocal rank fusion.
+
+Dense vector search is insensitive to exact identifiers and code symbols, keyword search
+complements it. Latin text is tokenized into words and identifiers (keeping foo.bar and
+snake_case whole as well as their parts), CJK text into single characters and adjacent
+character pairs, so no extra segmentation library is needed.
+"""
+
+import math
+import re
+from collections import Counter
+from collections.abc import Hashable, Iterable
+from typing import Any
+
+
+_LATIN_TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:[.\-:/][a-z0-9_]+)*")
+_CJK_RUN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+")
+_IDENTIFIER_PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+# 倒数排名融合的平滑常数，取自原论文
+# Smoothing constant of reciprocal rank fusion, as in the original paper
+RRF_K = 60
+
+
+def tokenize(text: str) -> list[str]:
+    text = text.lower()
+    tokens: list[str] = []
+    for match in _LATIN_TOKEN_PATTERN.finditer(text):
+        token = match.group()
+        tokens.append(token)
+        parts = _IDENTIFIER_PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    for match in _CJK_RUN_PATTERN.finditer(text):
+        run = match.group()
+        tokens.extend(run)
+        tokens.extend(run[index : index + 2] for index in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._documents: list[dict[str, Any]] = []
+        self._lengths: list[int] = []
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, text: str, payload: dict[str, Any]):
+        document_index = len(self._documents)
+        term_counts = Counter(tokenize(text))
+        for term, count in term_counts.items():
+            self._postings.setdefault(term, []).append((document_index, count))
+        length = sum(term_counts.values())
+        self._documents.append(payload)
+        self._lengths.append(length)
+        self._total_length += length
+
+    def search(self, query: str, limit: int = 5) -> list[tuple[dict[str, Any], float]]:
+        """
+        返回得分最高的文档和得分。
+        Return the best scoring documents with their scores.
+        """
+        if not self._documents:
+            return []
+
+        document_count = len(self._documents)
+        average_length = self._total_length / document_count or 1
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for document_index, count in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[document_index] / average_length)
+                scores[document_index] = scores.get(document_index, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(self._documents[document_index], score) for document_index, score in best]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[list[tuple[Hashable, Any]]], limit: int, k: int = RRF_K) -> list[Any]:
+    """
+    按倒数排名融合多个排序结果。每个排序是 (key, item) 列表，相同 key 视为同一结果。
+    Fuse several rankings by reciprocal rank. Each ranking is a list of (key, item) and equal
+    keys are the same result.
+    """
+    scores: dict[Hashable, float] = {}
+    items: dict[Hashable, Any] = {}
+    for ranking in rankings:
+        for rank, (key, item) in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1 / (k + rank + 1)
+            items.setdefault(key, item)
+    best = sorted(scores, key=lambda key: scores[key], reverse=True)[:limit]
+    return [items[key] for key in best]
@@ -3,6 +3,7 @@
 import re
 import io
 import csv
+import hashlib
 from typing import List, Union, overload, Literal, TypedDict
 
 from langchain_text_splitters import (
@@ -11,7 +12,7 @@ from langchain_text_splitters import (
     ExperimentalMarkdownSyntaxTextSplitter,
 )
 
-from utilities.file_processing import static_file_server
+from utilities.file_processing import static_file_server, read_file_content
 
 
 url_pattern = re.compile(r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+")
@@ -175,6 +176,24 @@ def split_text(text: str, rules: dict, flat: bool = False) -> Union[List[Paragra
         return [{"index": index, "text": paragraph, "word_counts": len(paragraph)} for index, paragraph in enumerate(paragraphs)]
 
 
+def chunk_hash(text: str) -> str:
+    """分块内容的哈希，用于增量重建索引 / Content hash of a chunk, used for incremental reindexing"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def read_and_split_file(file: str, rules: dict) -> tuple[str, List[ParagraphInfo]]:
+    """
+    读取文件内容并分段，分段带有内容哈希。只依赖参数，可以在子进程中运行。
+    Read a file and split it into segments with content hashes. Depends only on its
+    arguments so it can run in a worker process.
+    """
+    text = str(read_file_content(file, read_zip=True) or "")
+    segments = [paragraph for paragraph in split_text(text, rules) if isinstance(paragraph, dict)]
+    for segment in segments:
+        segment["hash"] = chunk_hash(str(segment.get("text", "")))
+    return text, segments
+
+
 def clean_markdown(text: str):
     content = "\n\n".join([s.strip() for s in text.split("\n") if s.strip()])
     content = content.replace("![]()", "").replace("*\n", "")
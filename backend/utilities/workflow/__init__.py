@@ -1,7 +1,14 @@
 # @Author: Bi Ying
 # @Date:   2024-06-09 11:45:57
 from .scheduler import WorkflowScheduler, workflow_scheduler, validate_cron_expression, get_next_run_time
-from .workflow import DAG, Node, Workflow, WorkflowData
+from .workflow import DAG, Node, Workflow, WorkflowData, is_streaming_edge, parsed_workflow_scope
+from .executor import ReadyQueueExecutor, WorkflowExecutionError
+from .state import WorkflowStateSession, workflow_state_store, is_state_ref
+from .run_events import WorkflowRunEvents, workflow_run_events
+from .tracing import WorkflowTracer, start_workflow_trace, trace_span, trace_event
+from .progress import NodeProgressAggregator, node_progress
+from .node_stream import NodeDataStream, node_streams
+from .cancel import WorkflowCancelled, cancel_checker, is_workflow_cancelled, raise_if_cancelled
 
 
 __all__ = [
@@ -9,6 +16,27 @@ __all__ = [
     "Node",
     "Workflow",
     "WorkflowData",
+    "is_streaming_edge",
+    "parsed_workflow_scope",
+    "ReadyQueueExecutor",
+    "WorkflowExecutionError",
+    "WorkflowStateSession",
+    "workflow_state_store",
+    "is_state_ref",
+    "WorkflowRunEvents",
+    "workflow_run_events",
+    "WorkflowTracer",
+    "start_workflow_trace",
+    "trace_span",
+    "trace_event",
+    "NodeProgressAggregator",
+    "node_progress",
+    "NodeDataStream",
+    "node_streams",
+    "WorkflowCancelled",
+    "cancel_checker",
+    "is_workflow_cancelled",
+    "raise_if_cancelled",
     "WorkflowScheduler",
     "workflow_scheduler",
     "validate_cron_expression",
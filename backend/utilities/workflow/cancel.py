@@ -0,0 +1,148 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+工作流运行的协作式取消。
+
+停止一次运行时只会设置一个取消标记，正在运行的任务在安全点（节点开始前、流式输出时、
+子工作流轮询时）检查标记并抛出 WorkflowCancelled。标记同时保存在进程内集合和 diskcache 中，
+同进程内的检查不需要读磁盘，其他进程也能看到取消请求。流式输出用 cancel_checker 限制读磁盘的频率，
+运行结束后从进程内集合中移除。
+
+Cooperative cancellation of workflow runs.
+
+Stopping a run only sets a cancel flag, running tasks check it at safe points (before a node
+starts, while streaming, while polling sub-workflows) and raise WorkflowCancelled.
+The flag is kept both in an in-process set and in diskcache, so checks in the same process
+don't touch the disk and other processes still see the request. Streaming loops use
+cancel_checker to limit how often the disk is read, and runs leave the in-process set once
+they end.
+"""
+
+import time
+import threading
+from collections.abc import Callable, Iterable
+
+from utilities.config import cache
+
+
+CANCEL_EXPIRE = 60 * 60 * 24
+CANCELLED_ERROR_TASK = "workflow.cancelled"
+# 流式输出中两次读取 diskcache 取消标记的最小间隔（秒）
+# Minimum seconds between two diskcache reads of the cancel flag while streaming
+CANCEL_CHECK_INTERVAL = 0.5
+
+
+class WorkflowCancelled(Exception):
+    def __init__(self, record_id: str):
+        super().__init__(f"Workflow run {record_id} was cancelled")
+        self.record_id = record_id
+
+
+_cancelled_records: set[str] = set()
+_lock = threading.Lock()
+
+
+def _cancel_key(record_id: str) -> str:
+    return f"workflow:record:{record_id}:cancelled"
+
+
+def _celery_tasks_key(record_id: str) -> str:
+    return f"workflow:record:{record_id}:celery_tasks"
+
+
+def _children_key(record_id: str) -> str:
+    return f"workflow:record:{record_id}:children"
+
+
+def _append(key: str, values: Iterable[str]):
+    with _lock:
+        items = cache.get(key, [])
+        items.extend(value for value in values if value and value not in items)
+        cache.set(key, items, CANCEL_EXPIRE)
+
+
+def request_cancel(record_id: str) -> bool:
+    """
+    设置取消标记，标记已存在时返回 False。
+    Set the cancel flag, returns False if the run was already cancelled.
+    """
+    if is_workflow_cancelled(record_id):
+        return False
+    with _lock:
+        _cancelled_records.add(record_id)
+    cache.set(_cancel_key(record_id), True, CANCEL_EXPIRE)
+    return True
+
+
+def is_workflow_cancelled(record_id: str | None) -> bool:
+    if not record_id:
+        return False
+    if record_id in _cancelled_records:
+        return True
+    if cache.get(_cancel_key(record_id), False):
+        with _lock:
+            _cancelled_records.add(record_id)
+        return True
+    return False
+
+
+def raise_if_cancelled(record_id: str | None):
+    if is_workflow_cancelled(record_id):
+        raise WorkflowCancelled(record_id or "")
+
+
+def cancel_checker(record_id: str | None, interval: float = CANCEL_CHECK_INTERVAL) -> Callable[[], bool]:
+    """
+    返回一个取消检查函数，每次调用都检查进程内标记，diskcache 最多每 interval 秒读一次。
+    用于每个分片都要检查的流式循环。
+    Return a cancel check that looks at the in-process flag on every call and reads diskcache
+    at most once per interval seconds. Meant for streaming loops that check on every chunk.
+    """
+    next_read = 0.0
+
+    def check() -> bool:
+        nonlocal next_read
+        if not record_id:
+            return False
+        if record_id in _cancelled_records:
+            return True
+        now = time.monotonic()
+        if now < next_read:
+            return False
+        next_read = now + interval
+        return is_workflow_cancelled(record_id)
+
+    return check
+
+
+def forget_cancelled_run(record_id: str | None):
+    """
+    运行结束后移除进程内的取消标记，diskcache 中的标记按过期时间清理。
+    Drop the in-process cancel flag once the run has ended, the diskcache flag expires on its own.
+    """
+    with _lock:
+        _cancelled_records.discard(record_id or "")
+
+
+def register_celery_tasks(record_id: str, task_ids: Iterable[str]):
+    """
+    记录运行对应的 Celery 任务 ID，停止时撤销还在排队的任务。
+    Remember the Celery task ids of a run so queued ones can be revoked on stop.
+    """
+    _append(_celery_tasks_key(record_id), task_ids)
+
+
+def get_celery_tasks(record_id: str) -> list[str]:
+    return cache.get(_celery_tasks_key(record_id), [])
+
+
+def register_child_runs(record_id: str, child_record_ids: Iterable[str]):
+    """
+    记录由节点启动的子工作流运行，父运行停止时一并停止。
+    Remember sub-workflow runs started by nodes so they are stopped along with the parent.
+    """
+    _append(_children_key(record_id), child_record_ids)
+
+
+def get_child_runs(record_id: str) -> list[str]:
+    return cache.get(_children_key(record_id), [])
@@ -0,0 +1,347 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+import time
+import heapq
+import threading
+from collections import Counter
+from typing import Any, Callable
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from utilities.general import mprint_with_name, get_shared_executor
+
+from .workflow import Workflow
+from .cancel import WorkflowCancelled
+from .node_stream import node_streams
+from .state import node_state_delta, workflow_state_store
+from .tracing import get_workflow_tracer, trace_event
+
+
+mprint = mprint_with_name(name="Workflow Executor")
+
+# 没有历史运行时间时用于估算关键路径的任务权重
+# Task weights used to estimate the critical path when no previous run time is recorded
+DEFAULT_TASK_WEIGHTS = {
+    "llms": 10,
+    "media_processing": 10,
+    "image_generation": 10,
+    "web_crawlers": 5,
+    "tools": 5,
+    "vector_db": 3,
+}
+
+RunNode = Callable[[dict, str, str], Any]
+WaitForRuns = Callable[[list[str]], Future]
+
+# 设置取消检查时，等待运行中节点的最长时间，超时后重新检查取消标记
+# With a cancel check set, the longest wait on running nodes before the flag is checked again
+CANCEL_POLL_INTERVAL = 0.5
+
+
+class WorkflowExecutionError(Exception):
+    def __init__(self, message: str, node_id: str, task_name: str):
+        super().__init__(message)
+        self.node_id = node_id
+        self.task_name = task_name
+
+
+class ReadyQueueExecutor:
+    """
+    基于依赖的调度器：节点的所有父节点完成后立即派发，不再等待整层完成。
+    就绪节点按关键路径长度排序，并按任务类型限制并发数。
+
+    Dependency-driven scheduler: a node is dispatched as soon as all of its own parents
+    have finished instead of waiting for the whole layer. Ready nodes are ordered by
+    critical path length and concurrency is limited per task type.
+
+    只通过流式连线连接的父节点开始运行后，子节点即可派发，边读取父节点的输出边处理。
+    A parent connected by streaming edges only just has to start before the child is
+    dispatched, the child then processes the parent's output while it is generated.
+
+    Args:
+        workflow (Workflow): 要执行的工作流 / The workflow to run.
+        run_node (Callable): ``run_node(workflow_data, node_id, task_name)`` 执行单个节点 / Runs one node.
+        max_workers (int): 同时运行的节点数上限 / Maximum number of nodes running at once.
+        task_concurrency (dict): 按任务名（如 ``llms.open_ai``）或模块名（如 ``llms``）限制并发 /
+            Concurrency limits keyed by task name (e.g. ``llms.open_ai``) or module name (e.g. ``llms``).
+        retry_exceptions (tuple): 表示节点需要稍后重试的异常类型，异常上的 ``retry_delay`` 为重试间隔 /
+            Exception types meaning the node must be retried later, ``retry_delay`` on the exception is the delay.
+        max_retries (int): 单个节点的最大重试次数 / Maximum number of retries for one node.
+        is_cancelled (Callable): 返回 True 时停止派发并取消还在排队的节点 /
+            When it returns True dispatching stops and nodes still queued are cancelled.
+        wait_for_runs (Callable): 重试异常带有 ``wait_for`` 运行 ID 时，返回这些运行全部结束后完成的 Future，
+            节点在 Future 完成时立即重试，``retry_delay`` 只作为兜底间隔 /
+            When a retry exception carries ``wait_for`` run ids, returns a Future completed once all of
+            those runs ended. The node is retried as soon as the Future completes and ``retry_delay`` is
+            only the fallback interval.
+        state_ref (dict): 增量模式下的状态引用，节点完成后把它的增量记录到状态存储，节点之间仍共享进程内的同一份数据 /
+            The state reference in delta mode. Each finished node's delta is recorded to the state
+            store while the nodes keep sharing the same in-process data.
+    """
+
+    def __init__(
+        self,
+        workflow: Workflow,
+        run_node: RunNode,
+        max_workers: int = 8,
+        task_concurrency: dict[str, int] | None = None,
+        retry_exceptions: tuple[type[BaseException], ...] = (),
+        max_retries: int = 300,
+        is_cancelled: Callable[[], bool] | None = None,
+        wait_for_runs: WaitForRuns | None = None,
+        state_ref: dict | None = None,
+    ):
+        self.workflow = workflow
+        self.run_node = run_node
+        self.max_workers = max(1, max_workers)
+        self.task_concurrency = task_concurrency or {}
+        self.retry_exceptions = retry_exceptions
+        self.max_retries = max_retries
+        self.is_cancelled = is_cancelled
+        self.wait_for_runs = wait_for_runs
+        self.state_ref = state_ref
+
+        self.dag = workflow.dag
+        self.priorities = self.dag.critical_path_lengths(self.estimate_weights())
+        self.retry_counts: Counter[str] = Counter()
+        # 节点进入就绪队列的时间，用于记录排队等待耗时
+        # When each node entered the ready queue, used to trace queue wait
+        self._ready_at: dict[str, float] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._streaming_sources: set[str] = set()
+        # 已在池线程中开始运行、等待调度循环处理的节点，_started_signal 完成时唤醒调度循环
+        # Nodes that started running on a pool thread and wait for the scheduling loop,
+        # _started_signal completes to wake the loop
+        self._started: list[str] = []
+        self._started_signal: Future = Future()
+
+    def estimate_weights(self) -> dict[str, float]:
+        weights = {}
+        for node_id in self.dag.get_all_nodes():
+            node = self.workflow.get_node(node_id)
+            if node is None:
+                weights[node_id] = 0
+            elif node.run_time > 0:
+                weights[node_id] = node.run_time
+            else:
+                weights[node_id] = DEFAULT_TASK_WEIGHTS.get(node.task_name.split(".")[0], 1)
+        return weights
+
+    def concurrency_key(self, task_name: str) -> str | None:
+        if task_name in self.task_concurrency:
+            return task_name
+        module = task_name.split(".")[0]
+        if module in self.task_concurrency:
+            return module
+        return None
+
+    def _push(self, heap: list, priority: float, node_id: str):
+        self._seq += 1
+        heapq.heappush(heap, (priority, self._seq, node_id))
+        self._ready_at.setdefault(node_id, time.time())
+
+    def _notify_started(self, node_id: str):
+        # 流在节点真正开始运行时才打开，之后子节点才会被派发
+        # The stream only opens once the node actually runs, its children are dispatched after that
+        if node_id in self._streaming_sources:
+            node_streams.open(self.workflow.record_id, node_id)
+        with self._lock:
+            self._started.append(node_id)
+            if not self._started_signal.done():
+                self._started_signal.set_result(None)
+
+    def _take_started(self) -> list[str]:
+        with self._lock:
+            started, self._started = self._started, []
+            if self._started_signal.done():
+                self._started_signal = Future()
+        return started
+
+    def _run_timed(self, node_id: str, task_name: str):
+        start_time = time.time()
+        ready_at = self._ready_at.pop(node_id, start_time)
+        if tracer := get_workflow_tracer(self.workflow.record_id):
+            tracer.add_span("queue_wait", ready_at, start_time, "queue", node_id, {"task_name": task_name})
+        self._notify_started(node_id)
+        self.run_node(self.workflow.data, node_id, task_name)
+        return time.time() - start_time
+
+    def _record_run_time(self, node_id: str, elapsed_time: float):
+        if self.workflow.is_node_skipped(node_id):
+            return
+        with self._lock:
+            self.workflow.data.setdefault("node_run_time", {})[node_id] = elapsed_time
+        node = self.workflow.get_node(node_id)
+        if node is not None:
+            node.run_time = elapsed_time
+
+    def _finish_streams(self, node_ids):
+        for node_id in node_ids:
+            node_streams.finish(self.workflow.record_id, node_id)
+
+    def run(self) -> dict:
+        all_nodes = self.dag.get_all_nodes()
+        streaming_parents = {node_id: self.workflow.get_streaming_parents(node_id) & set(self.dag.get_parents(node_id)) for node_id in all_nodes}
+        streaming_sources = set().union(*streaming_parents.values()) if streaming_parents else set()
+        self._streaming_sources = streaming_sources
+        # 还需等待结束的父节点数和还需等待开始的流式父节点数
+        # Parents that still have to finish and streaming parents that still have to start
+        remaining_parents = {node_id: len(self.dag.get_parents(node_id)) - len(streaming_parents[node_id]) for node_id in all_nodes}
+        unstarted_parents = {node_id: len(streaming_parents[node_id]) for node_id in all_nodes}
+        started: set[str] = set()
+        ready: list = []
+        delayed: list = []
+        for node_id in all_nodes:
+            if remaining_parents[node_id] == 0 and unstarted_parents[node_id] == 0:
+                self._push(ready, -self.priorities[node_id], node_id)
+
+        running: dict[Future, tuple[str, str, str | None]] = {}
+        # 等待子工作流运行结束的节点：Future -> (节点 ID, 兜底重试时间)
+        # Nodes waiting for sub-workflow runs: Future -> (node id, fallback retry time)
+        waiting: dict[Future, tuple[str, float]] = {}
+        running_by_key: Counter[str] = Counter()
+        error: WorkflowExecutionError | WorkflowCancelled | None = None
+
+        def release(child: str):
+            if remaining_parents[child] == 0 and unstarted_parents[child] == 0:
+                self._push(ready, -self.priorities[child], child)
+
+        def start(node_id: str):
+            if node_id in started:
+                return
+            started.add(node_id)
+            for child in self.dag.get_children(node_id):
+                if node_id in streaming_parents[child]:
+                    unstarted_parents[child] -= 1
+                    release(child)
+
+        def complete(node_id: str):
+            start(node_id)
+            if node_id in streaming_sources:
+                self._finish_streams([node_id])
+            for child in self.dag.get_children(node_id):
+                if node_id not in streaming_parents[child]:
+                    remaining_parents[child] -= 1
+                    release(child)
+
+        # 节点在进程共享的有上限线程池中运行，多个工作流同时运行时不会超额占用线程
+        # Nodes run on the shared bounded pool so concurrent workflows cannot oversubscribe threads
+        pool = get_shared_executor("workflow_nodes")
+        while ready or delayed or running or waiting:
+            if error is None and self.is_cancelled is not None and self.is_cancelled():
+                error = WorkflowCancelled(self.workflow.record_id)
+                ready.clear()
+                delayed.clear()
+                waiting.clear()
+                # 还没开始运行的节点直接取消，已经在运行的节点在自己的检查点退出
+                # Nodes that have not started are cancelled, running nodes exit at their own check points
+                for future in running:
+                    future.cancel()
+                self._finish_streams(streaming_sources)
+
+            now = time.time()
+            while delayed and delayed[0][0] <= now:
+                _, _, node_id = heapq.heappop(delayed)
+                self._push(ready, -self.priorities[node_id], node_id)
+            for future, (node_id, fallback_time) in list(waiting.items()):
+                if future.done() or fallback_time <= now:
+                    del waiting[future]
+                    future.cancel()
+                    self._push(ready, -self.priorities[node_id], node_id)
+
+            # 派发就绪节点，受总并发和任务类型并发限制的节点暂时放回队列
+            # Dispatch ready nodes, nodes blocked by a concurrency limit go back to the queue
+            held = []
+            while error is None and ready and len(running) < self.max_workers:
+                item = heapq.heappop(ready)
+                node_id = item[2]
+                node = self.workflow.get_node(node_id)
+                if node is None:
+                    complete(node_id)
+                    continue
+                task_name = node.task_name
+                key = self.concurrency_key(task_name)
+                if key is not None and running_by_key[key] >= self.task_concurrency[key]:
+                    held.append(item)
+                    continue
+                if key is not None:
+                    running_by_key[key] += 1
+                future = pool.submit(self._run_timed, node_id, task_name)
+                running[future] = (node_id, task_name, key)
+            for item in held:
+                heapq.heappush(ready, item)
+
+            if error is not None and not running:
+                break
+            if not running and not waiting:
+                if delayed:
+                    time.sleep(max(0.0, min(delayed[0][0] - time.time(), 1.0)))
+                continue
+
+            wake_times = [delayed[0][0]] if delayed else []
+            wake_times.extend(fallback_time for _, fallback_time in waiting.values())
+            timeout = max(0.0, min(wake_times) - time.time()) if wake_times else None
+            if self.is_cancelled is not None and error is None:
+                timeout = CANCEL_POLL_INTERVAL if timeout is None else min(timeout, CANCEL_POLL_INTERVAL)
+            started_signal = self._started_signal
+            done, _ = wait([*running, *waiting, started_signal], timeout=timeout, return_when=FIRST_COMPLETED)
+            # 节点开始运行后才释放只通过流式连线依赖它的子节点
+            # Children depending on a node by streaming edges only are released once it started running
+            for node_id in self._take_started():
+                start(node_id)
+            for future in done:
+                if future not in running:
+                    continue
+                node_id, task_name, key = running.pop(future)
+                if key is not None:
+                    running_by_key[key] -= 1
+                if future.cancelled():
+                    if node_id in streaming_sources:
+                        self._finish_streams([node_id])
+                    continue
+                exception = future.exception()
+                if exception is None:
+                    elapsed_time = future.result()
+                    self._record_run_time(node_id, elapsed_time)
+                    if self.state_ref is not None:
+                        workflow_state_store.record(self.state_ref, node_state_delta(self.workflow.data, node_id))
+                    mprint(f"<Node:{node_id}> Task {task_name} took {elapsed_time:.2f} seconds")
+                    complete(node_id)
+                elif self.retry_exceptions and isinstance(exception, self.retry_exceptions):
+                    self.retry_counts[node_id] += 1
+                    if self.retry_counts[node_id] > self.max_retries or self.workflow.has_async_task_timeout:
+                        error = error or WorkflowExecutionError("Task retries exhausted", node_id, task_name)
+                        continue
+                    retry_delay = getattr(exception, "retry_delay", 1)
+                    wait_for = getattr(exception, "wait_for", None)
+                    trace_event(
+                        self.workflow.record_id,
+                        "retry",
+                        "retry",
+                        node_id,
+                        attempt=self.retry_counts[node_id],
+                        wait_for_runs=len(wait_for or []),
+                    )
+                    if wait_for and self.wait_for_runs is not None:
+                        waiting[self.wait_for_runs(wait_for)] = (node_id, time.time() + retry_delay)
+                    else:
+                        heapq.heappush(delayed, (time.time() + retry_delay, self._seq, node_id))
+                        self._seq += 1
+                elif isinstance(exception, WorkflowCancelled):
+                    error = error or exception
+                else:
+                    mprint.error(f"Error in task {task_name} -> {node_id}: {exception}")
+                    error = error or WorkflowExecutionError(str(exception), node_id, task_name)
+
+            if error is not None:
+                # 出错后不再派发新节点，也不再等待重试的节点。结束所有流，正在读取的子节点不会一直等待
+                # After a failure stop dispatching and drop nodes waiting for retry. Finish every
+                # stream so children that are reading one do not wait forever
+                ready.clear()
+                delayed.clear()
+                waiting.clear()
+                self._finish_streams(streaming_sources)
+
+        if error is not None:
+            raise error
+        return self.workflow.data
@@ -0,0 +1,138 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+节点流式输出通道。
+
+以前 push_node_data 每个 token 都要从 diskcache 读出整个列表、追加后再整体写回，WebSocket
+端每 100ms 重新读取整个列表，开销随输出长度平方增长。现在每个节点有一个只追加的进程内流，
+写入是 O(1) 的追加，读取方带着游标阻塞等待新数据，只拿到游标之后的部分。
+
+Streaming output channel of nodes.
+
+push_node_data used to read the whole list from diskcache, append one token and write it
+back, and the WebSocket side re-read the whole list every 100 ms, so the cost grew
+quadratically with the output length. Each node now has an append-only in-process stream,
+writes are O(1) appends and readers block with a cursor and only get the items after it.
+
+流式连线也通过这些流传递数据：执行器派发上游节点时把它的流标记为 live，下游节点边读取
+边处理，上游节点运行结束后执行器将流标记为 finished。
+Streaming edges pass data through the same streams: the executor marks the stream of a
+source node live when dispatching it, target nodes process the chunks as they read them,
+and once the source node has finished the executor marks its stream finished.
+"""
+
+import time
+import threading
+from typing import Any
+
+
+# 流最后一次写入后保留的时间（秒）
+# How long a stream is kept after its last write, in seconds
+STREAM_EXPIRE = 60 * 3
+# live 且未结束的流保留的时间，上游节点可能很久之后才开始输出
+# How long a live stream that has not finished is kept, the source may start its output much later
+LIVE_STREAM_EXPIRE = 60 * 60
+
+# 上游输出字段在流中对应的数据键，未列出的字段与键同名
+# Stream data key of a source output field, fields not listed use their own name
+STREAM_CHUNK_KEYS = {"output": "content"}
+
+
+def is_end_marker(data: Any) -> bool:
+    return isinstance(data, dict) and data.get("end") is True
+
+
+class NodeDataStream:
+    def __init__(self):
+        self.updated_at = time.time()
+        self.closed = False
+        # 由执行器设置：上游节点正在同一进程中运行 / Set by the executor: the source node is running in this process
+        self.live = False
+        # 上游节点已运行结束，不会再有数据 / The source node has finished and no more data will come
+        self.finished = False
+        self._items: list[Any] = []
+        self._condition = threading.Condition()
+
+    def append(self, data: Any):
+        with self._condition:
+            self._items.append(data)
+            self.updated_at = time.time()
+            if is_end_marker(data):
+                self.closed = True
+            self._condition.notify_all()
+
+    def read(self, cursor: int = 0, timeout: float | None = None, until_finished: bool = False) -> list[Any]:
+        """
+        返回游标之后的数据，没有新数据时最多阻塞 timeout 秒。until_finished 为 True 时结束标记不会
+        停止等待，直到上游节点运行结束。
+        Return the items after the cursor, blocking for up to timeout seconds when there is
+        nothing new. With until_finished an end marker does not stop the wait, only the source
+        node finishing does.
+        """
+        with self._condition:
+            if until_finished:
+                self._condition.wait_for(lambda: len(self._items) > cursor or self.finished, timeout=timeout)
+            else:
+                self._condition.wait_for(lambda: len(self._items) > cursor or self.closed, timeout=timeout)
+            return self._items[cursor:]
+
+    def finish(self):
+        with self._condition:
+            if not self.closed:
+                # 让只等待结束标记的读取方（如 WebSocket）也能结束 / Let readers waiting for an end marker (e.g. WebSockets) stop too
+                self._items.append({"end": True})
+            self.finished = True
+            self.closed = True
+            self.updated_at = time.time()
+            self._condition.notify_all()
+
+    def expired(self, now: float, expire: float) -> bool:
+        if self.live and not self.finished:
+            return now - self.updated_at > max(expire, LIVE_STREAM_EXPIRE)
+        return now - self.updated_at > expire
+
+
+class NodeStreamRegistry:
+    def __init__(self, expire: float = STREAM_EXPIRE):
+        self.expire = expire
+        self._streams: dict[tuple[str, str], NodeDataStream] = {}
+        self._lock = threading.Lock()
+
+    def get(self, record_id: str, node_id: str) -> NodeDataStream:
+        with self._lock:
+            stream = self._streams.get((record_id, node_id))
+            if stream is not None:
+                return stream
+
+            # 创建新流时顺带清理过期的流
+            # Drop expired streams when a new one is created
+            now = time.time()
+            for key in [key for key, _stream in self._streams.items() if _stream.expired(now, self.expire)]:
+                del self._streams[key]
+            stream = NodeDataStream()
+            self._streams[(record_id, node_id)] = stream
+            return stream
+
+    def push(self, record_id: str, node_id: str, data: Any):
+        self.get(record_id, node_id).append(data)
+
+    def find(self, record_id: str, node_id: str) -> NodeDataStream | None:
+        with self._lock:
+            return self._streams.get((record_id, node_id))
+
+    def open(self, record_id: str, node_id: str) -> NodeDataStream:
+        """
+        将上游节点的流标记为 live，下游节点可以边生成边读取。
+        Mark the stream of a source node live so target nodes can read it while it is generated.
+        """
+        stream = self.get(record_id, node_id)
+        stream.live = True
+        return stream
+
+    def finish(self, record_id: str, node_id: str):
+        stream = self.find(record_id, node_id)
+        if stream is not None:
+            stream.finish()
+
+
+node_streams = NodeStreamRegistry()
@@ -0,0 +1,109 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+节点进度上报的合并写入。
+
+以前每个任务结束后 report_node_status 都会从 SQLite 读取整个运行记录的 JSON，线性查找节点，
+再读改写 diskcache 中的 finished_nodes 列表。现在节点状态先记录在进程内，由后台线程按固定间隔
+把同一运行的所有更新合并成一次缓存写入；列表中只保存前端需要的精简节点信息。
+
+Coalesced node progress reporting.
+
+report_node_status used to read the whole run record JSON from SQLite after every task,
+search the node linearly and read-modify-write the finished_nodes list in diskcache. Node
+statuses are now kept in process and a background thread merges all updates of a run into
+one cache write per interval. The list only holds the compact node info the frontend needs.
+"""
+
+import time
+import threading
+from copy import deepcopy
+from typing import Any
+
+from utilities.config import cache
+
+
+# 两次写入缓存之间的最长间隔（秒），即进度上报的最大延迟
+# Longest interval in seconds between two cache writes, i.e. the maximum progress latency
+PROGRESS_FLUSH_INTERVAL = 0.2
+PROGRESS_EXPIRE = 60 * 60
+
+# 只有输出节点需要完整的节点数据用于展示结果
+# Only output nodes need the full node data to display results
+_NODE_DATA_CATEGORIES = ("outputs",)
+
+
+def finished_nodes_key(record_id: str) -> str:
+    return f"workflow:record:finished_nodes:{record_id}"
+
+
+def compact_node_progress(node_data: dict, status: int) -> dict[str, Any]:
+    progress = {
+        "id": node_data["id"],
+        "type": node_data.get("type"),
+        "category": node_data.get("category"),
+        "status": status,
+    }
+    if node_data.get("category") in _NODE_DATA_CATEGORIES:
+        progress["data"] = deepcopy(node_data["data"])
+    return progress
+
+
+class NodeProgressAggregator:
+    def __init__(self, flush_interval: float = PROGRESS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending: dict[str, dict[str, dict[str, Any]]] = {}
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def report(self, record_id: str, node_data: dict, status: int):
+        """
+        记录节点进度，最迟 flush_interval 秒后写入缓存。
+        Record node progress, it is written to the cache within flush_interval seconds.
+        """
+        progress = compact_node_progress(node_data, status)
+        with self._condition:
+            self._pending.setdefault(record_id, {})[progress["id"]] = progress
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="node-progress-flush", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def flush(self, record_id: str | None = None):
+        """
+        立即写入等待中的进度，record_id 为空时写入所有运行。
+        Write pending progress now, for all runs when record_id is empty.
+        """
+        with self._condition:
+            if record_id is None:
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {record_id: self._pending.pop(record_id)} if record_id in self._pending else {}
+
+        # 写入由同一把锁串行化，避免两次合并互相覆盖
+        # Writes are serialized by one lock so two merges cannot overwrite each other
+        with self._flush_lock:
+            for _record_id, updates in pending.items():
+                key = finished_nodes_key(_record_id)
+                finished_nodes = cache.get(key, [])
+                positions = {node.get("id"): index for index, node in enumerate(finished_nodes)}
+                for node_id, progress in updates.items():
+                    if node_id in positions:
+                        finished_nodes[positions[node_id]] = progress
+                    else:
+                        finished_nodes.append(progress)
+                cache.set(key, finished_nodes, PROGRESS_EXPIRE)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            # 合并这段时间内的更新
+            # Coalesce the updates arriving in this interval
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+node_progress = NodeProgressAggregator()
@@ -0,0 +1,104 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+工作流运行完成事件。
+
+调用子工作流的节点（workflow_invoke、workflow_loop、workflow_selector）以前每秒重试一次，
+每次都要查询所有子运行记录。运行结束时 report_workflow_status 会在这里发布完成事件，
+父节点只订阅自己等待的子运行，全部完成后立即被唤醒，运行期间不再查询数据库。
+
+Workflow run completion events.
+
+Nodes that call sub-workflows (workflow_invoke, workflow_loop, workflow_selector) used to
+retry every second and query every child run record each time. report_workflow_status now
+publishes a completion event here when a run ends, the parent node subscribes to the child
+runs it waits for and is woken as soon as all of them finish, without querying the database
+while they run.
+"""
+
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import Future, InvalidStateError
+
+from models import WorkflowRunRecord
+from utilities.config import cache
+
+
+# 没有收到事件时（例如子运行在另一个进程中结束）重新检查的间隔（秒）
+# Interval in seconds to recheck when no event arrives, e.g. the child run ended in another process
+RUN_EVENT_FALLBACK_DELAY = 10
+
+_RUNNING_CACHE_STATUS = 202
+_MAX_REMEMBERED_RUNS = 4096
+
+
+class WorkflowRunEvents:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statuses: OrderedDict[str, int] = OrderedDict()
+        self._waiters: dict[str, list[tuple[set[str], Future]]] = {}
+
+    def publish(self, record_id: str, status: int):
+        """
+        发布运行结束事件，唤醒等待这个运行的订阅者。
+        Publish that a run ended and wake the subscribers waiting for it.
+        """
+        ready: list[Future] = []
+        with self._lock:
+            self._statuses[record_id] = status
+            self._statuses.move_to_end(record_id)
+            while len(self._statuses) > _MAX_REMEMBERED_RUNS:
+                self._statuses.popitem(last=False)
+            for pending, future in self._waiters.pop(record_id, []):
+                pending.discard(record_id)
+                if not pending:
+                    ready.append(future)
+        for future in ready:
+            try:
+                future.set_result(None)
+            except InvalidStateError:
+                # 订阅者已经放弃等待
+                # The subscriber stopped waiting
+                pass
+
+    def get_status(self, record_id: str) -> int | None:
+        """
+        获取运行的结束状态，运行尚未结束时返回 None。
+        Get the final status of a run, None while it is still running.
+        """
+        with self._lock:
+            status = self._statuses.get(record_id)
+        if status is not None:
+            return status
+
+        status = cache.get(f"workflow:record:{record_id}")
+        if status is not None:
+            return None if status == _RUNNING_CACHE_STATUS else status
+
+        # 缓存过期后才回退到数据库
+        # Fall back to the database only after the cache entry expired
+        record = WorkflowRunRecord.get_or_none(WorkflowRunRecord.rid == record_id)
+        if record is None:
+            return 404
+        if record.status in ("RUNNING", "QUEUED"):
+            return None
+        return 200 if record.status == "FINISHED" else 500
+
+    def wait_future(self, record_ids: Iterable[str]) -> Future:
+        """
+        返回一个 Future，所有运行结束后完成。
+        Return a Future that completes once all of the runs ended.
+        """
+        future: Future = Future()
+        pending = {record_id for record_id in record_ids if self.get_status(record_id) is None}
+        with self._lock:
+            pending = {record_id for record_id in pending if record_id not in self._statuses}
+            for record_id in pending:
+                self._waiters.setdefault(record_id, []).append((pending, future))
+        if not pending:
+            future.set_result(None)
+        return future
+
+
+workflow_run_events = WorkflowRunEvents()
@@ -0,0 +1,281 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+增量模式下的工作流运行状态。
+
+默认情况下每个 Celery 任务都会接收并返回完整的 workflow_data，每一跳都要把整个工作流
+序列化进 SQLite broker 和结果后端。增量模式下任务之间只传递一个轻量的状态引用，
+每个任务只返回自己产生的字段增量（node_id → field → value），增量被应用到同一份
+权威状态上。
+
+Workflow run state for delta mode.
+
+By default every Celery task receives and returns the full workflow_data, so each hop
+serializes the whole workflow into the SQLite broker and result backend. In delta mode
+tasks pass a small state reference instead, each task returns only the field deltas it
+produced (node_id → field → value) and the deltas are applied to one authoritative state.
+"""
+
+import threading
+from copy import deepcopy
+from typing import Any
+
+from utilities.config import cache
+from utilities.general import mprint_with_name
+
+
+mprint = mprint_with_name(name="Workflow State")
+
+STATE_REF_KEY = "__state_ref__"
+STATE_MODE_FULL = "full"
+STATE_MODE_DELTA = "delta"
+STATE_EXPIRE = 60 * 60 * 24
+
+# 这些键在运行过程中不会被任务修改，不参与增量计算
+# These keys are not modified by tasks while running and are excluded from deltas
+STATIC_KEYS = ("nodes", "edges", "related_workflows", "ui")
+# 就绪队列执行器随节点增量记录的顶层键 / Top-level keys the ready-queue executor records with node deltas
+RUN_STATE_KEYS = ("skipped_nodes", "node_run_time")
+
+
+def is_state_ref(data: Any) -> bool:
+    return isinstance(data, dict) and data.get(STATE_REF_KEY, False) is True
+
+
+def make_state_ref(workflow_data: dict, delta: dict | None = None) -> dict:
+    ref = {
+        STATE_REF_KEY: True,
+        "wid": workflow_data.get("wid", ""),
+        "rid": workflow_data.get("rid", ""),
+    }
+    if delta is not None:
+        ref["delta"] = delta
+    return ref
+
+
+def snapshot_state(workflow_data: dict) -> dict:
+    """
+    记录计算增量所需的最小快照：每个节点的字段值、状态、运行时间，以及非静态的顶层键。
+    Take the minimal snapshot needed to compute a delta: field values, status and run time
+    of every node plus the non-static top-level keys.
+    """
+    nodes = {}
+    for node in workflow_data.get("nodes", []):
+        nodes[node["id"]] = {
+            "fields": {field: field_data.get("value") for field, field_data in node["data"]["template"].items()},
+            "status": node["data"].get("status", 0),
+            "run_time": node.get("run_time", -1),
+        }
+    data = deepcopy({key: value for key, value in workflow_data.items() if key not in STATIC_KEYS})
+    return {"nodes": nodes, "data": data}
+
+
+def diff_state(before: dict, workflow_data: dict) -> dict:
+    nodes_delta = {}
+    for node in workflow_data.get("nodes", []):
+        node_before = before["nodes"].get(node["id"], {"fields": {}, "status": 0, "run_time": -1})
+        node_delta = {}
+        fields = {}
+        for field, field_data in node["data"]["template"].items():
+            value = field_data.get("value")
+            if field not in node_before["fields"]:
+                fields[field] = value
+                continue
+            previous = node_before["fields"][field]
+            if value is not previous and value != previous:
+                fields[field] = value
+        if fields:
+            node_delta["fields"] = fields
+        if node["data"].get("status", 0) != node_before["status"]:
+            node_delta["status"] = node["data"].get("status", 0)
+        if node.get("run_time", -1) != node_before["run_time"]:
+            node_delta["run_time"] = node.get("run_time", -1)
+        if node_delta:
+            nodes_delta[node["id"]] = node_delta
+
+    data_delta = {}
+    for key, value in workflow_data.items():
+        if key in STATIC_KEYS:
+            continue
+        if key not in before["data"] or before["data"][key] != value:
+            data_delta[key] = value
+    removed = [key for key in before["data"] if key not in workflow_data]
+
+    delta: dict[str, Any] = {}
+    if nodes_delta:
+        delta["nodes"] = nodes_delta
+    if data_delta:
+        delta["data"] = data_delta
+    if removed:
+        delta["removed"] = removed
+    return delta
+
+
+def node_state_delta(workflow_data: dict, node_id: str) -> dict:
+    """
+    单个节点的增量：字段值、状态、运行时间，以及运行过程中记录的跳过节点和运行时间。
+    就绪队列执行器在节点完成后记录，其他节点可能仍在修改共享状态，所以只复制这些键。
+    The delta of a single node: its field values, status and run time plus the skipped
+    nodes and run times recorded while running. The ready-queue executor records it once
+    the node finished, other nodes may still be changing the shared state so only these
+    keys are copied.
+    """
+    delta: dict[str, Any] = {}
+    node = next((node for node in workflow_data.get("nodes", []) if node["id"] == node_id), None)
+    if node is not None:
+        delta["nodes"] = {
+            node_id: {
+                "fields": {field: field_data.get("value") for field, field_data in list(node["data"]["template"].items())},
+                "status": node["data"].get("status", 0),
+                "run_time": node.get("run_time", -1),
+            }
+        }
+    data = {key: deepcopy(workflow_data[key]) for key in RUN_STATE_KEYS if key in workflow_data}
+    if data:
+        delta["data"] = data
+    return delta
+
+
+def apply_state_delta(workflow_data: dict, delta: dict) -> dict:
+    nodes = {node["id"]: node for node in workflow_data.get("nodes", [])}
+    for node_id, node_delta in delta.get("nodes", {}).items():
+        node = nodes.get(node_id)
+        if node is None:
+            mprint.error(f"Node {node_id} not found when applying state delta")
+            continue
+        template = node["data"]["template"]
+        for field, value in node_delta.get("fields", {}).items():
+            template.setdefault(field, {})["value"] = value
+        if "status" in node_delta:
+            node["data"]["status"] = node_delta["status"]
+        if "run_time" in node_delta:
+            node["run_time"] = node_delta["run_time"]
+    for key, value in delta.get("data", {}).items():
+        workflow_data[key] = deepcopy(value)
+    for key in delta.get("removed", []):
+        workflow_data.pop(key, None)
+    return workflow_data
+
+
+class WorkflowStateStore:
+    """
+    每个运行记录一份权威状态。内存中保留一份可直接使用的状态，同时把初始状态和增量日志
+    写入 diskcache，其他进程可以通过回放增量得到同样的状态。
+    One authoritative state per run record. A ready-to-use copy is kept in memory while the
+    base state and an append-only delta log are written to diskcache, so other processes can
+    rebuild the same state by replaying the deltas.
+    """
+
+    def __init__(self):
+        self._states: dict[str, tuple[dict, int]] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _base_key(rid: str) -> str:
+        return f"workflow:record:{rid}:state"
+
+    @staticmethod
+    def _seq_key(rid: str) -> str:
+        return f"workflow:record:{rid}:state:seq"
+
+    @staticmethod
+    def _delta_key(rid: str, seq: int) -> str:
+        return f"workflow:record:{rid}:state:delta:{seq}"
+
+    def create(self, workflow_data: dict) -> dict:
+        rid = workflow_data.get("rid", "")
+        with self._lock:
+            cache.set(self._base_key(rid), workflow_data, STATE_EXPIRE)
+            cache.set(self._seq_key(rid), 0, STATE_EXPIRE)
+            self._states[rid] = (workflow_data, 0)
+        return make_state_ref(workflow_data)
+
+    def load(self, ref: dict) -> dict:
+        rid = ref.get("rid", "")
+        with self._lock:
+            seq = cache.get(self._seq_key(rid), 0)
+            state, applied_seq = self._states.get(rid, (None, 0))
+            if state is None:
+                state = cache.get(self._base_key(rid))
+                if state is None:
+                    raise KeyError(f"Workflow state {rid} not found")
+                applied_seq = 0
+            # 其他进程可能追加了新的增量
+            # Other processes may have appended new deltas
+            for delta_seq in range(applied_seq + 1, seq + 1):
+                delta = cache.get(self._delta_key(rid, delta_seq))
+                if delta is not None:
+                    apply_state_delta(state, delta)
+            self._states[rid] = (state, seq)
+            return state
+
+    def apply(self, ref: dict, delta: dict):
+        if not delta:
+            return
+        rid = ref.get("rid", "")
+        with self._lock:
+            state = self.load(ref)
+            seq = cache.incr(self._seq_key(rid), default=0)
+            cache.set(self._delta_key(rid, seq), delta, STATE_EXPIRE)
+            apply_state_delta(state, delta)
+            self._states[rid] = (state, seq)
+
+    def record(self, ref: dict, delta: dict):
+        """
+        只把增量追加到日志，不修改内存中的状态。用于内存状态已经包含这些修改的调用方，
+        例如就绪队列执行器中共享同一份状态的节点。
+        Only append the delta to the log without touching the in-memory state. For callers
+        whose in-memory state already has the changes, e.g. nodes sharing one state in the
+        ready-queue executor.
+        """
+        if not delta:
+            return
+        rid = ref.get("rid", "")
+        with self._lock:
+            seq = cache.incr(self._seq_key(rid), default=0)
+            cache.set(self._delta_key(rid, seq), delta, STATE_EXPIRE)
+            state, _ = self._states.get(rid, (None, 0))
+            if state is not None:
+                self._states[rid] = (state, seq)
+
+    def discard(self, rid: str):
+        with self._lock:
+            self._states.pop(rid, None)
+            seq = cache.get(self._seq_key(rid), 0)
+            for delta_seq in range(1, seq + 1):
+                cache.delete(self._delta_key(rid, delta_seq))
+            cache.delete(self._seq_key(rid))
+            cache.delete(self._base_key(rid))
+
+
+workflow_state_store = WorkflowStateStore()
+
+
+class WorkflowStateSession:
+    """
+    在任务入口把状态引用展开为完整的 workflow_data，在出口计算增量并写回权威状态。
+    传入完整 workflow_data 时不做任何处理，保持原有行为。
+    Expand a state reference into the full workflow_data when a task starts, then compute
+    the delta and apply it to the authoritative state when it ends. Full workflow_data
+    payloads pass through untouched.
+    """
+
+    def __init__(self, payload: Any):
+        self.ref = payload if is_state_ref(payload) else None
+        if self.ref is None:
+            self.workflow_data = payload
+            self.before = None
+        else:
+            self.workflow_data = workflow_state_store.load(self.ref)
+            self.before = snapshot_state(self.workflow_data)
+
+    @property
+    def is_delta(self) -> bool:
+        return self.ref is not None
+
+    def finish(self, result: Any) -> Any:
+        if self.ref is None or self.before is None or not isinstance(result, dict):
+            return result
+        delta = diff_state(self.before, result)
+        workflow_state_store.apply(self.ref, delta)
+        return make_state_ref(self.ref, delta)
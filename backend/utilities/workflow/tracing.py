@@ -0,0 +1,181 @@
+# @Author: Bi Ying
+# @Date:   2026-10-18
+"""
+工作流运行的节点级追踪。
+
+每次运行在进程内有一个 WorkflowTracer，节点的排队等待、执行、状态序列化、数据库上报、
+LLM 请求和重试都记录为 span。运行结束时 report_workflow_status 把追踪导出为
+Chrome trace 格式（可以直接在 chrome://tracing 或 Perfetto 中打开）并保存到
+WorkflowRunRecord.trace。
+
+Node level tracing of workflow runs.
+
+Each run has one in-process WorkflowTracer. Queue wait, execution, state serialization,
+DB reporting, LLM requests and retries of every node are recorded as spans. When the run
+ends report_workflow_status exports the trace in Chrome trace format (it opens directly in
+chrome://tracing or Perfetto) and saves it to WorkflowRunRecord.trace.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+# 单次运行最多记录的 span 数，超过后丢弃新的 span
+# Maximum number of spans recorded for one run, new spans are dropped beyond it
+MAX_SPANS = 10000
+
+
+class WorkflowTracer:
+    def __init__(self, record_id: str):
+        self.record_id = record_id
+        self.start_time = time.time()
+        self.dropped_spans = 0
+        self._spans: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_span(
+        self,
+        name: str,
+        start_time: float,
+        end_time: float,
+        category: str = "node",
+        node_id: str | None = None,
+        attributes: dict[str, Any] | None = None,
+    ):
+        span = {
+            "name": name,
+            "category": category,
+            "node_id": node_id,
+            "start_time": start_time,
+            "duration": max(0.0, end_time - start_time),
+            "thread_id": threading.get_ident(),
+            "thread_name": threading.current_thread().name,
+            "attributes": attributes or {},
+        }
+        with self._lock:
+            if len(self._spans) >= MAX_SPANS:
+                self.dropped_spans += 1
+                return
+            self._spans.append(span)
+
+    def add_event(self, name: str, category: str = "node", node_id: str | None = None, **attributes: Any):
+        """
+        记录一个没有持续时间的事件，例如重试。
+        Record an event without duration, e.g. a retry.
+        """
+        now = time.time()
+        self.add_span(name, now, now, category, node_id, attributes)
+
+    @contextmanager
+    def span(self, name: str, category: str = "node", node_id: str | None = None, **attributes: Any) -> Iterator[dict[str, Any]]:
+        """
+        记录代码块的耗时，返回的字典可以在代码块中补充属性（例如 token 数）。
+        Time a block of code, attributes such as token counts can be added to the yielded dict.
+        """
+        start_time = time.time()
+        try:
+            yield attributes
+        finally:
+            self.add_span(name, start_time, time.time(), category, node_id, attributes)
+
+    @property
+    def spans(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return list(self._spans)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        按节点和类别汇总耗时（秒）。
+        Total time in seconds per node and category.
+        """
+        totals: dict[str, dict[str, float]] = {}
+        for span in self.spans:
+            node_totals = totals.setdefault(span["node_id"] or "workflow", {})
+            node_totals[span["category"]] = node_totals.get(span["category"], 0.0) + span["duration"]
+        return totals
+
+    def to_chrome_trace(self) -> dict[str, Any]:
+        spans = self.spans
+        events: list[dict[str, Any]] = []
+        thread_names: dict[int, str] = {}
+        for span in spans:
+            thread_names[span["thread_id"]] = span["thread_name"]
+            args = dict(span["attributes"])
+            if span["node_id"]:
+                args["node_id"] = span["node_id"]
+            event = {
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X" if span["duration"] > 0 else "i",
+                "ts": round((span["start_time"] - self.start_time) * 1_000_000),
+                "pid": 1,
+                "tid": span["thread_id"],
+                "args": args,
+            }
+            if event["ph"] == "X":
+                event["dur"] = round(span["duration"] * 1_000_000)
+            else:
+                event["s"] = "t"
+            events.append(event)
+
+        for thread_id, thread_name in thread_names.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": thread_id, "args": {"name": thread_name}})
+
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "record_id": self.record_id,
+                "start_time": self.start_time,
+                "dropped_spans": self.dropped_spans,
+                "summary": self.summary(),
+            },
+        }
+
+
+_tracers: dict[str, WorkflowTracer] = {}
+_tracers_lock = threading.Lock()
+
+
+def start_workflow_trace(record_id: str) -> WorkflowTracer:
+    with _tracers_lock:
+        tracer = _tracers.get(record_id)
+        if tracer is None:
+            tracer = WorkflowTracer(record_id)
+            _tracers[record_id] = tracer
+        return tracer
+
+
+def get_workflow_tracer(record_id: str | None) -> WorkflowTracer | None:
+    if not record_id:
+        return None
+    return _tracers.get(record_id)
+
+
+def pop_workflow_tracer(record_id: str | None) -> WorkflowTracer | None:
+    if not record_id:
+        return None
+    with _tracers_lock:
+        return _tracers.pop(record_id, None)
+
+
+@contextmanager
+def trace_span(record_id: str | None, name: str, category: str = "node", node_id: str | None = None, **attributes: Any) -> Iterator[dict[str, Any]]:
+    """
+    在运行的追踪中记录 span，运行没有开启追踪时不做任何事。
+    Record a span on the run's trace, does nothing when tracing is off for the run.
+    """
+    tracer = get_workflow_tracer(record_id)
+    if tracer is None:
+        yield attributes
+        return
+    with tracer.span(name, category, node_id, **attributes) as span_attributes:
+        yield span_attributes
+
+
+def trace_event(record_id: str | None, name: str, category: str = "node", node_id: str | None = None, **attributes: Any):
+    tracer = get_workflow_tracer(record_id)
+    if tracer is not None:
+        tracer.add_event(name, category, node_id, **attributes)
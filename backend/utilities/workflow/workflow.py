@@ -2,9 +2,11 @@
 # @Date:   2023-04-13 18:51:34
 import uuid
 import time
+import threading
 from copy import deepcopy
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Any, Union
+from typing import List, Any, Iterator, Union
 from functools import cached_property
 
 from models import Workflow as WorkflowModel
@@ -12,6 +14,12 @@ from models import WorkflowRunRecord, Message
 from utilities.config import cache
 from utilities.general import mprint_with_name
 
+from .run_events import workflow_run_events
+from .tracing import pop_workflow_tracer
+from .progress import node_progress
+from .cancel import forget_cancelled_run, raise_if_cancelled
+from .node_stream import node_streams, STREAM_CHUNK_KEYS
+
 
 mprint = mprint_with_name(name="Workflow")
 
@@ -21,16 +29,49 @@ ASYNC_TASKS = [
     "tools.workflow_invoke",
 ]
 
+# 一次任务调用内反复用同一个 workflow_data 字典构造 Workflow 时复用已解析的对象。
+# 缓存只存在于 parsed_workflow_scope 内并按线程隔离，任务结束后释放
+# Re-wrapping the same workflow_data dict within one task invocation reuses the parsed Workflow.
+# The cache only lives inside parsed_workflow_scope, per thread, and is dropped when the task ends
+_parsed_workflows = threading.local()
+
+# 读取流式连线时检查运行是否被停止的间隔秒数
+# Seconds between checks for a stopped run while reading a streaming edge
+STREAM_POLL_INTERVAL = 1.0
+
+# 能边生成边读取输入的任务及其字段，这些任务用 iter_node_field_chunks 读取输入。
+# 连到其他任务或字段的流式连线按普通连线处理，否则下游节点会在上游完成前读到旧值
+# Tasks and fields that read their input while it is generated, with iter_node_field_chunks.
+# Streaming edges to any other task or field are treated as normal edges, otherwise the
+# target would read a stale value before the source finished
+STREAMING_INPUTS = {
+    "output.audio": ("content",),
+}
+
+
+def is_streaming_edge(edge: dict) -> bool:
+    """
+    流式连线：下游节点在上游节点运行的同时逐段读取输出，而不是等待完整结果。只有就绪队列
+    调度器支持流式连线，按层调度时忽略这个标记，下游节点总是读取完整结果。
+    A streaming edge lets the target read the output chunk by chunk while the source runs
+    instead of waiting for the whole result. Only the ready-queue scheduler supports them,
+    the layered scheduler ignores the flag and targets always read the whole result.
+    """
+    return bool((edge.get("data") or {}).get("streaming"))
+
 
 class DAG:
     def __init__(self):
         self.nodes = set()
         self.edges = {}
+        self.reverse_edges = {}
 
     def add_node(self, node):
         self.nodes.add(node)
         if node not in self.edges:
             self.edges[node] = set()
+        if node not in self.reverse_edges:
+            self.reverse_edges[node] = set()
 
     def add_edge(self, start, end):
         if start not in self.nodes:
@@ -38,13 +79,10 @@ class DAG:
         if end not in self.nodes:
             self.add_node(end)
         self.edges[start].add(end)
+        self.reverse_edges[end].add(start)
 
     def get_parents(self, node):
-        parents = []
-        for start, ends in self.edges.items():
-            if node in ends:
-                parents.append(start)
-        return parents
+        return list(self.reverse_edges.get(node, ()))
 
     def get_children(self, node):
         return list(self.edges[node])
@@ -113,6 +151,19 @@ class DAG:
 
         return layered_result
 
+    def critical_path_lengths(self, weights: dict | None = None) -> dict:
+        """
+        计算每个节点到终点的最长路径长度（包含节点自身的权重），用于优先调度关键路径上的节点。
+        Compute the longest weighted path from each node to a sink, including the node itself,
+        so nodes on the critical path can be dispatched first.
+        """
+        weights = weights or {}
+        lengths = {}
+        for node in reversed(self.topological_sort()):
+            longest_child = max((lengths[child] for child in self.edges[node]), default=0)
+            lengths[node] = weights.get(node, 1) + longest_child
+        return lengths
+
 
 class Node:
     def __init__(self, node_data: dict):
@@ -174,38 +225,194 @@ class Node:
         self.__node_data["run_time"] = value
 
 
+@contextmanager
+def parsed_workflow_scope() -> Iterator[None]:
+    """
+    在当前线程中开启一次任务调用的 Workflow 复用作用域，嵌套调用沿用外层作用域。
+    Open the Workflow reuse scope of one task invocation in the current thread, nested
+    calls reuse the outer scope.
+    """
+    if getattr(_parsed_workflows, "workflows", None) is not None:
+        yield
+        return
+    _parsed_workflows.workflows = {}
+    try:
+        yield
+    finally:
+        _parsed_workflows.workflows = None
+
+
 class Workflow:
     def __init__(self, workflow_data: dict):
         self.workflow_data = workflow_data
-        if "original_workflow_data" not in workflow_data:
-            self.original_workflow_data = deepcopy(workflow_data)
-            self.workflow_data["original_workflow_data"] = self.original_workflow_data
-        else:
-            self.original_workflow_data = workflow_data["original_workflow_data"]
         self.related_workflows: dict[str, dict] = workflow_data.get("related_workflows", {})
         self.edges = [edge for edge in self.workflow_data["edges"] if not edge.get("ignored", False)]
+        self.build_edge_index()
         self.workflow_data["nodes"] = [node for node in self.workflow_data["nodes"] if not node.get("ignored", False)]
         self.__node_id_map = workflow_data.get("__node_id_map", {})
         self.nodes = self.parse_nodes()
         self.dag = self.create_dag()
         self.workflow_id: str = workflow_data.get("wid", "")
         self.record_id: str = workflow_data.get("rid", "")
+        self._parsed_edges = (self.workflow_data["edges"], len(self.workflow_data["edges"]))
+        self._parsed_nodes = (self.workflow_data["nodes"], len(self.workflow_data["nodes"]))
+        self.remember()
+
+    @classmethod
+    def from_data(cls, workflow_data: dict) -> "Workflow":
+        """
+        如果这个字典已经在当前的 parsed_workflow_scope 中被解析过且节点和连线没有被替换，
+        直接复用已解析的 Workflow，否则重新解析。
+        Return the Workflow already parsed for this exact dict in the current
+        parsed_workflow_scope when its nodes and edges have not been replaced since
+        parsing, otherwise parse it again.
+        """
+        workflows = getattr(_parsed_workflows, "workflows", None)
+        workflow = workflows.get(id(workflow_data)) if workflows is not None else None
+        if workflow is None or not workflow.is_parsed_from(workflow_data):
+            return cls(workflow_data)
+        workflow.related_workflows = workflow_data.get("related_workflows", {})
+        workflow.workflow_id = workflow_data.get("wid", "")
+        workflow.record_id = workflow_data.get("rid", "")
+        return workflow
+
+    def is_parsed_from(self, workflow_data: dict) -> bool:
+        if self.workflow_data is not workflow_data:
+            return False
+        edges, edges_count = self._parsed_edges
+        nodes, nodes_count = self._parsed_nodes
+        return (
+            workflow_data.get("edges") is edges
+            and len(edges) == edges_count
+            and workflow_data.get("nodes") is nodes
+            and len(nodes) == nodes_count
+        )
+
+    def remember(self):
+        # 作用域内持有字典的强引用，保证作用域结束前 id 不会被其他对象复用
+        # The scope holds a strong reference so the id cannot be reused before the scope ends
+        workflows = getattr(_parsed_workflows, "workflows", None)
+        if workflows is not None:
+            workflows[id(self.workflow_data)] = self
+
+    @cached_property
+    def original_workflow_data(self) -> dict:
+        """
+        运行前的原始工作流数据。不再在每个任务负载里携带一份深拷贝，
+        而是按需从运行记录中读取（运行记录创建时保存的就是原始数据）。
+        The workflow data as it was before the run started. Instead of carrying a
+        deepcopy in every task payload, it is read lazily from the run record,
+        which stores the original data when the run is created.
+        """
+        if "original_workflow_data" in self.workflow_data:
+            # 兼容旧版本任务负载 / Payloads queued by older versions
+            return self.workflow_data["original_workflow_data"]
+        if not self.record_id:
+            return {}
+        try:
+            return WorkflowRunRecord.get(WorkflowRunRecord.rid == self.record_id).data
+        except Exception as e:
+            mprint.error(f"load original workflow data failed: {e}")
+            return {}
 
     def parse_nodes(self):
-        nodes_list: list[dict] = self.workflow_data["nodes"]
+        # 不能原地修改 nodes 列表，同一份 workflow_data 可能正被其他线程中的任务解析
+        # Do not mutate the nodes list in place, tasks in other threads may be parsing the same workflow_data
+        nodes_list: list[dict] = list(self.workflow_data["nodes"])
         nodes: dict[str, Node] = {}
-        while len(nodes_list) > 0:
-            node = nodes_list.pop(0)
+        for node in nodes_list:
             if node.get("ignored", False):
                 continue
-            node_obj = Node(node)
-            nodes[node["id"]] = node_obj
-            continue
+            nodes[node["id"]] = Node(node)
 
         # 更新原始数据中的nodes
         self.workflow_data["nodes"] = [node.data for node in nodes.values()]
         return nodes
 
+    def build_edge_index(self):
+        """
+        为连线建立索引，避免每次读取字段或标记跳过分支时都遍历全部连线。
+        Build edge indexes so field resolution and branch skipping
+        do not need to scan every edge.
+        """
+        self.edges_by_target_handle: dict[tuple[str, str], list[dict]] = {}
+        self.edges_by_target: dict[str, list[dict]] = {}
+        self.edges_by_source: dict[str, list[dict]] = {}
+        self.index_edges(self.edges)
+
+    def index_edges(self, edges: list[dict]):
+        for edge in edges:
+            self.edges_by_target_handle.setdefault((edge["target"], edge["targetHandle"]), []).append(edge)
+            self.edges_by_target.setdefault(edge["target"], []).append(edge)
+            self.edges_by_source.setdefault(edge["source"], []).append(edge)
+
+    def get_input_edges(self, node_id: str, field: str | None = None) -> list[dict]:
+        if field is None:
+            return self.edges_by_target.get(node_id, [])
+        return self.edges_by_target_handle.get((node_id, field), [])
+
+    def get_streaming_parents(self, node_id: str) -> set[str]:
+        """
+        只通过流式连线连接到节点的父节点，节点不必等待它们运行结束。节点的任务不能流式读取
+        该字段时，连线按普通连线处理。
+        Parents connected to the node by streaming edges only, the node need not wait for
+        them to finish. Edges to a field the node's task cannot read as a stream count as
+        normal edges.
+        """
+        node = self.get_node(node_id)
+        streaming_fields = STREAMING_INPUTS.get(node.task_name, ()) if node is not None else ()
+        streaming, blocking = set(), set()
+        for edge in self.get_input_edges(node_id):
+            if is_streaming_edge(edge) and edge["targetHandle"] in streaming_fields:
+                streaming.add(edge["source"])
+            else:
+                blocking.add(edge["source"])
+        return streaming - blocking
+
+    def iter_node_field_chunks(self, node_id: str, field: str) -> Iterator[Any]:
+        """
+        逐段读取字段的输入。字段通过流式连线连接到正在运行的上游节点时，边生成边返回上游推送的
+        数据，直到上游节点运行结束；否则只返回一次完整值。完整值是字符串时，所有片段拼接后等于
+        完整值，完整值仍可以用 get_node_field_value 读取。
+        Read the input of a field chunk by chunk. When the field is connected by a streaming
+        edge to a source node running in this process, the chunks it pushes are yielded as
+        they are generated until it finishes, otherwise the whole value is yielded once. When
+        the value is a string the chunks join up to it, and it can still be read with
+        get_node_field_value.
+        """
+        edge = next((edge for edge in self.get_input_edges(node_id, field) if is_streaming_edge(edge)), None)
+        stream = node_streams.find(self.record_id, edge["source"]) if edge is not None else None
+        streamed = ""
+        if edge is not None and stream is not None and stream.live:
+            chunk_key = STREAM_CHUNK_KEYS.get(edge["sourceHandle"], edge["sourceHandle"])
+            cursor = 0
+            while True:
+                raise_if_cancelled(self.record_id)
+                items = stream.read(cursor, timeout=STREAM_POLL_INTERVAL, until_finished=True)
+                cursor += len(items)
+                for item in items:
+                    chunk = item.get(chunk_key) if isinstance(item, dict) else None
+                    if isinstance(chunk, str) and chunk:
+                        streamed += chunk
+                        yield chunk
+                if not items and stream.finished:
+                    break
+
+        # 上游已结束，补上没有通过流推送的部分（例如非流式请求或缓存命中）
+        # The source has finished, add what was not pushed through the stream (e.g. non-streaming requests or cache hits)
+        value = self.get_node_field_value(node_id, field)
+        if not streamed:
+            if value is not None and value != "":
+                yield value
+        elif isinstance(value, str) and value.startswith(streamed) and len(value) > len(streamed):
+            yield value[len(streamed) :]
+
+    def get_output_edges(self, node_id: str, handle: str | None = None) -> list[dict]:
+        edges = self.edges_by_source.get(node_id, [])
+        if handle is None:
+            return edges
+        return [edge for edge in edges if edge["sourceHandle"] == handle]
+
     def get_related_subnodes(self, node_obj: Node) -> List[str]:
         """
         找出【工作流调用】节点的显示字段有哪些，并且找出字段对应的实际工作流节点 ID
@@ -251,6 +458,7 @@ class Workflow:
             edge["target"] = self.__node_id_map.get(edge["target"] + node_obj.id, edge["target"])
             edge["id"] = f"vueflow__edge-{edge['source']}{edge['sourceHandle']}-{edge['target']}{edge['targetHandle']}"
         self.edges.extend(subworkflow.get("edges", []))
+        self.index_edges(subworkflow.get("edges", []))
         return updated_subnodes
 
     def add_subnode(
@@ -400,23 +608,17 @@ class Workflow:
         if node is None:
             return default
 
-        source_node_id = source_handle_id = ""
-        for edge in self.edges:
+        for edge in self.get_input_edges(node_id, field):
             source_node = self.get_node(edge["source"])
             if source_node is None:
                 continue
             if source_node.type in ("Empty", "ButtonTrigger"):
                 continue
-            if edge["target"] == node_id and edge["targetHandle"] == field:
-                source_node_id = edge["source"]
-                source_handle_id = edge["sourceHandle"]
-                break
+            source_handle_id = edge["sourceHandle"]
+            break
         else:
             return node.get_field(field).get("value", default)
 
-        source_node = self.get_node(source_node_id)
-        if source_node is None:
-            return default
         input_data = source_node.get_field(source_handle_id).get("value", default)
         self.update_node_field_value(node_id, field, input_data)
         return input_data
@@ -451,10 +653,7 @@ class Workflow:
         if "skipped_nodes" not in self.workflow_data:
             self.workflow_data["skipped_nodes"] = []
 
-        direct_targets = []
-        for edge in self.edges:
-            if edge["source"] == node_id and edge["sourceHandle"] == skipped_handle:
-                direct_targets.append(edge["target"])
+        direct_targets = [edge["target"] for edge in self.get_output_edges(node_id, skipped_handle)]
 
         marking_nodes = set()
         for target_id in direct_targets:
@@ -479,14 +678,13 @@ class Workflow:
         marking_nodes.add(node_id)
         self.workflow_data["skipped_nodes"].append(node_id)
 
-        for edge in self.edges:
-            if edge["source"] == node_id:
-                self._mark_node_and_descendants_skipped(
-                    edge["target"],
-                    conditional_node_id,
-                    skipped_handle,
-                    marking_nodes,
-                )
+        for edge in self.get_output_edges(node_id):
+            self._mark_node_and_descendants_skipped(
+                edge["target"],
+                conditional_node_id,
+                skipped_handle,
+                marking_nodes,
+            )
 
     def _has_active_branch_input(
         self,
@@ -494,10 +692,7 @@ class Workflow:
         conditional_node_id: str,
         skipped_handle: str,
     ) -> bool:
-        for edge in self.edges:
-            if edge["target"] != node_id:
-                continue
-
+        for edge in self.get_input_edges(node_id):
             source_id = edge["source"]
             source_handle = edge["sourceHandle"]
             if source_id == conditional_node_id and source_handle != skipped_handle:
@@ -514,8 +709,11 @@ class Workflow:
 
             workflow_record.status = "FINISHED" if status == 200 else "FAILED"
             workflow_record.data = self.workflow_data
-            workflow_record.data["error_task"] = error_task if not error_task.endswith("batch_tasks") else ""
+            workflow_record.error_task = error_task if not error_task.endswith("batch_tasks") else ""
             workflow_record.end_time = datetime.now()
+            tracer = pop_workflow_tracer(self.record_id)
+            if tracer is not None:
+                workflow_record.trace = tracer.to_chrome_trace()
 
             if workflow_record.run_from == WorkflowRunRecord.RunFromTypes.CHAT:
                 source_message_mid = workflow_record.source_message
@@ -535,7 +733,10 @@ class Workflow:
                     source_message.save()
 
             workflow_record.save()
+            node_progress.flush(self.record_id)
             cache.set(f"workflow:record:{self.record_id}", status, 60 * 60)
+            workflow_run_events.publish(self.record_id, status)
+            forget_cancelled_run(self.record_id)
             return True
         except Exception as e:
             mprint.error(f"report_workflow_status failed: {e}")
@@ -558,34 +759,12 @@ class Workflow:
     ):
         try:
             node = self.get_node(node_id)
-            if node is None:
-                return False
-
-            workflow_record = WorkflowRunRecord.get(WorkflowRunRecord.rid == self.record_id)
-            if workflow_record is None:
-                return False
-            nodes = workflow_record.data["nodes"]
-            for _node in nodes:
-                if _node["id"] != node_id:
-                    continue
-                _node.update(node.data)
-                break
-            else:
-                mprint.error(f"Node {node_id} not found in workflow {self.record_id}")
+            if node is None or not self.record_id:
                 return False
 
-            if node.status == 202:
-                cache.set(f"workflow:record:{self.record_id}:node_id:{node_id}:status", 202, 60 * 60)
-
-            finished_nodes = cache.get(f"workflow:record:finished_nodes:{self.record_id}", [])
-            assert isinstance(finished_nodes, list)
-            for finished_node in finished_nodes:
-                if finished_node.get("id") == node_id:
-                    break
-            else:
-                finished_nodes.append(_node)
-                cache.set(f"workflow:record:finished_nodes:{self.record_id}", finished_nodes, 60 * 60)
-
+            # 进度在进程内合并后批量写入缓存，不再读取运行记录
+            # Progress is coalesced in process and written to the cache in batches, the run record is not read
+            node_progress.report(self.record_id, node.data, node.status)
             return True
         except Exception as e:
             mprint.error(f"report_node_status failed: {e}")
@@ -597,11 +776,7 @@ class Workflow:
         data: dict | str,
     ):
         try:
-            key = f"workflow_record{self.record_id}_node{node_id}:data_queue"
-            data_queue = cache.get(key, [])
-            assert isinstance(data_queue, list)
-            data_queue.append(data)
-            cache.set(key, data_queue, 60 * 3)
+            node_streams.push(self.record_id, node_id, data)
             return True
         except Exception as e:
             mprint.error(f"push_node_data failed: {e}")
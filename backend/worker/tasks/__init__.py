@@ -11,7 +11,16 @@ from typing import Callable, TypeVar, Optional, overload, Any, Union
 from celery_worker import app
 from celery import chain as celery_chain, group, chord
 
-from utilities.workflow import Workflow
+from utilities.workflow import (
+    Workflow,
+    WorkflowStateSession,
+    workflow_state_store,
+    is_workflow_cancelled,
+    raise_if_cancelled,
+    parsed_workflow_scope,
+    trace_span,
+)
+from utilities.workflow.tracing import get_workflow_tracer
 from utilities.general import mprint_with_name
 
 
@@ -35,11 +44,15 @@ class TaskError(Exception):
 
 
 class TaskRetry(Exception):
-    def __init__(self, func_name: str, task: dict, retry_delay: int):
+    def __init__(self, func_name: str, task: dict, retry_delay: int, wait_for: list[str] | None = None):
         super().__init__("Task needs to be retried")
         self.func_name = func_name
         self.task = task  # 任务数据
         self.retry_delay = retry_delay  # 重试延迟时间（秒）
+        # 等待的子工作流运行，全部结束后立即重试，retry_delay 只作为兜底间隔
+        # Sub-workflow runs to wait for, the task is retried as soon as all of them end and
+        # retry_delay is only the fallback interval
+        self.wait_for = wait_for or []
 
 
 class Task:
@@ -61,7 +74,7 @@ class Task:
         celery_task_name = f"tasks.{module_name}.{callable_name}"
 
         # Wrap original function to always report node status after execution
-        def _wrapped(*args, **kwargs):
+        def _run(*args, **kwargs):
             workflow_data = kwargs.get("workflow_data")
             if workflow_data is None and args and isinstance(args[0], dict):
                 workflow_data = args[0]
@@ -69,6 +82,24 @@ class Task:
             node_id = kwargs.get("node_id")
             if node_id is None and len(args) >= 2 and isinstance(args[1], str):
                 node_id = args[1]
+            record_id = workflow_data.get("rid") if isinstance(workflow_data, dict) else None
+
+            # 增量模式下把状态引用展开为完整的工作流数据
+            # In delta mode expand the state reference into the full workflow data
+            load_start_time = time.time()
+            state_session = WorkflowStateSession(workflow_data)
+            if state_session.is_delta:
+                if tracer := get_workflow_tracer(record_id):
+                    tracer.add_span("state.load", load_start_time, time.time(), "serialization", node_id)
+                workflow_data = state_session.workflow_data
+                if "workflow_data" in kwargs:
+                    kwargs["workflow_data"] = workflow_data
+                else:
+                    args = (workflow_data, *args[1:])
+
+            # 运行已被停止时不再执行节点，链上后续的签名也不会再被派发
+            # Do not run the node once the run is stopped, the rest of the chain is never dispatched
+            raise_if_cancelled(record_id)
 
             skipped = False
             if workflow_data is not None and node_id and node_id in workflow_data.get("skipped_nodes", []):
@@ -76,18 +107,29 @@ class Task:
                 mprint(f"<Node:{node_id}> Skip task {celery_task_name} due to conditional branch.")
                 result = workflow_data
             else:
-                result = func(*args, **kwargs)
+                with trace_span(record_id, celery_task_name, "execute", node_id):
+                    result = func(*args, **kwargs)
 
             try:
                 # Try best-effort to report node finished for UI progress
                 if node_id:
                     from utilities.workflow import Workflow
-                    wf = Workflow(result if isinstance(result, dict) else (args[0] if args else {}))
-                    wf.report_node_status(node_id)
+                    with trace_span(record_id, "report_node_status", "db", node_id):
+                        wf = Workflow.from_data(result if isinstance(result, dict) else (args[0] if args else {}))
+                        wf.report_node_status(node_id)
             except Exception as _e:
                 # Do not break task result on progress reporting failures
                 mprint.error(f"report_node_status failed after task {celery_task_name}: {_e}")
-            return result
+            if not state_session.is_delta:
+                return result
+            with trace_span(record_id, "state.save", "serialization", node_id):
+                return state_session.finish(result)
+
+        def _wrapped(*args, **kwargs):
+            # 任务调用内复用已解析的 Workflow，调用结束后释放
+            # Reuse parsed Workflows within this task invocation and drop them when it ends
+            with parsed_workflow_scope():
+                return _run(*args, **kwargs)
 
         # Create the actual Celery task
         self.celery_task = app.task(name=celery_task_name)(_wrapped)
@@ -112,13 +154,13 @@ class Task:
         # Async execution with more control
         return self.celery_task.apply_async(*args, **kwargs)
 
-    def retry(self, workflow_data: dict, node_id: str, retry_delay: int | None = None):
+    def retry(self, workflow_data: dict, node_id: str, retry_delay: int | None = None, wait_for: list[str] | None = None):
         if retry_delay is not None:
             self.retry_delay = retry_delay
         task_data = workflow_data.copy()
         task_data["node_id"] = node_id
         self.retry_count += 1
-        raise TaskRetry(self.func_name, task_data, self.retry_delay)
+        raise TaskRetry(self.func_name, task_data, self.retry_delay, wait_for)
 
 
 @overload
@@ -222,7 +264,7 @@ def timer(func):
             # Also update the node's run_time field directly
             from utilities.workflow import Workflow
             try:
-                workflow = Workflow(result)
+                workflow = Workflow.from_data(result)
                 node = workflow.get_node(node_id=node_id)
                 if node:
                     node.run_time = elapsed_time
@@ -238,7 +280,15 @@ def timer(func):
 # Create on_finish as a proper Celery task
 @app.task(name="tasks.on_finish")
 def on_finish(workflow_data: dict):
+    state_session = WorkflowStateSession(workflow_data)
+    workflow_data = state_session.workflow_data
     workflow = Workflow(workflow_data)
+    if is_workflow_cancelled(workflow.record_id):
+        # 停止运行时已经记录了状态，不要覆盖为完成
+        # The stop request already recorded the status, do not overwrite it with finished
+        if state_session.is_delta:
+            workflow_state_store.discard(workflow.record_id)
+        return workflow.data
     
     # Ensure all nodes have their run_time set from node_run_time dict if available
     if isinstance(workflow_data, dict) and "node_run_time" in workflow_data:
@@ -249,14 +299,18 @@ def on_finish(workflow_data: dict):
     
     workflow.clean_workflow_data()
     workflow.report_workflow_status(200)
+    if state_session.is_delta:
+        workflow_state_store.discard(workflow.record_id)
     return workflow.data  # Return the updated data instead of just True
 
 
 def on_error(*args, **kwargs):
     mprint.error(f"workflow error: {args}, {kwargs}")
-    workflow_data = args[-1]
-    workflow = Workflow(workflow_data)
+    state_session = WorkflowStateSession(args[-1])
+    workflow = Workflow(state_session.workflow_data)
     workflow.report_workflow_status(500)
+    if state_session.is_delta:
+        workflow_state_store.discard(workflow.record_id)
     return True
 
 
@@ -17,7 +17,9 @@ from vv_llm.types.llm_parameters import ChatCompletionMessage
 from worker.tasks import task, timer
 from worker.tasks.condition_logic import resolve_conditional_branch
 from utilities.config import Settings
-from utilities.workflow import Workflow
+from utilities.workflow import Workflow, raise_if_cancelled, workflow_run_events
+from utilities.workflow.run_events import RUN_EVENT_FALLBACK_DELAY
+from utilities.workflow.cancel import register_child_runs
 from api.utils import run_workflow_common
 from models.workflow_models import WorkflowRunRecord, Workflow as WorkflowModel
 
@@ -298,6 +300,7 @@ def workflow_selector(
             run_from=WorkflowRunRecord.RunFromTypes.WORKFLOW,
             workflow_version=selected_workflow.version,
         )
+        register_child_runs(workflow.record_id, [record_rid])
         workflow.add_async_task(
             node_id,
             {
@@ -307,11 +310,19 @@ def workflow_selector(
                 "selection_reason": selection_reason,
             },
         )
-        workflow_selector.retry(workflow.data, node_id, retry_delay=1)
+        workflow_selector.retry(workflow.data, node_id, retry_delay=RUN_EVENT_FALLBACK_DELAY, wait_for=[record_rid])
 
     async_task_data = workflow.get_async_task(node_id)
     if async_task_data is None:
         raise Exception("Async workflow selector task not found")
+    raise_if_cancelled(workflow.record_id)
+    if workflow_run_events.get_status(async_task_data["record_id"]) is None:
+        workflow_selector.retry(
+            workflow.data,
+            node_id,
+            retry_delay=RUN_EVENT_FALLBACK_DELAY,
+            wait_for=[async_task_data["record_id"]],
+        )
     record = (
         WorkflowRunRecord.select()
         .join(WorkflowModel)
@@ -320,8 +331,6 @@ def workflow_selector(
     )
     if record is None:
         raise Exception("Selected workflow run record not found")
-    if record.status in ("RUNNING", "QUEUED"):
-        workflow_selector.retry(workflow.data, node_id, retry_delay=1)
     if record.status != "FINISHED":
         raise Exception("Selected workflow run failed")
 
@@ -473,6 +482,7 @@ def workflow_loop(
             workflow=workflow_model,
             run_from=WorkflowRunRecord.RunFromTypes.WORKFLOW,
         )
+        register_child_runs(workflow.record_id, [record_rid])
 
         workflow.add_async_task(
             node_id,
@@ -484,17 +494,20 @@ def workflow_loop(
                 "used_credits": 0,
             },
         )
-        workflow_loop.retry(workflow.data, node_id, retry_delay=1)
+        workflow_loop.retry(workflow.data, node_id, retry_delay=RUN_EVENT_FALLBACK_DELAY, wait_for=[record_rid])
     else:
         record_id = async_task_data["record_id"]
         output_fields = async_task_data["output_fields"]
         output_fields_cumulative = async_task_data["output_fields_cumulative"]
         loop_count = async_task_data["loop_count"]
         used_credits = async_task_data["used_credits"]
+        raise_if_cancelled(workflow.record_id)
+        # 本轮子工作流结束时立即被唤醒，运行期间不再查询运行记录
+        # Woken up as soon as this round's sub-workflow run ends, no record queries while it runs
+        if workflow_run_events.get_status(record_id) is None:
+            workflow_loop.retry(workflow.data, node_id, retry_delay=RUN_EVENT_FALLBACK_DELAY, wait_for=[record_id])
         record = WorkflowRunRecord.select().join(WorkflowModel).where(WorkflowRunRecord.rid == record_id).first()
-        if record.status in ("RUNNING", "QUEUED"):
-            workflow_loop.retry(workflow.data, node_id, retry_delay=1)
-        elif record.status != "FINISHED":
+        if record.status != "FINISHED":
             raise Exception("Run workflow failed!")
 
         nodes = record.data["nodes"]
@@ -574,6 +587,7 @@ def workflow_loop(
                 workflow=workflow_model,
                 run_from=WorkflowRunRecord.RunFromTypes.WORKFLOW,
             )
+            register_child_runs(workflow.record_id, [record_rid])
 
             workflow.update_async_task(
                 node_id,
@@ -585,6 +599,6 @@ def workflow_loop(
                     "used_credits": used_credits,
                 },
             )
-            workflow_loop.retry(workflow.data, node_id, retry_delay=1)
+            workflow_loop.retry(workflow.data, node_id, retry_delay=RUN_EVENT_FALLBACK_DELAY, wait_for=[record_rid])
 
     return workflow.data
@@ -9,7 +9,7 @@ import base64
 from worker.tasks import task, timer
 from utilities.config import Settings
 from utilities.workflow import Workflow
-from utilities.network import new_httpx_client
+from utilities.network import get_httpx_client
 from utilities.file_processing import static_file_server
 from utilities.ai_utils import get_openai_client_and_model_id
 
@@ -76,7 +76,7 @@ def stable_diffusion(
     image_folder = static_file_server.static_folder_path / "images"
     settings = Settings()
     STABILITY_KEY = settings.stability_key
-    http_client = new_httpx_client(is_async=False)
+    http_client = get_httpx_client(is_async=False)
     for index, prompt in enumerate(prompts):
         if provider == "self-host":
             stable_diffusion_base_url = settings.stable_diffusion_base_url.rstrip("/")
@@ -2,11 +2,12 @@
 # @Date:   2024-04-11 20:37:32
 import json
 import time
-import random
-from collections.abc import Generator
+import threading
+from collections.abc import Callable, Generator
 from traceback import format_exc
 from typing import Any, Iterable, Literal, Protocol, TypeGuard, cast, overload
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, wait
 
 from vv_llm.chat_clients import create_chat_client
 from vv_llm.chat_clients.base_client import BaseChatClient
@@ -30,10 +31,13 @@ from vv_llm.types import (
 )
 
 from utilities.config import Settings
-from utilities.workflow import Workflow
-from utilities.general import mprint_with_name
-from utilities.network import new_httpx_client
-from utilities.general.ratelimit import is_request_allowed, add_request_record
+from utilities.workflow import Workflow, WorkflowCancelled, cancel_checker, raise_if_cancelled
+from utilities.workflow.tracing import get_workflow_tracer
+from utilities.general import mprint_with_name, get_shared_executor
+from utilities.network import get_llm_http_client
+from utilities.general.ratelimit import estimate_tokens, get_rate_limiter
+from utilities.ai_utils.endpoint_router import EndpointRouter, backoff_delay, get_endpoint_router, retry_after_seconds
+from utilities.ai_utils.llm_response_cache import llm_response_cache, llm_response_cache_key, response_cache_enabled
 
 from .types.output import ModelOutput
 
@@ -97,6 +101,11 @@ def _is_enabled_thinking_config(value: object) -> TypeGuard[ThinkingConfigEnable
     return cast(dict[str, object], value).get("type") == "enabled"
 
 
+def _is_retryable_status(status_code: int) -> bool:
+    # 超时、限流和服务端错误可以换端点重试 / Timeouts, rate limits and server errors can be retried on another endpoint
+    return status_code in (408, 409, 429) or status_code >= 500
+
+
 def get_endpoint_id(endpoint_option: EndpointOptionDict | str) -> str:
     if isinstance(endpoint_option, str):
         return endpoint_option
@@ -118,10 +127,7 @@ def model_available(model: ModelSetting, endpoint: EndpointSetting, add_record:
         bool: True if the request is allowed, False otherwise.
     """
     product = f"{model.id}:{endpoint.id}:{endpoint.api_key}"
-    cycle = 60  # seconds
-    max_count = endpoint.rpm
-
-    return is_request_allowed(product, cycle, max_count, add_record)
+    return get_rate_limiter().try_acquire(product, rpm=endpoint.rpm, consume=add_record)
 
 
 def add_model_request_record(model: ModelSetting, endpoint: EndpointSetting) -> bool:
@@ -135,9 +141,8 @@ def add_model_request_record(model: ModelSetting, endpoint: EndpointSetting) ->
         bool: True if the record is added successfully, False otherwise.
     """
     product = f"{model.id}:{endpoint.id}:{endpoint.api_key}"
-    cycle = 60
-
-    return add_request_record(product, cycle)
+    get_rate_limiter().record(product, rpm=endpoint.rpm, requests=1)
+    return True
 
 
 class BaseLLMTask:
@@ -159,6 +164,8 @@ class BaseLLMTask:
         self.stream: bool = self.workflow.get_node_field_value(node_id, "stream", False)
         self.top_p: float | NotGiven = self.workflow.get_node_field_value(node_id, "top_p", NOT_GIVEN)
         self.system_prompt: str = self.workflow.get_node_field_value(node_id, "system_prompt", "")
+        # off / auto（temperature 为 0 时使用缓存）/ force / off, auto (cache when temperature is 0) or force
+        self.response_cache: str = self.workflow.get_node_field_value(node_id, "response_cache", "off")
 
         user_settings = Settings()
         vv_llm_settings.load(user_settings.llm_settings)
@@ -223,8 +230,13 @@ class BaseLLMTask:
             backend=self.MODEL_TYPE,
             model=self.model,
             temperature=self.temperature,
-            http_client=new_httpx_client(is_async=False),
+            http_client=get_llm_http_client(),
         )
+        # 每个端点一个对话客户端，在本任务的所有提示词之间复用
+        # One chat client per endpoint, reused across the prompts of this task
+        self._endpoint_chat_clients: dict[str, BaseChatClient] = {}
+        self._endpoint_chat_clients_lock = threading.Lock()
+        self.router: EndpointRouter = get_endpoint_router(f"{self.MODEL_TYPE.value}:{self.model}")
 
         self.model_settings = self.chat_client.backend_settings.models[self.model]
 
@@ -308,37 +320,170 @@ class BaseLLMTask:
             extra_body=self.extra_body,
         )
 
-    def endpoint_available(self, endpoint: EndpointSetting, add_record: bool = True) -> bool:
+    def endpoint_available(self, endpoint: EndpointSetting, tokens: int = 0) -> bool:
         """
-        Check if the endpoint is available under the current rate limits.
+        Check if the endpoint is available under the current rate limits and reserve one
+        request and the estimated tokens when it is.
 
         Args:
             endpoint (EndpointSetting): The endpoint to check.
-            add_record (bool, optional): Whether to add a request record. Defaults to True.
+            tokens (int, optional): Estimated tokens of the request. Defaults to 0.
 
         Returns:
             bool: True if the request is allowed, False otherwise.
         """
         product = f"{self.model_settings.id}:{endpoint.id}:{endpoint.api_key}"
-        cycle = 60  # seconds
-        max_count = endpoint.rpm
-
-        return is_request_allowed(product, cycle, max_count, add_record)
+        return get_rate_limiter().try_acquire(product, rpm=endpoint.rpm, tpm=endpoint.tpm, tokens=tokens)
 
-    def add_endpoint_request_record(self, endpoint: EndpointSetting) -> bool:
+    def record_endpoint_tokens(self, endpoint: EndpointSetting, tokens: int):
         """
-        Add a request record for the endpoint.
+        Correct the tokens reserved for the endpoint with the actual usage.
 
         Args:
-            endpoint (EndpointSetting): The endpoint to add a request record for.
-
-        Returns:
-            bool: True if the record is added successfully, False otherwise.
+            endpoint (EndpointSetting): The endpoint the request was sent to.
+            tokens (int): Actual minus reserved tokens, may be negative.
         """
         product = f"{self.model_settings.id}:{endpoint.id}:{endpoint.api_key}"
-        cycle = 60
+        get_rate_limiter().record(product, tpm=endpoint.tpm, tokens=tokens)
+
+    def _endpoint_chat_client(self, endpoint_id: str) -> BaseChatClient:
+        with self._endpoint_chat_clients_lock:
+            chat_client = self._endpoint_chat_clients.get(endpoint_id)
+            if chat_client is None:
+                chat_client = self._endpoint_chat_clients[endpoint_id] = create_chat_client(
+                    backend=self.MODEL_TYPE,
+                    model=self.model,
+                    temperature=self.temperature,
+                    endpoint_id=endpoint_id,
+                    http_client=get_llm_http_client(),
+                )
+            return chat_client
+
+    @overload
+    def _request_endpoint(
+        self, endpoint_id: str, messages: list[Any], max_tokens: int, stream: Literal[True]
+    ) -> Generator[ChatCompletionDeltaMessage, Any, None]: ...
 
-        return add_request_record(product, cycle)
+    @overload
+    def _request_endpoint(self, endpoint_id: str, messages: list[Any], max_tokens: int, stream: Literal[False]) -> ChatCompletionMessage: ...
+
+    def _request_endpoint(self, endpoint_id: str, messages: list[Any], max_tokens: int, stream: bool):
+        """
+        Send one request to an endpoint picked by the router and report the outcome to it.
+        Streaming requests count the time until the response starts as their latency.
+        """
+        endpoint = vv_llm_settings.get_endpoint(endpoint_id)
+        if endpoint.endpoint_type and endpoint.endpoint_type.startswith("openai"):
+            backend_type = BackendType.OpenAI
+        else:
+            backend_type = self.MODEL_TYPE
+        request_start = time.monotonic()
+        try:
+            chat_client = self._endpoint_chat_client(endpoint_id)
+            if stream:
+                result = self._create_stream_completion(chat_client, messages, backend_type, max_tokens)
+            else:
+                result = self._create_completion_response(chat_client, messages, backend_type, max_tokens)
+        except APIStatusError as e:
+            if _is_retryable_status(e.status_code):
+                self.router.failure(endpoint_id, retry_after_seconds(e.response.headers))
+            else:
+                # 请求本身有误，与端点健康无关 / The request itself is invalid, which says nothing about the endpoint
+                self.router.release(endpoint_id)
+            raise
+        except Exception:
+            self.router.failure(endpoint_id)
+            raise
+        self.router.success(endpoint_id, time.monotonic() - request_start)
+        return result
+
+    def _hedged_request(
+        self,
+        endpoint_ids: list[str],
+        endpoint_id: str,
+        messages: list[Any],
+        max_tokens: int,
+        estimated_tokens: int,
+        hedge_after: float,
+        is_available: Callable[[str], bool],
+    ) -> tuple[str, ChatCompletionMessage]:
+        """
+        Send the request to endpoint_id and, if it has not returned after hedge_after seconds,
+        a backup request to another endpoint. The first successful response wins; the other
+        request runs to completion in the background and only corrects its token reservation.
+        """
+        executor = get_shared_executor("llm_hedges")
+        futures: dict[Future, str] = {executor.submit(self._request_endpoint, endpoint_id, messages, max_tokens, False): endpoint_id}
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            backup_id = self.router.select(endpoint_ids, is_available, exclude=[endpoint_id])
+            if backup_id is not None:
+                mprint(f"Hedging slow request on endpoint {endpoint_id} with endpoint {backup_id}")
+                futures[executor.submit(self._request_endpoint, backup_id, messages, max_tokens, False)] = backup_id
+
+        pending = set(futures)
+        error: BaseException | None = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                exception = future.exception()
+                if exception is None:
+                    for loser in pending:
+                        loser.add_done_callback(partial(self._record_hedge_usage, futures[loser], estimated_tokens))
+                    return futures[future], future.result()
+                error = error or exception
+        assert error is not None
+        raise error
+
+    def _record_hedge_usage(self, endpoint_id: str, estimated_tokens: int, future: Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        usage = future.result().usage
+        if usage is not None:
+            endpoint = vv_llm_settings.get_endpoint(endpoint_id)
+            self.record_endpoint_tokens(endpoint, usage.prompt_tokens + usage.completion_tokens - estimated_tokens)
+
+    def _response_cache_key(self, messages: list[Any], max_tokens: int) -> str | None:
+        """
+        Return the response cache key of the request, or None when the node's cache mode does
+        not allow caching it.
+        """
+
+        def given(value: Any) -> Any:
+            return None if isinstance(value, NotGiven) else value
+
+        temperature = given(self.temperature)
+        if not response_cache_enabled(self.response_cache, temperature):
+            return None
+        return llm_response_cache_key(
+            self.MODEL_TYPE.value,
+            self.model,
+            messages,
+            temperature,
+            given(self.tools),
+            given(self.response_format),
+            tool_choice=given(self.tool_choice),
+            top_p=given(self.top_p),
+            max_tokens=max_tokens,
+            thinking=given(self.thinking),
+            reasoning_effort=given(self.reasoning_effort),
+            extra_body=self.extra_body,
+        )
+
+    def _cached_output(self, cached: dict[str, Any], index: int) -> ModelOutput:
+        mprint(f"Prompt {index + 1}/{self.prompts_count} served from the response cache")
+        if self.stream:
+            # 缓存命中时整段推送，前端按正常流式结果显示
+            # Push the whole cached output at once so the frontend shows it like a normal stream
+            self.workflow.set_node_status(self.node_id, 202)
+            self.workflow.report_node_status(self.node_id)
+            if cached.get("reasoning_content"):
+                self.workflow.push_node_data(self.node_id, {"reasoning_content": cached["reasoning_content"]})
+            if cached.get("content_output"):
+                self.workflow.push_node_data(self.node_id, {"content": cached["content_output"]})
+            self.workflow.push_node_data(self.node_id, {"end": True})
+        # 缓存命中没有消耗 token / A cache hit spends no tokens
+        return ModelOutput(**{**cached, "prompt_tokens": 0, "completion_tokens": 0, "cache_hit": True})
 
     def process_prompt(
         self,
@@ -362,62 +507,69 @@ class BaseLLMTask:
             max_tokens = 16000
             thinking_config["budget_tokens"] = max_tokens - 1000
 
+        cache_key = self._response_cache_key(messages, max_tokens)
+        if cache_key is not None:
+            cached = llm_response_cache.get(cache_key)
+            if cached is not None:
+                if tracer := get_workflow_tracer(self.workflow.record_id):
+                    tracer.add_event("llm.cache_hit", "llm", self.node_id, model=self.model, prompt_index=index)
+                return self._cached_output(cached, index)
+
+        # 先按估算值预留 token，拿到实际用量后修正
+        # Reserve tokens from an estimate first and correct them with the actual usage
+        estimated_tokens = estimate_tokens(json.dumps(messages, ensure_ascii=False))
         request_success = False
+        request_attempts = 0
+        failures = 0
+        endpoint_id = ""
+        first_chunk_time: float | None = None
         stream_response: Generator[ChatCompletionDeltaMessage, Any, None] | None = None
         response: ChatCompletionMessage | None = None
         start_time = time.time()
-        endpoints = self.model_settings.endpoints.copy()
-        random.shuffle(endpoints)
-        _chat_client: BaseChatClient = create_chat_client(
-            backend=self.MODEL_TYPE,
-            model=self.model,
-            temperature=self.temperature,
-        )
+        endpoint_ids = [get_endpoint_id(endpoint_option) for endpoint_option in self.model_settings.endpoints]
+        hedge_after = 0 if self.stream else float(Settings().get("llm_routing.hedge_after", 0) or 0)
+
+        def is_available(candidate_id: str) -> bool:
+            return self.endpoint_available(vv_llm_settings.get_endpoint(candidate_id), estimated_tokens)
+
         while time.time() - start_time < self.SINGLE_PROCESS_TIMEOUT and not request_success:
-            # 遍历所有端点，找到一个可用的
-            for endpoint_option in endpoints:
-                endpoint_id = get_endpoint_id(endpoint_option)
-                endpoint = vv_llm_settings.get_endpoint(endpoint_id)
-                if not self.endpoint_available(endpoint):
-                    continue
-                _chat_client.endpoint = endpoint
-                if endpoint.endpoint_type and endpoint.endpoint_type.startswith("openai"):
-                    backend_type = BackendType.OpenAI
+            raise_if_cancelled(self.workflow.record_id)
+            remaining = self.SINGLE_PROCESS_TIMEOUT - (time.time() - start_time)
+            # 在健康的端点中选择负载最低且未超限的一个
+            # Pick the least loaded healthy endpoint that is within its rate limits
+            selected_id = self.router.select(endpoint_ids, is_available)
+            if selected_id is None:
+                # 所有端点都在熔断或限流中，等到最早恢复的端点可用
+                # Every endpoint is open or rate limited, wait for the first one to recover
+                time.sleep(min(remaining, self.router.wait_time(endpoint_ids) or backoff_delay(failures)))
+                failures += 1
+                continue
+
+            endpoint_id = selected_id
+            request_attempts += 1
+            try:
+                if self.stream:
+                    stream_response = self._request_endpoint(endpoint_id, messages, max_tokens, stream=True)
+                elif hedge_after > 0:
+                    endpoint_id, response = self._hedged_request(endpoint_ids, endpoint_id, messages, max_tokens, estimated_tokens, hedge_after, is_available)
                 else:
-                    backend_type = self.MODEL_TYPE
-                try:
-                    if self.stream:
-                        stream_response = self._create_stream_completion(
-                            _chat_client,
-                            messages,
-                            backend_type,
-                            max_tokens,
-                        )
-                    else:
-                        response = self._create_completion_response(
-                            _chat_client,
-                            messages,
-                            backend_type,
-                            max_tokens,
-                        )
-                    request_success = True
-                    self.add_endpoint_request_record(endpoint)
-                    break
-                except APIStatusError as e:
-                    if e.status_code == 429:
-                        mprint.error(f"Rate limit exceeded with endpoint {endpoint.id}: {e}")
-                        time.sleep(5)
-                    else:
-                        raise e
-                except Exception as e:
-                    mprint.error(f"Error with endpoint {endpoint.id}: {str(e)}")
-                    mprint.error(format_exc())
-
-            if not request_success:
-                time.sleep(1)
+                    response = self._request_endpoint(endpoint_id, messages, max_tokens, stream=False)
+                request_success = True
+            except APIStatusError as e:
+                if not _is_retryable_status(e.status_code):
+                    raise e
+                mprint.error(f"Request failed with endpoint {endpoint_id} ({e.status_code}): {e}")
+                failures += 1
+                time.sleep(min(remaining, backoff_delay(failures)))
+            except Exception as e:
+                mprint.error(f"Error with endpoint {endpoint_id}: {str(e)}")
+                mprint.error(format_exc())
+                failures += 1
+                time.sleep(min(remaining, backoff_delay(failures)))
 
         if not request_success:
             raise Exception("Failed to request the model")
+        endpoint = vv_llm_settings.get_endpoint(endpoint_id)
 
         tool_calls: list[dict[str, Any]] = []
         function_call_arguments: dict[str, Any] = {}
@@ -433,7 +585,17 @@ class BaseLLMTask:
             completion_tokens = 0
 
             reported = False
+            is_cancelled = cancel_checker(self.workflow.record_id)
             for chunk in stream_response:
+                if first_chunk_time is None:
+                    first_chunk_time = time.time()
+                # 运行被停止时关闭流，释放连接，不再消耗 token
+                # Close the stream once the run is stopped to free the connection and stop spending tokens
+                if is_cancelled():
+                    stream_response.close()
+                    self.workflow.push_node_data(self.node_id, {"end": True})
+                    raise WorkflowCancelled(self.workflow.record_id)
+
                 if not reported:
                     self.workflow.report_node_status(self.node_id)
                     reported = True
@@ -480,6 +642,26 @@ class BaseLLMTask:
                 prompt_tokens = response.usage.prompt_tokens
                 completion_tokens = response.usage.completion_tokens
 
+        self.record_endpoint_tokens(endpoint, prompt_tokens + completion_tokens - estimated_tokens)
+
+        if tracer := get_workflow_tracer(self.workflow.record_id):
+            tracer.add_span(
+                "llm.request",
+                start_time,
+                time.time(),
+                "llm",
+                self.node_id,
+                {
+                    "model": self.model,
+                    "endpoint": endpoint_id,
+                    "prompt_index": index,
+                    "attempts": request_attempts,
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "time_to_first_chunk": first_chunk_time - start_time if first_chunk_time is not None else None,
+                },
+            )
+
         output = ModelOutput(
             content_output=content_output,
             reasoning_content=reasoning_content,
@@ -488,27 +670,38 @@ class BaseLLMTask:
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
         )
+        if cache_key is not None:
+            llm_response_cache.set(cache_key, output.model_dump(exclude={"cache_hit"}))
 
         return output
 
     def run(self):
         max_concurrent = self.get_max_concurrent_requests()
-        with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
-            future_to_index = {executor.submit(self.process_prompt, prompt, index): index for index, prompt in enumerate(self.prompts)}
-
-            for future in as_completed(future_to_index):
-                index = future_to_index[future]
-                try:
-                    result = future.result()
-                    self.content_outputs[index] = result.content_output or ""
-                    self.reasoning_content_outputs[index] = result.reasoning_content or ""
-                    self.function_call_outputs[index] = result.tool_calls or []
-                    self.function_call_arguments_batches[index] = result.function_call_arguments or {}
-                    self.total_prompt_tokens += result.prompt_tokens
-                    self.total_completion_tokens += result.completion_tokens
-                except Exception as exc:
-                    mprint.error(f"Generated an exception: {exc}")
-                    mprint.error(f"Prompt: {self.prompts[index]}")
+        # 使用进程共享的有上限线程池，并行节点中的多个 LLM 任务不会各自创建线程池
+        # Use the shared bounded pool so parallel LLM nodes do not each spin up their own threads
+        executor = get_shared_executor("llm_requests")
+        futures = executor.run_all(
+            [partial(self.process_prompt, prompt, index) for index, prompt in enumerate(self.prompts)],
+            max_concurrency=max_concurrent,
+            return_when=ALL_COMPLETED,
+        )
+
+        cache_hits = [False] * self.prompts_count
+        for index, future in enumerate(futures):
+            try:
+                result = future.result()
+                cache_hits[index] = result.cache_hit
+                self.content_outputs[index] = result.content_output or ""
+                self.reasoning_content_outputs[index] = result.reasoning_content or ""
+                self.function_call_outputs[index] = result.tool_calls or []
+                self.function_call_arguments_batches[index] = result.function_call_arguments or {}
+                self.total_prompt_tokens += result.prompt_tokens
+                self.total_completion_tokens += result.completion_tokens
+            except WorkflowCancelled:
+                raise
+            except Exception as exc:
+                mprint.error(f"Generated an exception: {exc}")
+                mprint.error(f"Prompt: {self.prompts[index]}")
 
         content_output = self.content_outputs[0] if isinstance(self.input_prompt, str) else self.content_outputs
         self.workflow.update_node_field_value(self.node_id, "output", content_output)
@@ -516,6 +709,11 @@ class BaseLLMTask:
         reasoning_content = self.reasoning_content_outputs[0] if isinstance(self.input_prompt, str) else self.reasoning_content_outputs
         self.workflow.update_node_field_value(self.node_id, "reasoning_content", reasoning_content)
 
+        if self.response_cache != "off":
+            # 记录每个提示词是否命中响应缓存 / Record whether each prompt hit the response cache
+            cache_hit = cache_hits[0] if isinstance(self.input_prompt, str) else cache_hits
+            self.workflow.update_node_field_value(self.node_id, "cache_hit", cache_hit)
+
         if self.use_function_call and self.model_settings.function_call_available:
             function_call_output = self.function_call_outputs[0] if isinstance(self.input_prompt, str) else self.function_call_outputs
             self.workflow.update_node_field_value(self.node_id, "function_call_output", function_call_output)
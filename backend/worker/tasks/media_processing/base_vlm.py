@@ -3,8 +3,9 @@
 import json
 import time
 import random
+import threading
 from collections.abc import Generator
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 from traceback import format_exc
 from typing import Any, Literal, Protocol, TypeGuard, cast, overload
 
@@ -32,8 +33,8 @@ from vv_llm.types import (
 from utilities.config import Settings
 from utilities.workflow import Workflow
 from utilities.text_processing import extract_url
-from utilities.general import mprint_with_name, align_elements
-from utilities.general.ratelimit import is_request_allowed, add_request_record
+from utilities.general import mprint_with_name, align_elements, get_shared_executor
+from utilities.general.ratelimit import estimate_tokens, get_rate_limiter
 from ..llms.types.output import ModelOutput
 from utilities.media_processing import ImageProcessor
 
@@ -292,37 +293,31 @@ class BaseVLMTask:
             reasoning_effort=self.reasoning_effort,
         )
 
-    def endpoint_available(self, endpoint: EndpointSetting, add_record: bool = True) -> bool:
+    def endpoint_available(self, endpoint: EndpointSetting, tokens: int = 0) -> bool:
         """
-        Check if the endpoint is available under the current rate limits.
+        Check if the endpoint is available under the current rate limits and reserve one
+        request and the estimated tokens when it is.
 
         Args:
             endpoint (EndpointSetting): The endpoint to check.
-            add_record (bool, optional): Whether to add a request record. Defaults to True.
+            tokens (int, optional): Estimated tokens of the request. Defaults to 0.
 
         Returns:
             bool: True if the request is allowed, False otherwise.
         """
         product = f"{self.model_settings.id}:{endpoint.id}:{endpoint.api_key}"
-        cycle = 60  # seconds
-        max_count = endpoint.rpm
+        return get_rate_limiter().try_acquire(product, rpm=endpoint.rpm, tpm=endpoint.tpm, tokens=tokens)
 
-        return is_request_allowed(product, cycle, max_count, add_record)
-
-    def add_endpoint_request_record(self, endpoint: EndpointSetting) -> bool:
+    def record_endpoint_tokens(self, endpoint: EndpointSetting, tokens: int):
         """
-        Add a request record for the endpoint.
+        Correct the tokens reserved for the endpoint with the actual usage.
 
         Args:
-            endpoint (EndpointSetting): The endpoint to add a request record for.
-
-        Returns:
-            bool: True if the record is added successfully, False otherwise.
+            endpoint (EndpointSetting): The endpoint the request was sent to.
+            tokens (int): Actual minus reserved tokens, may be negative.
         """
         product = f"{self.model_settings.id}:{endpoint.id}:{endpoint.api_key}"
-        cycle = 60
-
-        return add_request_record(product, cycle)
+        get_rate_limiter().record(product, tpm=endpoint.tpm, tokens=tokens)
 
     def process_prompt(
         self,
@@ -377,6 +372,9 @@ class BaseVLMTask:
         if thinking_config is not None:
             thinking_config["budget_tokens"] = max_tokens - 10
 
+        # 先按估算值预留 token，拿到实际用量后修正
+        # Reserve tokens from an estimate first and correct them with the actual usage
+        estimated_tokens = estimate_tokens(prompt)
         request_success = False
         stream_response: Generator[ChatCompletionDeltaMessage, Any, None] | None = None
         response: ChatCompletionMessage | None = None
@@ -392,10 +390,10 @@ class BaseVLMTask:
             for endpoint_option in endpoints:
                 endpoint_id = get_endpoint_id(endpoint_option)
                 endpoint = vv_llm_settings.get_endpoint(endpoint_id)
-                if not self.endpoint_available(endpoint):
-                    continue
                 if self.thinking and endpoint.endpoint_type and endpoint.endpoint_type.startswith("openai"):  # TODO: openrouter 不支持 claude-3-7-sonnet 的 thinking 参数
                     continue
+                if not self.endpoint_available(endpoint, estimated_tokens):
+                    continue
                 _chat_client.endpoint = endpoint
                 try:
                     if self.stream:
@@ -411,7 +409,6 @@ class BaseVLMTask:
                             max_tokens,
                         )
                     request_success = True
-                    self.add_endpoint_request_record(endpoint)
                     break
                 except APIStatusError as e:
                     if e.status_code == 429:
@@ -479,6 +476,8 @@ class BaseVLMTask:
                 prompt_tokens = response.usage.prompt_tokens
                 completion_tokens = response.usage.completion_tokens
 
+        self.record_endpoint_tokens(endpoint, prompt_tokens + completion_tokens - estimated_tokens)
+
         output = ModelOutput(
             content_output=content_output,
             reasoning_content=reasoning_content,
@@ -490,41 +489,49 @@ class BaseVLMTask:
 
     def run(self):
         max_concurrent = self.get_max_concurrent_requests()
-        with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
-            future_to_index = {
-                executor.submit(self.process_prompt, prompt, image, index): index for index, (prompt, image) in enumerate(zip(self.prompts, self.images, strict=False))
-            }
+        # 使用进程共享的有上限线程池，每个节点的并发数仍受端点并发限制
+        # Use the shared bounded pool, per-node concurrency is still capped by the endpoint limit
+        executor = get_shared_executor("llm_requests")
+        limiter = threading.BoundedSemaphore(max_concurrent)
+
+        def process_prompt(prompt, image, index):
+            with limiter:
+                return self.process_prompt(prompt, image, index)
+
+        future_to_index = {
+            executor.submit(process_prompt, prompt, image, index): index for index, (prompt, image) in enumerate(zip(self.prompts, self.images, strict=False))
+        }
+
+        for future in as_completed(future_to_index):
+            index = future_to_index[future]
+            retry_count = 0
+            max_retries = 3
+
+            while retry_count < max_retries:
+                try:
+                    result = future.result()
+                    self.content_outputs[index] = result.content_output or ""
+                    self.reasoning_content_outputs[index] = result.reasoning_content or ""
+                    self.total_prompt_tokens += result.prompt_tokens
+                    self.total_completion_tokens += result.completion_tokens
+                    break
+                except Exception as exc:
+                    retry_count += 1
+                    mprint.error(f"Attempt {retry_count}/{max_retries} - Generated an exception: {exc}")
+                    mprint.error(f"Prompt: {self.prompts[index]}")
+
+                    if retry_count >= max_retries:
+                        mprint.error(f"Failed after {max_retries} attempts for prompt index {index}")
+                    else:
+                        future = executor.submit(process_prompt, self.prompts[index], self.images[index], index)
+
+        content_output = self.content_outputs[0] if not self.has_list or self.multiple_input else self.content_outputs
+        self.workflow.update_node_field_value(self.node_id, "output", content_output)
+
+        reasoning_content = self.reasoning_content_outputs[0] if not self.has_list and not self.multiple_input else self.reasoning_content_outputs
+        self.workflow.update_node_field_value(self.node_id, "reasoning_content", reasoning_content)
 
-            for future in as_completed(future_to_index):
-                index = future_to_index[future]
-                retry_count = 0
-                max_retries = 3
-
-                while retry_count < max_retries:
-                    try:
-                        result = future.result()
-                        self.content_outputs[index] = result.content_output or ""
-                        self.reasoning_content_outputs[index] = result.reasoning_content or ""
-                        self.total_prompt_tokens += result.prompt_tokens
-                        self.total_completion_tokens += result.completion_tokens
-                        break
-                    except Exception as exc:
-                        retry_count += 1
-                        mprint.error(f"Attempt {retry_count}/{max_retries} - Generated an exception: {exc}")
-                        mprint.error(f"Prompt: {self.prompts[index]}")
-
-                        if retry_count >= max_retries:
-                            mprint.error(f"Failed after {max_retries} attempts for prompt index {index}")
-                        else:
-                            future = executor.submit(self.process_prompt, self.prompts[index], self.images[index], index)
-
-            content_output = self.content_outputs[0] if not self.has_list or self.multiple_input else self.content_outputs
-            self.workflow.update_node_field_value(self.node_id, "output", content_output)
-
-            reasoning_content = self.reasoning_content_outputs[0] if not self.has_list and not self.multiple_input else self.reasoning_content_outputs
-            self.workflow.update_node_field_value(self.node_id, "reasoning_content", reasoning_content)
-
-            return self.workflow.data
+        return self.workflow.data
 
     def get_max_concurrent_requests(self):
         return max(vv_llm_settings.get_endpoint(get_endpoint_id(endpoint)).concurrent_requests for endpoint in self.model_settings.endpoints)
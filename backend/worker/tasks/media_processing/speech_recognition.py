@@ -1,6 +1,6 @@
 from worker.tasks import task, timer
 from utilities.workflow import Workflow
-from utilities.network import new_httpx_client
+from utilities.network import get_httpx_client
 from utilities.media_processing import SpeechRecognitionClient
 
 
@@ -23,7 +23,7 @@ def speech_recognition(
             urls = [urls]
         elif isinstance(urls, list):
             urls = urls
-        http_client = new_httpx_client(is_async=False)
+        http_client = get_httpx_client(is_async=False)
         files_data = [http_client.get(url).content for url in urls]
     else:
         raise Exception("Invalid files_or_urls")
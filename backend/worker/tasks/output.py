@@ -3,6 +3,7 @@
 # @Date:   2023-04-26 21:10:52
 # @Last Modified by:   Bi Ying
 # @Last Modified time: 2024-06-28 19:37:00
+import re
 import uuid
 from io import StringIO
 from pathlib import Path
@@ -17,7 +18,7 @@ from docx import Document
 
 from worker.tasks import task, timer
 from utilities.config import Settings
-from utilities.workflow import Workflow
+from utilities.workflow import Workflow, is_streaming_edge
 from utilities.general import mprint_with_name
 from utilities.media_processing import TTSClient
 from utilities.file_processing import HtmlToDocx, process_pdf, static_file_server
@@ -25,6 +26,26 @@ from utilities.file_processing import HtmlToDocx, process_pdf, static_file_serve
 
 mprint = mprint_with_name(name="Output Tasks")
 
+# 句子结束位置，流式朗读时按句切分 / Sentence boundaries, streamed speech is split by sentence
+sentence_end_re = re.compile(r"(?<=[。！？!?；;\n])|(?<=\.)(?=\s)")
+
+
+def has_streaming_input(workflow: Workflow, node_id: str, field: str) -> bool:
+    return any(is_streaming_edge(edge) for edge in workflow.get_input_edges(node_id, field))
+
+
+def iter_sentences(chunks):
+    """Join streamed text chunks and yield complete sentences as soon as they end."""
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk if isinstance(chunk, str) else str(chunk)
+        *sentences, buffer = sentence_end_re.split(buffer)
+        for sentence in sentences:
+            if sentence.strip():
+                yield sentence
+    if buffer.strip():
+        yield buffer
+
 
 @task
 @timer
@@ -147,10 +168,17 @@ def audio(
 ):
     workflow = Workflow(workflow_data)
     audio_type = workflow.get_node_field_value(node_id, "audio_type", "text_to_speech")
-    content = workflow.get_node_field_value(node_id, "content")
     file_link = workflow.get_node_field_value(node_id, "file_link")
     direct_play = workflow.get_node_field_value(node_id, "direct_play")
     output_type = workflow.get_node_field_value(node_id, "output_type")
+    streaming = has_streaming_input(workflow, node_id, "content")
+    speak_stream = streaming and audio_type == "text_to_speech" and direct_play
+    if streaming and not speak_stream:
+        # 只有直接朗读能边生成边处理，其他情况先等待上游生成结束
+        # Only direct play can use the text while it is generated, otherwise wait for the source to finish
+        for _ in workflow.iter_node_field_chunks(node_id, "content"):
+            pass
+    content = workflow.get_node_field_value(node_id, "content")
 
     output_file_path = ""
 
@@ -160,7 +188,12 @@ def audio(
         tts_voice = workflow.get_node_field_value(node_id, "tts_voice")
 
         tts_client = TTSClient(provider=tts_provider, model=tts_model)
-        if direct_play:
+        if speak_stream:
+            # 每生成一句就朗读一句，不等待完整文本 / Speak each sentence once it is generated instead of waiting for the whole text
+            for sentence in iter_sentences(workflow.iter_node_field_chunks(node_id, "content")):
+                tts_client.stream(text=sentence, voice=tts_voice)
+            workflow.get_node_field_value(node_id, "content")
+        elif direct_play:
             tts_client.stream(text=content, voice=tts_voice)
         else:
             output_folder = Path(Settings().output_folder)
@@ -18,10 +18,12 @@ from bs4 import BeautifulSoup
 from api.utils import run_workflow_common
 from models.workflow_models import WorkflowRunRecord, Workflow as WorkflowModel
 from utilities.config import Settings
-from utilities.workflow import Workflow
+from utilities.workflow import Workflow, raise_if_cancelled, workflow_run_events
+from utilities.workflow.run_events import RUN_EVENT_FALLBACK_DELAY
+from utilities.workflow.cancel import register_child_runs
 from utilities.general import Retry, mprint_with_name
 from utilities.media_processing import get_screenshot
-from utilities.network import headers, new_httpx_client
+from utilities.network import headers, get_httpx_client
 from worker.tasks import task, timer
 
 
@@ -199,7 +201,7 @@ def image_search(
     count = workflow.get_node_field_value(node_id, "count")
     output_type = workflow.get_node_field_value(node_id, "output_type")
 
-    http_client = new_httpx_client(is_async=False)
+    http_client = get_httpx_client(is_async=False)
 
     results = []
     if search_engine == "bing":
@@ -299,7 +301,7 @@ def text_search(
     workflow_data: dict,
     node_id: str,
 ):
-    http_client = new_httpx_client(is_async=False)
+    http_client = get_httpx_client(is_async=False)
 
     def format_output(text: str, text_type: str, output_type: str):
         if output_type == "text":
@@ -451,7 +453,6 @@ def workflow_invoke(
     node_id: str,
 ):
     workflow = Workflow(workflow_data)
-    sleep_interval = 1
 
     if workflow.get_async_task(node_id) is None:
         workflow_id = workflow.get_node_field_value(node_id, "workflow_id")
@@ -503,29 +504,47 @@ def workflow_invoke(
                 run_from=WorkflowRunRecord.RunFromTypes.WORKFLOW,
             )
             record_ids.append(record_rid)
+        register_child_runs(workflow.record_id, record_ids)
 
         workflow.add_async_task(
             node_id,
-            {"record_ids": record_ids, "finished_record_ids": [], "output_fields_batches": output_fields_batches},
+            {"record_ids": record_ids, "output_fields_batches": output_fields_batches},
         )
-        workflow_invoke.retry(workflow.data, node_id, retry_delay=1)
+        # 子工作流全部结束后立即被唤醒重试，不再每秒查询运行记录
+        # Woken up as soon as all sub-workflow runs end instead of querying the records every second
+        workflow_invoke.retry(workflow.data, node_id, retry_delay=RUN_EVENT_FALLBACK_DELAY, wait_for=record_ids)
     else:
         async_task_data = workflow.get_async_task(node_id)
         if async_task_data is None:
             raise Exception("Async task not found!")
         record_ids = async_task_data["record_ids"]
-        finished_record_ids = async_task_data["finished_record_ids"]
         output_fields_batches = async_task_data["output_fields_batches"]
+        # 父工作流被停止时子工作流会一并停止，这里不再继续等待
+        # Sub-workflow runs are stopped along with the parent, stop waiting for them here
+        raise_if_cancelled(workflow.record_id)
+
+        pending_record_ids = []
         for record_id in record_ids:
-            if record_id in finished_record_ids:
-                continue
-            record = WorkflowRunRecord.select().join(WorkflowModel).where(WorkflowRunRecord.rid == record_id).first()
-            if record.status in ("RUNNING", "QUEUED"):
-                continue
-            elif record.status != "FINISHED":
+            status = workflow_run_events.get_status(record_id)
+            if status is None:
+                pending_record_ids.append(record_id)
+            elif status != 200:
                 raise Exception("Run workflow failed!")
+        if pending_record_ids:
+            mprint(f"Waiting for {len(pending_record_ids)} sub-workflow runs")
+            workflow_invoke.retry(
+                workflow.data,
+                node_id,
+                retry_delay=RUN_EVENT_FALLBACK_DELAY,
+                wait_for=pending_record_ids,
+            )
 
-            finished_record_ids.append(record_id)
+        # 所有子工作流都已结束，按调用顺序读取一次输出
+        # All sub-workflow runs ended, read their outputs once in call order
+        for record_id in record_ids:
+            record = WorkflowRunRecord.select().join(WorkflowModel).where(WorkflowRunRecord.rid == record_id).first()
+            if record is None or record.status != "FINISHED":
+                raise Exception("Run workflow failed!")
 
             nodes = record.data["nodes"]
             for node in nodes:
@@ -536,18 +555,6 @@ def workflow_invoke(
                         node["data"]["template"][output_field_data["output_field_key"]]["value"]
                     )
 
-        if len(finished_record_ids) != len(record_ids):
-            mprint(f"Recheck in {sleep_interval} seconds")
-            workflow.update_async_task(
-                node_id,
-                {
-                    "record_ids": record_ids,
-                    "finished_record_ids": finished_record_ids,
-                    "output_fields_batches": output_fields_batches,
-                },
-            )
-            workflow_invoke.retry(workflow.data, node_id, retry_delay=1)
-
     for output_field, output_field_data in output_fields_batches.items():
         # output_values = output_field_data["values"] if list_input else output_field_data["values"][0]
         output_values = (
@@ -1,19 +1,23 @@
 # @Author: Bi Ying
 # @Date:   2023-04-13 15:45:13
 import time
+from datetime import datetime
 
 from worker.tasks import task, timer
 from utilities.workflow import Workflow
 from utilities.general import mprint_with_name
-from utilities.ai_utils import EmbeddingClient
+from utilities.ai_utils import EmbeddingClient, RerankClient
 from utilities.text_processing import split_text, remove_markdown_image
 
 # Import directly from the task modules to avoid circular import
 from background_task.qdrant_tasks import (
     embedding_and_upload,
     q_delete_point as delete_point,
-    search_points_sync,
+    chunk_hash,
+    segment_chunk_hashes,
+    hybrid_search_batch_sync,
 )
+from background_task.keyword_index import keyword_indexes
 from models import UserObject, UserVectorDatabase
 
 
@@ -80,23 +84,53 @@ def add_data(
         text = remove_markdown_image(text)
         content_length += len(text)
 
-        user_object = UserObject.create(
-            title=content_title,
-            info=dict(),
-            data_type=data_type.upper(),
-            vector_database=vector_database,
-            source_url=source_url,
-            raw_data={
-                "text": text,
-                "title": content_title,
-                "source_url": source_url,
-            },
-            embeddings=list(),
-        )
+        raw_data = {
+            "text": text,
+            "title": content_title,
+            "source_url": source_url,
+        }
+        # 同一来源再次添加时更新原有对象，只重新嵌入有变化的分块
+        # Adding the same source again updates the existing object and only re-embeds the chunks that changed
+        user_object = None
+        if source_url:
+            user_object = UserObject.get_or_none(UserObject.vector_database == vector_database, UserObject.source_url == source_url)
+        previous_segments = []
+        previous_status = None
+        if user_object is None:
+            user_object = UserObject.create(
+                title=content_title,
+                info=dict(),
+                data_type=data_type.upper(),
+                vector_database=vector_database,
+                source_url=source_url,
+                embeddings=list(),
+                status="PR",
+            )
+        else:
+            previous_segments = user_object.load_raw_data().get("segments") or []
+            previous_status = user_object.status
+            user_object.title = content_title
+            user_object.data_type = data_type.upper()
+            user_object.status = "PR"
+            user_object.update_time = datetime.now()
         object_id = user_object.oid.hex
         object_ids.append(object_id)
 
         paragraphs = split_text(text=text, rules=process_rules, flat=False)
+        for paragraph in paragraphs:
+            paragraph["hash"] = chunk_hash(paragraph["text"])
+        # 只有上一次索引完成（VA）时才按分块增量更新，否则整体重建
+        # Only update chunk by chunk when the previous indexing completed (VA), otherwise rebuild them all
+        previous_chunk_hashes = segment_chunk_hashes(previous_segments) if previous_status == "VA" else None
+
+        user_object.info["word_counts"] = sum([paragraph["word_counts"] for paragraph in paragraphs])
+        user_object.info["paragraph_counts"] = len(paragraphs)
+        user_object.info["process_rules"] = process_rules
+        raw_data["segments"] = paragraphs
+        user_object.save_raw_data(raw_data)
+
+        # 先保存对象再派发任务，任务设置的状态不会被这里的保存覆盖
+        # Save the object before queueing the task so this save cannot overwrite the status the task sets
         embedding_and_upload.delay(
             vid=vector_database.vid.hex,
             object_id=user_object.oid.hex,
@@ -105,13 +139,11 @@ def add_data(
             embedding_model=vector_database.embedding_model,
             embedding_dimensions=vector_database.embedding_size,
             embedding_type=user_object.data_type.lower(),
+            previous_chunk_hashes=previous_chunk_hashes,
+            replace_existing=previous_status is not None and previous_chunk_hashes is None,
         )
 
-        user_object.info["word_counts"] = sum([paragraph["word_counts"] for paragraph in paragraphs])
-        user_object.info["paragraph_counts"] = len(paragraphs)
-        user_object.info["process_rules"] = process_rules
-        user_object.raw_data["segments"] = paragraphs
-        user_object.save()
+    keyword_indexes.invalidate(database_vid)
 
     all_objects_processed = False
     sleep_interval = content_length // 10000 + 1
@@ -148,6 +180,7 @@ def delete_data(
     user_object = UserObject.get(oid=object_id)
     delete_point.delay(vid=database_vid, object_id=object_id)
     user_object.delete_instance(recursive=True)
+    keyword_indexes.invalidate(database_vid)
     workflow.update_node_field_value(node_id, "delete_success", True)
     return workflow.data
 
@@ -164,6 +197,9 @@ def search_data(
     database_vid = workflow.get_node_field_value(node_id, "database")
     vector_database: UserVectorDatabase = UserVectorDatabase.get(vid=database_vid)
     count = workflow.get_node_field_value(node_id, "count")
+    search_mode = workflow.get_node_field_value(node_id, "search_mode", "vector")
+    rerank_provider = workflow.get_node_field_value(node_id, "rerank_provider", "")
+    rerank_model = workflow.get_node_field_value(node_id, "rerank_model", "")
 
     if isinstance(search_text, str):
         search_texts = [search_text]
@@ -172,17 +208,23 @@ def search_data(
     else:
         raise ValueError(f"Unsupported search_text type: {type(search_text)}")
 
-    embedding_client = EmbeddingClient(provider=vector_database.embedding_provider, model_id=vector_database.embedding_model)
+    # 所有查询一次批量嵌入，再用一次批量查询检索
+    # Embed all queries in one batch request and search them with one batch query
+    text_embeddings = None
+    if search_mode != "keyword" and search_texts:
+        embedding_client = EmbeddingClient(provider=vector_database.embedding_provider, model_id=vector_database.embedding_model)
+        text_embeddings = embedding_client.get(search_texts)
+    reranker = RerankClient(provider=rerank_provider, model_id=rerank_model) if rerank_provider else None
 
     results = []
-    for text in search_texts:
-        text_embedding = embedding_client.get(text)
-        search_results = search_points_sync(
-            vid=database_vid,
-            text_embedding=text_embedding,
-            limit=count,
-        )
-
+    for search_results in hybrid_search_batch_sync(
+        vid=database_vid,
+        queries=search_texts,
+        text_embeddings=text_embeddings,
+        limit=count,
+        search_mode=search_mode,
+        reranker=reranker,
+    ):
         if output_type == "text":
             results.append("\n".join([result["text"] for result in search_results]))
         elif output_type == "list":
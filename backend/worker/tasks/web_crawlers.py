@@ -13,7 +13,7 @@ from bilili.api.acg_video import get_acg_video_subtitle
 from utilities.config import Settings
 from utilities.workflow import Workflow
 from utilities.general import mprint_with_name
-from utilities.network import crawl_text_from_url, new_httpx_client
+from utilities.network import crawl_text_from_url, get_httpx_client
 from worker.tasks import task, timer
 
 
@@ -42,7 +42,7 @@ def get_aid_cid(bvid, part_number):
         aid = bvid
 
     url = f"https://api.bilibili.com/x/player/pagelist?bvid={bvid}&jsonp=jsonp"
-    http_client = new_httpx_client(is_async=False)
+    http_client = get_httpx_client(is_async=False)
     resp = http_client.get(url, headers=headers)
     info = resp.json()
     cid = info["data"][part_number - 1]["cid"]
@@ -107,7 +107,7 @@ def bilibili_crawler(
     else:
         urls = [url_or_bvid]
 
-    http_client = new_httpx_client(is_async=False)
+    http_client = get_httpx_client(is_async=False)
 
     subtitles = []
     titles = []
@@ -206,7 +206,7 @@ def youtube_crawler(
             url = "https://www.youtube.com/watch?v=" + url
         formatted_urls.append(url)
 
-    http_client = new_httpx_client(is_async=False)
+    http_client = get_httpx_client(is_async=False)
 
     text_results = []
     title_results = []
@@ -65,6 +65,53 @@ export function createTemplateData() {
         "list": false,
         "field_type": "number"
       },
+      "search_mode": {
+        "required": true,
+        "placeholder": "",
+        "show": false,
+        "value": "vector",
+        "options": [
+          {
+            "value": "hybrid",
+            "label": "Hybrid"
+          },
+          {
+            "value": "vector",
+            "label": "Vector"
+          },
+          {
+            "value": "keyword",
+            "label": "Keyword"
+          },
+        ],
+        "name": "search_mode",
+        "display_name": "search_mode",
+        "type": "str",
+        "list": false,
+        "field_type": "select"
+      },
+      "rerank_provider": {
+        "required": false,
+        "placeholder": "",
+        "show": false,
+        "value": "",
+        "name": "rerank_provider",
+        "display_name": "rerank_provider",
+        "type": "str",
+        "list": false,
+        "field_type": "input"
+      },
+      "rerank_model": {
+        "required": false,
+        "placeholder": "",
+        "show": false,
+        "value": "",
+        "name": "rerank_model",
+        "display_name": "rerank_model",
+        "type": "str",
+        "list": false,
+        "field_type": "input"
+      },
       "output_type": {
         "required": true,
         "placeholder": "",